@@ -13,9 +13,9 @@ from dotenv import load_dotenv
 from .prompts import SYSTEM_PROMPT
 from .providers import get_llm_model
 from .tools import (
-    vector_search_tool,
-    graph_search_tool,
-    hybrid_search_tool,
+    vector_search_scheduler,
+    graph_search_scheduler,
+    hybrid_search_scheduler,
     get_document_tool,
     list_documents_tool,
     get_entity_relationships_tool,
@@ -58,6 +58,10 @@ rag_agent = Agent(
     system_prompt=SYSTEM_PROMPT
 )
 
+# Tool-less agent for one-shot completions (e.g. document summaries) that
+# need neither retrieval tools nor conversation context
+summary_agent = Agent(get_llm_model())
+
 
 # Register tools with proper docstrings (no description parameter)
 @rag_agent.tool
@@ -85,7 +89,7 @@ async def vector_search(
         limit=limit
     )
     
-    results = await vector_search_tool(input_data)
+    results = await vector_search_scheduler.submit(input_data)
     
     # Convert results to dict for agent
     return [
@@ -120,7 +124,7 @@ async def graph_search(
     """
     input_data = GraphSearchInput(query=query)
     
-    results = await graph_search_tool(input_data)
+    results = await graph_search_scheduler.submit(input_data)
     
     # Convert results to dict for agent
     return [
@@ -163,7 +167,7 @@ async def hybrid_search(
         text_weight=text_weight
     )
     
-    results = await hybrid_search_tool(input_data)
+    results = await hybrid_search_scheduler.submit(input_data)
     
     # Convert results to dict for agent
     return [
@@ -4,36 +4,65 @@ FastAPI endpoints for the agentic RAG system.
 
 import os
 import asyncio
-import json
+import base64
+import codecs
+import hashlib
+import hmac
 import logging
 import mimetypes
-from contextlib import asynccontextmanager
-from typing import Dict, Any, List, Optional
-from datetime import datetime, date
+import re
+import shutil
+import stat
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, nullcontext
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
 from pathlib import Path
 import uuid
 
-from fastapi import FastAPI, HTTPException, Request, Depends, UploadFile, File, Form, Query
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse, FileResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
+from starlette.types import Receive, Scope, Send
+import orjson
 import uvicorn
+from asyncpg import Record
+
+try:
+    # C implementation of difflib's matcher; same opcodes, much faster
+    from cdifflib import CSequenceMatcher as DiffMatcher
+except ImportError:
+    from difflib import SequenceMatcher as DiffMatcher
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
-from .agent import rag_agent, AgentDependencies
+from .agent import rag_agent, summary_agent, AgentDependencies
+from .batching import BatchScheduler
 from .db_utils import (
     initialize_database,
     close_database,
     create_session,
+    touch_session,
     get_session,
     get_document as db_get_document,
     add_message,
-    get_session_messages,
+    add_messages_bulk,
+    start_db_schedulers,
+    stop_db_schedulers,
+    get_many_session_messages,
+    replace_chunks,
+    chunk_content_hash,
+    get_chunk_embeddings,
     test_connection,
     get_account_by_username,
     verify_password,
     touch_last_login,
     create_default_accounts_if_missing,
+    deferred_vector_index,
     db_pool,
 )
 from .graph_utils import initialize_graph, close_graph, test_graph_connection
@@ -49,9 +78,11 @@ from .models import (
     IngestionConfig
 )
 from .tools import (
-    vector_search_tool,
-    graph_search_tool,
-    hybrid_search_tool,
+    vector_search_scheduler,
+    graph_search_scheduler,
+    hybrid_search_scheduler,
+    start_search_schedulers,
+    stop_search_schedulers,
     list_documents_tool,
     VectorSearchInput,
     GraphSearchInput,
@@ -59,7 +90,11 @@ from .tools import (
     DocumentListInput
 )
 
-from ingestion.ingest import ingest_file
+from ingestion.ingest import (
+    ingest_files,
+    DocumentIngestionPipeline,
+    cancel_graph_builds,
+)
 from ingestion.chunker import create_chunker, ChunkingConfig
 from ingestion.embedder import create_embedder
 
@@ -73,6 +108,24 @@ APP_ENV = os.getenv("APP_ENV", "development")
 APP_HOST = os.getenv("APP_HOST", "0.0.0.0")
 APP_PORT = int(os.getenv("APP_PORT", 8000))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+DOCUMENTS_ROOT = str(Path(os.getenv("DOCUMENTS_FOLDER", "documents")).expanduser().resolve())
+
+# Media types for the document formats accepted by ingestion
+MIME_MAP = {
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".txt": "text/plain",
+    ".md": "text/markdown",
+    ".markdown": "text/markdown",
+    ".csv": "text/csv",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff",
+    ".bmp": "image/bmp",
+    ".gif": "image/gif",
+}
 
 # Configure logging
 logging.basicConfig(
@@ -84,6 +137,83 @@ logging.basicConfig(
 if APP_ENV == "development":
     logger.setLevel(logging.DEBUG)
 
+# Worker processes for bcrypt checks, created on first bcrypt login
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+_password_executor: Optional[ProcessPoolExecutor] = None
+
+# Successful bcrypt checks are remembered briefly so repeat logins skip the
+# hash; keys are (stored hash, keyed password digest), so a password change
+# misses and the cache never holds anything reusable outside this process
+PASSWORD_VERIFY_CACHE_SIZE = int(os.getenv("PASSWORD_VERIFY_CACHE_SIZE", "1024"))
+PASSWORD_VERIFY_CACHE_TTL = int(os.getenv("PASSWORD_VERIFY_CACHE_TTL", "300"))
+_verified_passwords: TTLCache = TTLCache(maxsize=PASSWORD_VERIFY_CACHE_SIZE, ttl=PASSWORD_VERIFY_CACHE_TTL)
+_PASSWORD_CACHE_KEY = os.urandom(32)
+
+# Version diffs of texts larger than this run in a process pool instead of a
+# thread, so they neither hold the GIL nor block request handling
+DIFF_PROCESS_MIN_BYTES = int(os.getenv("DIFF_PROCESS_MIN_BYTES", str(1 << 20)))
+DIFF_WORKERS = int(os.getenv("DIFF_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+_diff_executor: Optional[ProcessPoolExecutor] = None
+
+# Document summarization limits and fixed prompt parts
+SUMMARIZE_MAX_CHARS = 12000
+SUMMARIZE_MAX_TOKENS = int(os.getenv("SUMMARIZE_MAX_TOKENS", "600"))
+SUMMARIZE_SEM = asyncio.Semaphore(int(os.getenv("SUMMARIZE_CONCURRENCY", "8")))
+SUMMARIZE_PROMPT_HEADER = (
+    "Bạn là trợ lý tóm tắt tài liệu. "
+    "Hãy tóm tắt ngắn gọn nội dung tài liệu sau bằng tiếng Việt, "
+    "trình bày dưới dạng các gạch đầu dòng rõ ràng (5–10 gạch đầu dòng), "
+    "nêu bật các ý chính, thuật ngữ quan trọng, và kết luận (nếu có).\n\n"
+)
+SUMMARIZE_PROMPT_FOOTER = (
+    "Yêu cầu định dạng đầu ra:\n"
+    "- Chỉ trả về danh sách gạch đầu dòng bằng tiếng Việt\n"
+    "- Mỗi dòng bắt đầu bằng '- ' (dấu gạch ngang và khoảng trắng)\n"
+    "- Không thêm tiêu đề, phần mở đầu hay phần kết thúc\n"
+    "- Ngắn gọn, chính xác, dễ đọc"
+)
+# One summary line: optional list marker ('-', '*', '•') followed by the text
+BULLET_RE = re.compile(r"^[^\S\n]*(?:[-*•][^\S\n]+)?(.*?)[^\S\n]*$", re.M)
+
+# Pre-encoded SSE framing for streamed text deltas; only the delta needs escaping
+SSE_TEXT_PREFIX = b'data: {"type":"text","content":'
+SSE_TEXT_SUFFIX = b'}\n\n'
+
+# Per-session cache of the latest conversation messages
+CONTEXT_CACHE_MESSAGES = 20
+PROMPT_CONTEXT_MESSAGES = 6  # Last 3 turns
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "10000"))
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "1800"))
+_session_ctx_cache: TTLCache = TTLCache(maxsize=CONTEXT_CACHE_SIZE, ttl=CONTEXT_CACHE_TTL)
+
+
+class SessionHistory(deque):
+    """Bounded message history that memoizes its rendered prompt context."""
+    
+    def __init__(self, messages=(), maxlen: int = CONTEXT_CACHE_MESSAGES):
+        super().__init__(messages, maxlen)
+        self._rendered: Dict[int, str] = {}
+    
+    def append(self, message: Dict[str, str]):
+        self._rendered.clear()
+        super().append(message)
+    
+    def extend(self, messages):
+        self._rendered.clear()
+        super().extend(messages)
+    
+    def render(self, max_messages: int = PROMPT_CONTEXT_MESSAGES) -> str:
+        """Render the latest messages as ``role: content`` lines, memoized until the next append."""
+        rendered = self._rendered.get(max_messages)
+        if rendered is None:
+            start = max(len(self) - max_messages, 0)
+            rendered = "\n".join(
+                f"{self[i]['role']}: {self[i]['content']}" for i in range(start, len(self))
+            )
+            self._rendered[max_messages] = rendered
+        return rendered
+
+
 # Metadata input models for admin CRUD
 from pydantic import BaseModel
 from typing import Optional
@@ -124,17 +254,18 @@ async def lifespan(app: FastAPI):
     logger.info("Starting up agentic RAG API...")
     
     try:
-        # Initialize database connections
-        await initialize_database()
-        logger.info("Database initialized")
-        
-        # Initialize graph database
-        await initialize_graph()
-        logger.info("Graph database initialized")
+        # Initialize database and graph connections concurrently
+        await asyncio.gather(initialize_database(), initialize_graph())
+        logger.info("Database and graph database initialized")
         
         # Test connections
-        db_ok = await test_connection()
-        graph_ok = await test_graph_connection()
+        db_ok, graph_ok = await asyncio.gather(
+            test_connection(),
+            test_graph_connection(),
+            return_exceptions=True
+        )
+        db_ok = db_ok is True
+        graph_ok = graph_ok is True
         
         if not db_ok:
             logger.error("Database connection failed")
@@ -147,6 +278,12 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.warning(f"Account seeding skipped: {e}")
 
+        # Coalesce concurrent searches, document and history loads, and
+        # message writes into batched calls
+        start_search_schedulers()
+        start_db_schedulers()
+        history_scheduler.start()
+
         logger.info("Agentic RAG API startup complete")
         
     except Exception as e:
@@ -159,6 +296,14 @@ async def lifespan(app: FastAPI):
     logger.info("Shutting down agentic RAG API...")
     
     try:
+        await stop_search_schedulers()
+        await history_scheduler.stop()
+        await stop_db_schedulers()
+        await cancel_graph_builds()
+        if _password_executor is not None:
+            _password_executor.shutdown(wait=False, cancel_futures=True)
+        if _diff_executor is not None:
+            _diff_executor.shutdown(wait=False, cancel_futures=True)
         await close_database()
         await close_graph()
         logger.info("Connections closed")
@@ -166,12 +311,132 @@ async def lifespan(app: FastAPI):
         logger.error(f"Shutdown error: {e}")
 
 
+async def check_password(password: str, stored_hash: str) -> bool:
+    """
+    Verify a password without blocking the event loop.
+
+    Args:
+        password: Plaintext password from the login request
+        stored_hash: Stored password hash
+
+    Returns:
+        True if the password matches
+    """
+    global _password_executor
+    # Reason: Only bcrypt is slow enough to be worth a process hop; sha256 and
+    # dev plaintext comparisons are cheaper than pickling the arguments
+    if not stored_hash or not stored_hash.startswith("$2"):
+        return verify_password(password, stored_hash)
+
+    cache_key = (stored_hash, hmac.digest(_PASSWORD_CACHE_KEY, password.encode("utf-8"), hashlib.sha256))
+    if cache_key in _verified_passwords:
+        return True
+
+    if _password_executor is None:
+        _password_executor = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS)
+    loop = asyncio.get_running_loop()
+    ok = await loop.run_in_executor(_password_executor, verify_password, password, stored_hash)
+    if ok:
+        _verified_passwords[cache_key] = True
+    return ok
+
+
+# Keyset pagination: list endpoints keep returning a JSON array and pass the
+# cursor for the next page (the last row's sort key and id) in this header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+# Sorts after every real id, so a cursor with it includes all rows of its sort key
+_LAST_UUID = uuid.UUID(int=(1 << 128) - 1)
+
+
+def _json_default(obj: Any) -> Any:
+    """orjson fallback for asyncpg values it does not serialize natively."""
+    if isinstance(obj, Record):
+        return dict(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _records_response(rows: List[Record], headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Serialize asyncpg records straight into a JSON array response.
+
+    Skips the intermediate list of dicts and FastAPI's jsonable_encoder pass.
+    """
+    return Response(
+        orjson.dumps(rows, default=_json_default),
+        media_type="application/json",
+        headers=headers
+    )
+
+
+def _encode_cursor(sort_key: Any, row_id: Any) -> str:
+    """
+    Encode a keyset cursor from the last row's sort key and id.
+
+    The cursor carries the sort key itself, so the next page does not depend
+    on the row still existing. It is base64url encoded to stay header-safe
+    for non-ASCII keys such as usernames.
+    """
+    if isinstance(sort_key, datetime):
+        sort_key = sort_key.isoformat()
+    return base64.urlsafe_b64encode(f"{sort_key}|{row_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: Optional[str], parse_key=str) -> Optional[Tuple[Any, uuid.UUID]]:
+    """
+    Decode a cursor made by _encode_cursor into its sort key and row id.
+
+    Args:
+        cursor: Cursor from an X-Next-Cursor header, or None for the first page
+        parse_key: Converts the sort key text back to its column type
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    if cursor is None:
+        return None
+    try:
+        key, sep, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rpartition("|")
+        if not sep:
+            raise ValueError("missing separator")
+        return parse_key(key), uuid.UUID(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+
+
+def _page(
+    rows: List[Record],
+    limit: Optional[int],
+    sort_key: str,
+    key: str = "id",
+    head: Optional[List[Any]] = None
+) -> Response:
+    """
+    Trim a page fetched with one extra row and set the next-page cursor header.
+
+    Args:
+        rows: Rows fetched with ``LIMIT limit + 1``
+        limit: Requested page size, or None when unpaginated
+        sort_key: Column the keyset is ordered by, before the id
+        key: Column holding the row id
+        head: Extra items to place before the rows
+    """
+    headers = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        headers = {NEXT_CURSOR_HEADER: _encode_cursor(rows[-1][sort_key], rows[-1][key])}
+    return _records_response(head + rows if head else rows, headers)
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Agentic RAG with Knowledge Graph",
     description="AI agent combining vector search and knowledge graph for tech company analysis",
     version="0.1.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add middleware with flexible CORS
@@ -180,10 +445,25 @@ app.add_middleware(
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER]
 )
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    """GZip middleware that passes streaming endpoints straight through."""
+
+    STREAMING_PATHS = frozenset({"/chat/stream"})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Reason: SSE deltas are tiny and must flush immediately; skipping the
+        # gzip responder avoids wrapping every send of a long-lived stream
+        if scope["type"] == "http" and scope["path"] in self.STREAMING_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=1000)
 
 
 # Auth models
@@ -211,9 +491,15 @@ class LoginResponse(BaseModel):
 async def get_or_create_session(request: ChatRequest) -> str:
     """Get existing session or create new one."""
     if request.session_id:
-        session = await get_session(request.session_id)
-        if session:
-            return request.session_id
+        try:
+            session_id = str(uuid.UUID(request.session_id))
+        except ValueError:
+            session_id = None
+        
+        # Reason: Cached sessions need no query; otherwise one UPDATE checks
+        # the session and marks it used. Unknown ids get a new server-made id.
+        if session_id and await touch_session(session_id):
+            return session_id
     
     # Create new session
     return await create_session(
@@ -222,6 +508,30 @@ async def get_or_create_session(request: ChatRequest) -> str:
     )
 
 
+async def _load_session_histories(session_ids: List[str]) -> List[List[Dict[str, str]]]:
+    """Load recent messages for a batch of sessions with a single query."""
+    return await get_many_session_messages(session_ids, limit_each=CONTEXT_CACHE_MESSAGES)
+
+
+# Coalesces concurrent cache misses into one LATERAL query
+history_scheduler = BatchScheduler(
+    _load_session_histories,
+    max_batch=int(os.getenv("HISTORY_MAX_BATCH", "64")),
+    max_wait_ms=float(os.getenv("HISTORY_MAX_WAIT_MS", "2")),
+    name="history"
+)
+
+
+async def _get_session_history(session_id: str) -> SessionHistory:
+    """Return the cached history of a session, loading it from the database on a miss."""
+    history = _session_ctx_cache.get(session_id)
+    if history is None:
+        messages = await history_scheduler.submit(session_id)
+        # Reason: A concurrent turn may have populated the entry while we were loading
+        history = _session_ctx_cache.setdefault(session_id, SessionHistory(messages))
+    return history
+
+
 async def get_conversation_context(
     session_id: str,
     max_messages: int = 10
@@ -229,6 +539,9 @@ async def get_conversation_context(
     """
     Get recent conversation context.
     
+    Served from the in-process session cache; only a cache miss reads
+    the latest messages from the database.
+    
     Args:
         session_id: Session ID
         max_messages: Maximum number of messages to retrieve
@@ -236,15 +549,58 @@ async def get_conversation_context(
     Returns:
         List of messages
     """
-    messages = await get_session_messages(session_id, limit=max_messages)
+    history = await _get_session_history(session_id)
+    return list(history)[-max_messages:]
+
+
+async def build_prompt(session_id: str, message: str) -> str:
+    """
+    Build the agent prompt, prefixing the recent conversation if there is one.
     
-    return [
-        {
-            "role": msg["role"],
-            "content": msg["content"]
-        }
-        for msg in messages
-    ]
+    Args:
+        session_id: Session ID
+        message: Current user message
+    
+    Returns:
+        Prompt for the agent
+    """
+    history = await _get_session_history(session_id)
+    if not history:
+        return message
+    return f"Previous conversation:\n{history.render()}\n\nCurrent question: {message}"
+
+
+async def record_message(
+    session_id: str,
+    role: str,
+    content: str,
+    metadata: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Save a message and append it to the cached session context.
+    
+    Args:
+        session_id: Session ID
+        role: Message role
+        content: Message content
+        metadata: Optional message metadata
+    
+    Returns:
+        Message ID
+    """
+    message_id = await add_message(
+        session_id=session_id,
+        role=role,
+        content=content,
+        metadata=metadata or {}
+    )
+    
+    # Only extend cached histories; a missing entry is loaded on the next read
+    history = _session_ctx_cache.get(session_id)
+    if history is not None:
+        history.append({"role": role, "content": content})
+    
+    return message_id
 
 
 def extract_tool_calls(result) -> List[ToolCall]:
@@ -258,70 +614,82 @@ def extract_tool_calls(result) -> List[ToolCall]:
         List of ToolCall objects
     """
     tools_used = []
+    debug = logger.isEnabledFor(logging.DEBUG)
     
     try:
-        # Get all messages from the result
-        messages = result.all_messages()
-        
-        for message in messages:
-            if hasattr(message, 'parts'):
-                for part in message.parts:
-                    # Check if this is a tool call part
-                    if part.__class__.__name__ == 'ToolCallPart':
+        for message in result.all_messages():
+            for part in getattr(message, 'parts', ()):
+                if type(part).__name__ != 'ToolCallPart':
+                    continue
+                
+                try:
+                    # Args arrive either as a JSON string or an already-parsed dict
+                    raw_args = getattr(part, 'args', None)
+                    if isinstance(raw_args, (str, bytes)):
                         try:
-                            # Debug logging to understand structure
-                            logger.debug(f"ToolCallPart attributes: {dir(part)}")
-                            logger.debug(f"ToolCallPart content: tool_name={getattr(part, 'tool_name', None)}")
-                            
-                            # Extract tool information safely
-                            tool_name = str(part.tool_name) if hasattr(part, 'tool_name') else 'unknown'
-                            
-                            # Get args - the args field is a JSON string in Pydantic AI
+                            tool_args = orjson.loads(raw_args) if raw_args else {}
+                        except orjson.JSONDecodeError as e:
+                            if debug:
+                                logger.debug(f"Failed to parse args JSON: {e}")
                             tool_args = {}
-                            if hasattr(part, 'args') and part.args is not None:
-                                if isinstance(part.args, str):
-                                    # Args is a JSON string, parse it
-                                    try:
-                                        import json
-                                        tool_args = json.loads(part.args)
-                                        logger.debug(f"Parsed args from JSON string: {tool_args}")
-                                    except json.JSONDecodeError as e:
-                                        logger.debug(f"Failed to parse args JSON: {e}")
-                                        tool_args = {}
-                                elif isinstance(part.args, dict):
-                                    tool_args = part.args
-                                    logger.debug(f"Args already a dict: {tool_args}")
-                            
-                            # Alternative: use args_as_dict method if available
-                            if hasattr(part, 'args_as_dict'):
-                                try:
-                                    tool_args = part.args_as_dict()
-                                    logger.debug(f"Got args from args_as_dict(): {tool_args}")
-                                except:
-                                    pass
-                            
-                            # Get tool call ID
-                            tool_call_id = None
-                            if hasattr(part, 'tool_call_id'):
-                                tool_call_id = str(part.tool_call_id) if part.tool_call_id else None
-                            
-                            # Create ToolCall with explicit field mapping
-                            tool_call_data = {
-                                "tool_name": tool_name,
-                                "args": tool_args,
-                                "tool_call_id": tool_call_id
-                            }
-                            logger.debug(f"Creating ToolCall with data: {tool_call_data}")
-                            tools_used.append(ToolCall(**tool_call_data))
-                        except Exception as e:
-                            logger.debug(f"Failed to parse tool call part: {e}")
-                            continue
+                    else:
+                        tool_args = raw_args or {}
+                    
+                    tool_call_id = getattr(part, 'tool_call_id', None)
+                    tool_call = ToolCall(
+                        tool_name=str(getattr(part, 'tool_name', None) or 'unknown'),
+                        args=tool_args,
+                        tool_call_id=str(tool_call_id) if tool_call_id else None
+                    )
+                    if debug:
+                        logger.debug(f"Extracted tool call: {tool_call}")
+                    tools_used.append(tool_call)
+                except Exception as e:
+                    if debug:
+                        logger.debug(f"Failed to parse tool call part: {e}")
+                    continue
     except Exception as e:
         logger.warning(f"Failed to extract tool calls: {e}")
     
     return tools_used
 
 
+def sse(obj: Any) -> bytes:
+    """
+    Encode an object as a Server-Sent Events data frame.
+    
+    Args:
+        obj: JSON-serializable event payload
+    
+    Returns:
+        Encoded SSE frame
+    """
+    return b"data: " + orjson.dumps(obj) + b"\n\n"
+
+
+async def record_messages(
+    session_id: str,
+    messages: List[Dict[str, Any]]
+) -> List[str]:
+    """
+    Save several messages in one round-trip and append them to the cached context.
+    
+    Args:
+        session_id: Session ID
+        messages: Messages with role, content and optional metadata, in order
+    
+    Returns:
+        Message IDs
+    """
+    message_ids = await add_messages_bulk(session_id, messages)
+    
+    history = _session_ctx_cache.get(session_id)
+    if history is not None:
+        history.extend({"role": m["role"], "content": m["content"]} for m in messages)
+    
+    return message_ids
+
+
 async def save_conversation_turn(
     session_id: str,
     user_message: str,
@@ -337,20 +705,13 @@ async def save_conversation_turn(
         assistant_message: Assistant's response
         metadata: Optional metadata
     """
-    # Save user message
-    await add_message(
-        session_id=session_id,
-        role="user",
-        content=user_message,
-        metadata=metadata or {}
-    )
-    
-    # Save assistant message
-    await add_message(
-        session_id=session_id,
-        role="assistant",
-        content=assistant_message,
-        metadata=metadata or {}
+    # Save user and assistant messages with a single INSERT
+    await record_messages(
+        session_id,
+        [
+            {"role": "user", "content": user_message, "metadata": metadata or {}},
+            {"role": "assistant", "content": assistant_message, "metadata": metadata or {}}
+        ]
     )
 
 
@@ -379,17 +740,8 @@ async def execute_agent(
             user_id=user_id
         )
         
-        # Get conversation context
-        context = await get_conversation_context(session_id)
-        
-        # Build prompt with context
-        full_prompt = message
-        if context:
-            context_str = "\n".join([
-                f"{msg['role']}: {msg['content']}"
-                for msg in context[-6:]  # Last 3 turns
-            ])
-            full_prompt = f"Previous conversation:\n{context_str}\n\nCurrent question: {message}"
+        # Build prompt with conversation context
+        full_prompt = await build_prompt(session_id, message)
         
         # Run the agent
         result = await rag_agent.run(full_prompt, deps=deps)
@@ -431,9 +783,14 @@ async def execute_agent(
 async def health_check():
     """Health check endpoint."""
     try:
-        # Test database connections
-        db_status = await test_connection()
-        graph_status = await test_graph_connection()
+        # Test database connections concurrently
+        db_status, graph_status = await asyncio.gather(
+            test_connection(),
+            test_graph_connection(),
+            return_exceptions=True
+        )
+        db_status = db_status is True
+        graph_status = graph_status is True
         
         # Determine overall status
         if db_status and graph_status:
@@ -475,7 +832,7 @@ async def chat(request: ChatRequest):
             message=response,
             session_id=session_id,
             tools_used=tools_used,
-            metadata={"search_type": str(request.search_type)}
+            metadata={"search_type": request.search_type}
         )
         
     except Exception as e:
@@ -489,7 +846,7 @@ async def auth_login(payload: LoginRequest):
         account = await get_account_by_username(payload.username)
         if not account or not account.get("is_active", True):
             raise HTTPException(status_code=401, detail="Invalid credentials")
-        if not verify_password(payload.password, account.get("password_hash", "")):
+        if not await check_password(payload.password, account.get("password_hash", "")):
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
         await touch_last_login(account["id"])
@@ -520,8 +877,9 @@ async def chat_stream(request: ChatRequest):
         
         async def generate_stream():
             """Generate streaming response using agent.iter() pattern."""
+            user_saved = False
             try:
-                yield f"data: {json.dumps({'type': 'session', 'session_id': session_id})}\n\n"
+                yield sse({'type': 'session', 'session_id': session_id})
                 
                 # Create dependencies
                 deps = AgentDependencies(
@@ -529,27 +887,10 @@ async def chat_stream(request: ChatRequest):
                     user_id=request.user_id
                 )
                 
-                # Get conversation context
-                context = await get_conversation_context(session_id)
+                # Build input with conversation context
+                full_prompt = await build_prompt(session_id, request.message)
                 
-                # Build input with context
-                full_prompt = request.message
-                if context:
-                    context_str = "\n".join([
-                        f"{msg['role']}: {msg['content']}"
-                        for msg in context[-6:]
-                    ])
-                    full_prompt = f"Previous conversation:\n{context_str}\n\nCurrent question: {request.message}"
-                
-                # Save user message immediately
-                await add_message(
-                    session_id=session_id,
-                    role="user",
-                    content=request.message,
-                    metadata={"user_id": request.user_id}
-                )
-                
-                full_response = ""
+                response_parts: List[str] = []
                 
                 # Stream using agent.iter() pattern
                 async with rag_agent.iter(full_prompt, deps=deps) as run:
@@ -562,13 +903,15 @@ async def chat_stream(request: ChatRequest):
                                     
                                     if isinstance(event, PartStartEvent) and event.part.part_kind == 'text':
                                         delta_content = event.part.content
-                                        yield f"data: {json.dumps({'type': 'text', 'content': delta_content})}\n\n"
-                                        full_response += delta_content
+                                        yield SSE_TEXT_PREFIX + orjson.dumps(delta_content) + SSE_TEXT_SUFFIX
+                                        response_parts.append(delta_content)
                                         
                                     elif isinstance(event, PartDeltaEvent) and isinstance(event.delta, TextPartDelta):
                                         delta_content = event.delta.content_delta
-                                        yield f"data: {json.dumps({'type': 'text', 'content': delta_content})}\n\n"
-                                        full_response += delta_content
+                                        yield SSE_TEXT_PREFIX + orjson.dumps(delta_content) + SSE_TEXT_SUFFIX
+                                        response_parts.append(delta_content)
+                
+                full_response = "".join(response_parts)
                 
                 # Extract tools used from the final result
                 result = run.result
@@ -576,28 +919,30 @@ async def chat_stream(request: ChatRequest):
                 
                 # Send tools used information
                 if tools_used:
-                    tools_data = [
+                    yield sse({'type': 'tools', 'tools': [tool.model_dump() for tool in tools_used]})
+                
+                # Save user message and assistant response together
+                await record_messages(
+                    session_id,
+                    [
+                        {
+                            "role": "user",
+                            "content": request.message,
+                            "metadata": {"user_id": request.user_id}
+                        },
                         {
-                            "tool_name": tool.tool_name,
-                            "args": tool.args,
-                            "tool_call_id": tool.tool_call_id
+                            "role": "assistant",
+                            "content": full_response,
+                            "metadata": {
+                                "streamed": True,
+                                "tool_calls": len(tools_used)
+                            }
                         }
-                        for tool in tools_used
                     ]
-                    yield f"data: {json.dumps({'type': 'tools', 'tools': tools_data})}\n\n"
-                
-                # Save assistant response
-                await add_message(
-                    session_id=session_id,
-                    role="assistant",
-                    content=full_response,
-                    metadata={
-                        "streamed": True,
-                        "tool_calls": len(tools_used)
-                    }
                 )
+                user_saved = True
                 
-                yield f"data: {json.dumps({'type': 'end'})}\n\n"
+                yield sse({'type': 'end'})
                 
             except Exception as e:
                 logger.error(f"Stream error: {e}")
@@ -605,15 +950,28 @@ async def chat_stream(request: ChatRequest):
                     "type": "error",
                     "content": f"Stream error: {str(e)}"
                 }
-                yield f"data: {json.dumps(error_chunk)}\n\n"
+                yield sse(error_chunk)
+            
+            finally:
+                # Reason: A client disconnect raises CancelledError/GeneratorExit,
+                # which skips the except block; the question must still be kept
+                if not user_saved:
+                    try:
+                        await record_message(
+                            session_id=session_id,
+                            role="user",
+                            content=request.message,
+                            metadata={"user_id": request.user_id}
+                        )
+                    except Exception as save_error:
+                        logger.error(f"Failed to save user message: {save_error}")
         
         return StreamingResponse(
             generate_stream(),
-            media_type="text/plain",
+            media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream"
+                "Connection": "keep-alive"
             }
         )
         
@@ -631,11 +989,9 @@ async def search_vector(request: SearchRequest):
             limit=request.limit
         )
         
-        start_time = datetime.now()
-        results = await vector_search_tool(input_data)
-        end_time = datetime.now()
-        
-        query_time = (end_time - start_time).total_seconds() * 1000
+        start_ns = time.perf_counter_ns()
+        results = await vector_search_scheduler.submit(input_data)
+        query_time = (time.perf_counter_ns() - start_ns) / 1e6
         
         return SearchResponse(
             results=results,
@@ -657,11 +1013,9 @@ async def search_graph(request: SearchRequest):
             query=request.query
         )
         
-        start_time = datetime.now()
-        results = await graph_search_tool(input_data)
-        end_time = datetime.now()
-        
-        query_time = (end_time - start_time).total_seconds() * 1000
+        start_ns = time.perf_counter_ns()
+        results = await graph_search_scheduler.submit(input_data)
+        query_time = (time.perf_counter_ns() - start_ns) / 1e6
         
         return SearchResponse(
             graph_results=results,
@@ -684,11 +1038,9 @@ async def search_hybrid(request: SearchRequest):
             limit=request.limit
         )
         
-        start_time = datetime.now()
-        results = await hybrid_search_tool(input_data)
-        end_time = datetime.now()
-        
-        query_time = (end_time - start_time).total_seconds() * 1000
+        start_ns = time.perf_counter_ns()
+        results = await hybrid_search_scheduler.submit(input_data)
+        query_time = (time.perf_counter_ns() - start_ns) / 1e6
         
         return SearchResponse(
             results=results,
@@ -704,13 +1056,25 @@ async def search_hybrid(request: SearchRequest):
 
 @app.get("/documents")
 async def list_documents_endpoint(
+    response: Response,
     limit: int = 20,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page's X-Next-Cursor header"),
 ):
     """List documents endpoint."""
+    after = _decode_cursor(cursor, datetime.fromisoformat)
     try:
-        input_data = DocumentListInput(limit=limit, offset=offset)
+        # Reason: One extra row tells whether another page follows
+        input_data = DocumentListInput(
+            limit=limit + 1,
+            offset=offset,
+            after_created_at=after[0] if after else None,
+            after_id=str(after[1]) if after else None
+        )
         documents = await list_documents_tool(input_data)
+        if len(documents) > limit:
+            documents = documents[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(documents[-1].created_at, documents[-1].id)
         
         return {
             "documents": documents,
@@ -748,25 +1112,30 @@ async def download_document(document_id: str, inline: bool = Query(False, descri
         if not source:
             raise HTTPException(status_code=404, detail="Document source unavailable")
 
-        documents_folder = os.getenv("DOCUMENTS_FOLDER", "documents")
-        root_path = Path(documents_folder).expanduser().resolve()
-        file_path = (root_path / source).resolve()
-
-        try:
-            file_path.relative_to(root_path)
-        except ValueError:
+        # Path resolution and stat hit the filesystem; keep them off the event loop
+        file_path = await asyncio.to_thread(os.path.realpath, os.path.join(DOCUMENTS_ROOT, source))
+        if os.path.commonpath([file_path, DOCUMENTS_ROOT]) != DOCUMENTS_ROOT:
             raise HTTPException(status_code=400, detail="Invalid document path")
 
-        if not file_path.exists() or not file_path.is_file():
+        try:
+            file_stat = await asyncio.to_thread(os.stat, file_path)
+        except OSError:
+            raise HTTPException(status_code=404, detail="Document file not found")
+        if not stat.S_ISREG(file_stat.st_mode):
             raise HTTPException(status_code=404, detail="Document file not found")
 
-        media_type, _ = mimetypes.guess_type(str(file_path))
-        filename = file_path.name
+        filename = os.path.basename(file_path)
+        suffix = os.path.splitext(filename)[1].lower()
+        media_type = MIME_MAP.get(suffix)
+        if media_type is None:
+            media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            MIME_MAP[suffix] = media_type
 
         response = FileResponse(
-            str(file_path),
-            media_type=media_type or "application/octet-stream",
+            file_path,
+            media_type=media_type,
             filename=filename,
+            stat_result=file_stat,
         )
         if inline:
             response.headers["Content-Disposition"] = f'inline; filename="{filename}"'
@@ -796,42 +1165,34 @@ async def summarize_document(document_id: str, request: Request):
             # If no text content, return message
             return {"summary": "- Không có nội dung văn bản để tóm tắt."}
 
-        # Truncate content defensively to avoid token limits
-        max_chars = 12000
-        if len(content) > max_chars:
-            content = content[:max_chars] + "\n..."  # indicate truncation
+        # Truncate content defensively to avoid token limits; the truncation
+        # marker goes into the prompt join instead of a second copy of the body
+        truncated = len(content) > SUMMARIZE_MAX_CHARS
+        if truncated:
+            content = content[:SUMMARIZE_MAX_CHARS]
 
         # Build a targeted Vietnamese prompt instructing bullet list output
-        prompt = (
-            "Bạn là trợ lý tóm tắt tài liệu. "
-            "Hãy tóm tắt ngắn gọn nội dung tài liệu sau bằng tiếng Việt, "
-            "trình bày dưới dạng các gạch đầu dòng rõ ràng (5–10 gạch đầu dòng), "
-            "nêu bật các ý chính, thuật ngữ quan trọng, và kết luận (nếu có).\n\n"
-            f"Tiêu đề: {title}\n"
-            "Nội dung tài liệu:\n" + content + "\n\n"
-            "Yêu cầu định dạng đầu ra:\n"
-            "- Chỉ trả về danh sách gạch đầu dòng bằng tiếng Việt\n"
-            "- Mỗi dòng bắt đầu bằng '- ' (dấu gạch ngang và khoảng trắng)\n"
-            "- Không thêm tiêu đề, phần mở đầu hay phần kết thúc\n"
-            "- Ngắn gọn, chính xác, dễ đọc"
-        )
-
-        # Use the agent to generate summary without saving conversation
-        # Create an ephemeral session id to avoid pulling prior context
-        tmp_session_id = str(uuid.uuid4())
-        summary_text, _ = await execute_agent(
-            message=prompt,
-            session_id=tmp_session_id,
-            user_id=None,
-            save_conversation=False,
-        )
+        prompt = "".join((
+            SUMMARIZE_PROMPT_HEADER,
+            f"Tiêu đề: {title}\n",
+            "Nội dung tài liệu:\n",
+            content,
+            "\n...\n\n" if truncated else "\n\n",
+            SUMMARIZE_PROMPT_FOOTER,
+        ))
+
+        # Single completion: no tools, conversation context or session storage
+        async with SUMMARIZE_SEM:
+            result = await summary_agent.run(
+                prompt,
+                model_settings={"max_tokens": SUMMARIZE_MAX_TOKENS},
+            )
+        summary_text = result.data
 
-        # Basic sanitization: ensure lines start with '- '
-        lines = [ln.strip() for ln in (summary_text or "").splitlines() if ln.strip()]
-        if lines and not any(ln.startswith("- ") for ln in lines):
-            # Convert to bullet format if model didn't follow strictly
-            lines = [f"- {ln}" for ln in lines]
-        normalized = "\n".join(lines) if lines else "- (không có tóm tắt phù hợp)"
+        # Normalize every non-empty line to a '- ' bullet in a single pass
+        normalized = "\n".join(
+            f"- {m.group(1)}" for m in BULLET_RE.finditer(summary_text or "") if m.group(1)
+        ) or "- (không có tóm tắt phù hợp)"
 
         return {"summary": normalized}
 
@@ -842,155 +1203,126 @@ async def summarize_document(document_id: str, request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Fallback ingestion if older ingestion.ingest.ingest_file lacks extra_fields
-async def _ingest_with_pipeline_fallback(
-    file_path: str,
-    extra_fields: Dict[str, Any],
-) -> "IngestionResult":
-    from ingestion.ingest import DocumentIngestionPipeline  # local import to avoid circulars
-    from .models import IngestionResult as _IngestionResult
-    # Build pipeline with defaults
-    cfg = IngestionConfig()
-    pipeline = DocumentIngestionPipeline(cfg, documents_folder=os.path.dirname(file_path))
-    await pipeline.initialize()
+# Copy buffer for saving uploads to disk
+UPLOAD_COPY_BUFFER = 1 << 20
+
+# Files of one upload request read and stored concurrently
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+
+# Largest accepted file per upload; larger files are rejected with 413
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 << 20)))
+
+
+# UUIDs inside comma-separated form fields (hyphens optional)
+UUID_RE = re.compile(r"[0-9a-fA-F]{8}(?:-?[0-9a-fA-F]{4}){3}-?[0-9a-fA-F]{12}")
+
+
+def _parse_csv_ids(val: Optional[str]) -> List[str]:
+    """Extract the UUIDs from a comma-separated form value, ignoring anything else."""
+    return UUID_RE.findall(val) if val else []
+
+
+def _optional_uuid(value: Optional[str], field: str) -> Optional[uuid.UUID]:
+    """
+    Parse an optional UUID field; blank means None.
+
+    Raises:
+        HTTPException: 400 if the value is not a UUID
+    """
+    if value is None or not value.strip():
+        return None
     try:
-        # Read and prepare
-        content, read_metadata = pipeline._read_document(file_path)
-        title = pipeline._extract_title(content, file_path)
-        source = os.path.relpath(file_path, pipeline.documents_folder)
-        metadata = pipeline._extract_document_metadata(content, file_path, read_metadata)
-        # Merge optional metadata
-        if extra_fields.get("description"):
-            metadata["description"] = extra_fields["description"]
-        if extra_fields.get("access_level"):
-            metadata["access_level"] = extra_fields["access_level"]
-
-        # Chunk, entities, embeddings
-        chunks = await pipeline.chunker.chunk_document(
-            content=content,
-            title=title,
-            source=source,
-            metadata=metadata,
-        )
-        if pipeline.config.extract_entities:
-            try:
-                chunks = await pipeline.graph_builder.extract_entities_from_chunks(chunks)
-            except Exception:
-                # Continue if entity extraction not available
-                pass
-        embedded_chunks = await pipeline.embedder.embed_chunks(chunks)
+        return uuid.UUID(value.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {field}: {value}")
 
-        # Insert into DB with required FKs
-        async with db_pool.acquire() as conn:
-            async with conn.transaction():
-                title_to_use = extra_fields.get("title_override") or title
-                # Normalize effective_date into a Python date if provided
-                _eff_date = extra_fields.get("effective_date")
-                if isinstance(_eff_date, str) and _eff_date.strip():
-                    try:
-                        _eff_date = date.fromisoformat(_eff_date)
-                    except Exception:
-                        _eff_date = None
-
-                doc_row = await conn.fetchrow(
-                    """
-                    INSERT INTO documents (
-                        title, source, content, metadata,
-                        document_type_id, issuing_unit_id, site_id, author_id, effective_date
-                    )
-                    VALUES ($1, $2, $3, $4, $5::uuid, $6::uuid, $7::uuid, $8::uuid, $9)
-                    RETURNING id::text
-                    """,
-                    title_to_use,
-                    source,
-                    content,
-                    json.dumps(metadata),
-                    extra_fields.get("document_type_id"),
-                    extra_fields.get("issuing_unit_id"),
-                    extra_fields.get("site_id"),
-                    extra_fields.get("author_id"),
-                    _eff_date,
-                )
-                document_id = doc_row["id"]
-
-                # Insert chunks
-                for ch in embedded_chunks:
-                    embedding_data = None
-                    if getattr(ch, "embedding", None):
-                        embedding_data = "[" + ",".join(map(str, ch.embedding)) + "]"
-                    await conn.execute(
-                        """
-                        INSERT INTO chunks (document_id, content, embedding, chunk_index, metadata, token_count)
-                        VALUES ($1::uuid, $2, $3::vector, $4, $5, $6)
-                        """,
-                        document_id,
-                        ch.content,
-                        embedding_data,
-                        ch.index,
-                        json.dumps(getattr(ch, "metadata", {})),
-                        getattr(ch, "token_count", None),
-                    )
 
-                # Relations
-                def _dedupe(seq: List[str]) -> List[str]:
-                    seen = set()
-                    out: List[str] = []
-                    for x in seq or []:
-                        if x not in seen:
-                            seen.add(x)
-                            out.append(x)
-                    return out
-
-                eq_ids = _dedupe(extra_fields.get("equipment_ids") or [])
-                kw_ids = _dedupe(extra_fields.get("keyword_ids") or [])
-                if eq_ids:
-                    await conn.executemany(
-                        """
-                        INSERT INTO document_equipment (document_id, equipment_id)
-                        VALUES ($1::uuid, $2::uuid)
-                        ON CONFLICT DO NOTHING
-                        """,
-                        [(document_id, eid) for eid in eq_ids],
-                    )
-                if kw_ids:
-                    await conn.executemany(
-                        """
-                        INSERT INTO document_keywords (document_id, keyword_id)
-                        VALUES ($1::uuid, $2::uuid)
-                        ON CONFLICT DO NOTHING
-                        """,
-                        [(document_id, kid) for kid in kw_ids],
-                    )
+def _check_upload_size(upload: UploadFile) -> None:
+    """
+    Reject an upload larger than MAX_UPLOAD_BYTES before it is read.
 
-        # Optionally build graph
-        relationships_created = 0
-        errors: List[str] = []
-        if not pipeline.config.skip_graph_building:
-            try:
-                graph_result = await pipeline.graph_builder.add_document_to_graph(
-                    chunks=embedded_chunks,
-                    document_title=title_to_use,
-                    document_source=source,
-                    document_metadata=metadata,
-                )
-                relationships_created = graph_result.get("episodes_created", 0)
-            except Exception as ge:
-                errors.append(f"Graph build failed: {ge}")
-
-        return _IngestionResult(
-            document_id=document_id,
-            title=title_to_use,
-            chunks_created=len(embedded_chunks),
-            entities_extracted=0,
-            relationships_created=relationships_created,
-            processing_time_ms=0.0,
-            errors=errors,
+    Raises:
+        HTTPException: 413 if the file is too large
+    """
+    size = upload.size
+    if size is None:
+        size = upload.file.seek(0, os.SEEK_END)
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{upload.filename} exceeds the {MAX_UPLOAD_BYTES} byte upload limit"
         )
-    finally:
-        try:
-            await pipeline.close()
-        except Exception:
-            pass
+
+
+def _save_upload(upload: UploadFile, file_path: str) -> None:
+    """Copy an upload's spooled file to disk in fixed-size blocks."""
+    upload.file.seek(0)
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, UPLOAD_COPY_BUFFER)
+
+
+def _decode_upload(upload: UploadFile, encoding: str, errors: str) -> Tuple[str, int]:
+    """Incrementally decode an upload's spooled file in fixed-size blocks."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    parts: List[str] = []
+    size = 0
+    upload.file.seek(0)
+    while block := upload.file.read(UPLOAD_COPY_BUFFER):
+        size += len(block)
+        parts.append(decoder.decode(block))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts), size
+
+
+def _read_upload_text(upload: UploadFile) -> Tuple[str, int]:
+    """
+    Read an upload as text without holding its raw bytes in memory.
+
+    Returns:
+        Tuple of (text, size in bytes); non-UTF-8 files are read as latin-1
+    """
+    try:
+        return _decode_upload(upload, "utf-8", "strict")
+    except UnicodeDecodeError:
+        return _decode_upload(upload, "latin-1", "ignore")
+
+
+def _unique_upload_paths(folder: str, filenames: List[str]) -> List[str]:
+    """
+    Map upload filenames to distinct paths inside the documents folder.
+
+    Files of one request are saved concurrently, so repeated basenames get a
+    numeric suffix ("report.pdf", "report-2.pdf", ...) instead of being
+    written to the same path.
+
+    Args:
+        folder: Documents folder
+        filenames: Client-supplied filenames, in upload order
+
+    Returns:
+        One path per filename, in the same order
+    """
+    # Sanitize filenames to prevent path traversal
+    names = [os.path.basename(filename) for filename in filenames]
+    # Reason: Reserving every original name first keeps a suffixed duplicate
+    # from taking the name of a later file in the same request
+    taken = set(names)
+    seen = set()
+    paths = []
+    for name in names:
+        candidate = name
+        if name in seen:
+            stem, ext = os.path.splitext(name)
+            n = 2
+            candidate = f"{stem}-{n}{ext}"
+            while candidate in taken:
+                n += 1
+                candidate = f"{stem}-{n}{ext}"
+            taken.add(candidate)
+        seen.add(name)
+        paths.append(os.path.join(folder, candidate))
+    return paths
+
 
 @app.post("/documents/upload")
 async def upload_documents(
@@ -1007,23 +1339,27 @@ async def upload_documents(
     description: Optional[str] = Form(None),
     access_level: Optional[str] = Form(None),
     version: Optional[str] = Form(None),  # Allow user-specified version at upload
+    bulk_mode: bool = Form(False),  # Defer vector index maintenance for large batches
 ):
     """Upload one or more documents and ingest them with metadata.
 
     Notes:
     - equipment_ids, keyword_ids accepted as comma-separated UUID strings.
     - title_override allows forcing the document title.
+    - bulk_mode drops the chunk embedding index while the files load and
+      rebuilds it in the background afterwards; vector search is slower
+      for every user until the rebuild completes, so it requires an admin
+      session.
     """
+    for upload in files:
+        _check_upload_size(upload)
+    if bulk_mode and not await _is_admin_request(request):
+        raise HTTPException(status_code=403, detail="bulk_mode requires an admin session")
+
     documents_folder = os.getenv("DOCUMENTS_FOLDER", "documents")
-    os.makedirs(documents_folder, exist_ok=True)
+    await asyncio.to_thread(os.makedirs, documents_folder, exist_ok=True)
     results = []
     try:
-        # Parse CSV lists
-        def _parse_csv_ids(val: Optional[str]) -> List[str]:
-            if not val:
-                return []
-            return [v.strip() for v in val.split(",") if v.strip()]
-
         # Determine author_id from session header if available; fallback to provided form field
         resolved_author_id: Optional[str] = None
         try:
@@ -1053,49 +1389,59 @@ async def upload_documents(
             "version": version,
         }
 
-        for upload in files:
-            # Sanitize filename to prevent path traversal
-            safe_name = os.path.basename(upload.filename)
-            file_path = os.path.join(documents_folder, safe_name)
-            with open(file_path, "wb") as f:
-                f.write(await upload.read())
-            # Call ingest_file with extra_fields when supported; fallback if not
-            try:
-                ingestion_result = await ingest_file(
-                    file_path,
-                    IngestionConfig(),
+        # One pipeline shared by all files; it uses the app's pool and graph
+        # client, so it must not close them when done
+        pipeline = DocumentIngestionPipeline(IngestionConfig(), documents_folder=documents_folder)
+        await pipeline.initialize()
+
+        file_paths = _unique_upload_paths(documents_folder, [upload.filename for upload in files])
+        try:
+            # Reason: Streaming in worker threads keeps memory at one buffer
+            # per upload and leaves the event loop free during disk writes
+            await asyncio.gather(*(
+                asyncio.to_thread(_save_upload, upload, file_path)
+                for upload, file_path in zip(files, file_paths)
+            ))
+            async with (deferred_vector_index() if bulk_mode else nullcontext()):
+                # Chunks of all files are embedded together in one batch
+                ingestion_results = await ingest_files(
+                    file_paths,
+                    pipeline.config,
                     extra_fields=extra_fields,
+                    pipeline=pipeline,
+                    concurrency=UPLOAD_CONCURRENCY,
+                    # Reason: The document is searchable once committed; the
+                    # graph build can take many seconds and must not hold up
+                    # the response
+                    background_graph=True,
                 )
-            except TypeError as te:
-                # Backward-compatibility: older ingest_file may not accept extra_fields
-                if "extra_fields" in str(te):
-                    logger.warning("ingest_file without extra_fields detected; using pipeline fallback")
-                    ingestion_result = await _ingest_with_pipeline_fallback(file_path, extra_fields)
-                else:
-                    raise
-            results.append(ingestion_result.model_dump())
+        finally:
+            await pipeline.close(close_shared=False)
+
+        results.extend(result.model_dump() for result in ingestion_results)
         return {"documents": results}
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+_LIST_DOCUMENT_TYPES_SQL = """
+    SELECT id::text AS id,
+           COALESCE(code,'') AS code,
+           name,
+           description,
+           is_active
+    FROM document_types
+    WHERE is_active = TRUE
+    ORDER BY name
+    """
+
+
 @app.get("/metadata/document-types")
 async def list_document_types():
     try:
         async with db_pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT id::text AS id,
-                       COALESCE(code,'') AS code,
-                       name,
-                       description,
-                       is_active
-                FROM document_types
-                WHERE is_active = TRUE
-                ORDER BY name
-                """
-            )
-            return [dict(r) for r in rows]
+            rows = await conn.fetch(_LIST_DOCUMENT_TYPES_SQL)
+            return _records_response(rows)
     except Exception as e:
         logger.error(f"list_document_types failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1165,82 +1511,100 @@ async def delete_document_type(id: str):
         logger.error(f"delete_document_type failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+_LIST_ORG_UNITS_SQL = """
+    SELECT u.id::text AS id,
+           COALESCE(u.code,'') AS code,
+           u.name,
+           u.parent_id::text AS parent_id,
+           p.name AS parent_name,
+           u.is_active,
+           u.image
+    FROM org_units u
+    LEFT JOIN org_units p ON p.id = u.parent_id
+    WHERE u.is_active = TRUE
+    ORDER BY u.name
+    """
+
+
+# Reason: Keyset on (name, id) keeps the alphabetical order of the full
+# listing while each page is an index range scan instead of OFFSET
+_LIST_ORG_UNITS_PAGE_SQL = """
+    SELECT u.id::text AS id,
+           COALESCE(u.code,'') AS code,
+           u.name,
+           u.parent_id::text AS parent_id,
+           p.name AS parent_name,
+           u.is_active,
+           u.image
+    FROM org_units u
+    LEFT JOIN org_units p ON p.id = u.parent_id
+    WHERE u.is_active = TRUE
+      AND ($1::text IS NULL OR (u.name, u.id) > ($1::text, $2::uuid))
+    ORDER BY u.name, u.id
+    LIMIT $3
+    """
+
+
 @app.get("/metadata/org-units")
-async def list_org_units():
+async def list_org_units(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit for all rows"),
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page's X-Next-Cursor header"),
+):
+    after = _decode_cursor(cursor)
     try:
         async with db_pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT u.id::text AS id,
-                       COALESCE(u.code,'') AS code,
-                       u.name,
-                       u.parent_id::text AS parent_id,
-                       p.name AS parent_name,
-                       u.is_active,
-                       u.image
-                FROM org_units u
-                LEFT JOIN org_units p ON p.id = u.parent_id
-                WHERE u.is_active = TRUE
-                ORDER BY u.name
-                """
-            )
-            return [dict(r) for r in rows]
+            if limit is None:
+                rows = await conn.fetch(_LIST_ORG_UNITS_SQL)
+            else:
+                rows = await conn.fetch(_LIST_ORG_UNITS_PAGE_SQL, *(after or (None, None)), limit + 1)
+            return _page(rows, limit, sort_key="name")
     except Exception as e:
         logger.error(f"list_org_units failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/metadata/org-units")
 async def create_org_unit(item: OrgUnitIn):
+    parent_id = _optional_uuid(item.parent_id, "parent_id")
     try:
         async with db_pool.acquire() as conn:
-            # Resolve parent_id by ref if needed
-            v_parent_id = item.parent_id
-            if (not v_parent_id) and (item.parent_ref and item.parent_ref.strip()):
-                ref = item.parent_ref.strip()
-                q = "SELECT id::text FROM org_units WHERE id::text = $1 OR code = $1 OR name = $1 LIMIT 1"
-                v_parent_id = await conn.fetchval(q, ref)
-
-            row = await conn.fetchrow(
+            # Reason: Parent lookup, insert, optional child re-parent and the
+            # joined response row all run as one statement (one round-trip)
+            out = await conn.fetchrow(
                 """
-                INSERT INTO org_units (code, name, parent_id, is_active)
-                VALUES ($1, $2, $3::uuid, COALESCE($4, TRUE))
-                RETURNING id::text AS id
-                """,
-                item.code,
-                item.name,
-                v_parent_id,
-                item.is_active,
-            )
-            new_id = row["id"]
-            # Optional re-parent existing child
-            if item.child_ref and item.child_ref.strip():
-                cref = item.child_ref.strip()
-                await conn.execute(
-                    """
+                WITH parent AS (
+                    SELECT COALESCE(
+                        $3::uuid,
+                        (SELECT id FROM org_units WHERE id::text = $5 OR code = $5 OR name = $5 LIMIT 1)
+                    ) AS id
+                ),
+                ins AS (
+                    INSERT INTO org_units (code, name, parent_id, is_active)
+                    VALUES ($1, $2, (SELECT id FROM parent), COALESCE($4, TRUE))
+                    RETURNING id, code, name, parent_id, is_active
+                ),
+                child AS (
                     UPDATE org_units
-                    SET parent_id = $2::uuid,
+                    SET parent_id = (SELECT id FROM ins),
                         updated_at = CURRENT_TIMESTAMP
                     WHERE id IN (
-                        SELECT id FROM org_units WHERE id::text = $1 OR code = $1 OR name = $1 LIMIT 1
+                        SELECT id FROM org_units WHERE id::text = $6 OR code = $6 OR name = $6 LIMIT 1
                     )
-                    """,
-                    cref, new_id
                 )
-
-            # Return full row with parent name
-            out = await conn.fetchrow(
-                """
                 SELECT u.id::text AS id,
                        COALESCE(u.code,'') AS code,
                        u.name,
                        u.parent_id::text AS parent_id,
                        p.name AS parent_name,
                        u.is_active
-                FROM org_units u
+                FROM ins u
                 LEFT JOIN org_units p ON p.id = u.parent_id
-                WHERE u.id = $1::uuid
                 """,
-                new_id,
+                item.code,
+                item.name,
+                parent_id,
+                item.is_active,
+                (item.parent_ref or "").strip() or None,
+                (item.child_ref or "").strip() or None,
             )
             return dict(out)
     except Exception as e:
@@ -1249,58 +1613,55 @@ async def create_org_unit(item: OrgUnitIn):
 
 @app.put("/metadata/org-units/{id}")
 async def update_org_unit(id: str, item: OrgUnitIn):
+    parent_id = _optional_uuid(item.parent_id, "parent_id")
     try:
         async with db_pool.acquire() as conn:
-            # Resolve parent
-            v_parent_id = item.parent_id
-            if (not v_parent_id) and (item.parent_ref and item.parent_ref.strip()):
-                ref = item.parent_ref.strip()
-                v_parent_id = await conn.fetchval(
-                    "SELECT id::text FROM org_units WHERE id::text = $1 OR code = $1 OR name = $1 LIMIT 1",
-                    ref,
-                )
-
-            await conn.execute(
+            # Reason: Parent lookup, update, optional child re-parent and the
+            # joined response row all run as one statement (one round-trip)
+            row = await conn.fetchrow(
                 """
-                UPDATE org_units
-                SET code = $2,
-                    name = $3,
-                    parent_id = NULLIF($4,'')::uuid,
-                    is_active = COALESCE($5, is_active),
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = $1::uuid
-                """,
-                id, item.code, item.name, v_parent_id or '', item.is_active,
-            )
-
-            # Optional child re-parent to this unit
-            if item.child_ref and item.child_ref.strip():
-                cref = item.child_ref.strip()
-                await conn.execute(
-                    """
+                WITH parent AS (
+                    SELECT COALESCE(
+                        $4::uuid,
+                        (SELECT id FROM org_units WHERE id::text = $6 OR code = $6 OR name = $6 LIMIT 1)
+                    ) AS id
+                ),
+                upd AS (
                     UPDATE org_units
-                    SET parent_id = $2::uuid,
+                    SET code = $2,
+                        name = $3,
+                        parent_id = (SELECT id FROM parent),
+                        is_active = COALESCE($5, is_active),
                         updated_at = CURRENT_TIMESTAMP
-                    WHERE id IN (
-                        SELECT id FROM org_units WHERE id::text = $1 OR code = $1 OR name = $1 LIMIT 1
-                    )
-                    """,
-                    cref, id,
+                    WHERE id = $1::uuid
+                    RETURNING id, code, name, parent_id, is_active
+                ),
+                child AS (
+                    UPDATE org_units
+                    SET parent_id = (SELECT id FROM upd),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id <> $1::uuid
+                      AND EXISTS (SELECT 1 FROM upd)
+                      AND id IN (
+                          SELECT id FROM org_units WHERE id::text = $7 OR code = $7 OR name = $7 LIMIT 1
+                      )
                 )
-
-            row = await conn.fetchrow(
-                """
                 SELECT u.id::text AS id,
                        COALESCE(u.code,'') AS code,
                        u.name,
                        u.parent_id::text AS parent_id,
                        p.name AS parent_name,
                        u.is_active
-                FROM org_units u
+                FROM upd u
                 LEFT JOIN org_units p ON p.id = u.parent_id
-                WHERE u.id = $1::uuid
                 """,
                 id,
+                item.code,
+                item.name,
+                parent_id,
+                item.is_active,
+                (item.parent_ref or "").strip() or None,
+                (item.child_ref or "").strip() or None,
             )
             if not row:
                 raise HTTPException(status_code=404, detail="Not found")
@@ -1325,22 +1686,23 @@ async def delete_org_unit(id: str):
         logger.error(f"delete_org_unit failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+_LIST_SITES_SQL = """
+    SELECT id::text AS id,
+           name,
+           COALESCE(kind,'') AS kind,
+           is_active
+    FROM sites
+    WHERE is_active = TRUE
+    ORDER BY name
+    """
+
+
 @app.get("/metadata/sites")
 async def list_sites():
     try:
         async with db_pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT id::text AS id,
-                       name,
-                       COALESCE(kind,'') AS kind,
-                       is_active
-                FROM sites
-                WHERE is_active = TRUE
-                ORDER BY name
-                """
-            )
-            return [dict(r) for r in rows]
+            rows = await conn.fetch(_LIST_SITES_SQL)
+            return _records_response(rows)
     except Exception as e:
         logger.error(f"list_sites failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1401,22 +1763,23 @@ async def delete_site(id: str):
         logger.error(f"delete_site failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+_LIST_EQUIPMENT_SQL = """
+    SELECT id::text AS id,
+           COALESCE(code,'') AS code,
+           name,
+           is_active
+    FROM equipment
+    WHERE is_active = TRUE
+    ORDER BY COALESCE(code, name)
+    """
+
+
 @app.get("/metadata/equipment")
 async def list_equipment():
     try:
         async with db_pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT id::text AS id,
-                       COALESCE(code,'') AS code,
-                       name,
-                       is_active
-                FROM equipment
-                WHERE is_active = TRUE
-                ORDER BY COALESCE(code, name)
-                """
-            )
-            return [dict(r) for r in rows]
+            rows = await conn.fetch(_LIST_EQUIPMENT_SQL)
+            return _records_response(rows)
     except Exception as e:
         logger.error(f"list_equipment failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1477,27 +1840,38 @@ async def delete_equipment(id: str):
         logger.error(f"delete_equipment failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+_LIST_KEYWORDS_SQL = """
+    SELECT id::text AS id,
+           name,
+           is_active
+    FROM keywords
+    WHERE is_active = TRUE
+    ORDER BY name
+    """
+
+
 @app.get("/metadata/keywords")
 async def list_keywords():
     try:
         async with db_pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT id::text AS id,
-                       name,
-                       is_active
-                FROM keywords
-                WHERE is_active = TRUE
-                ORDER BY name
-                """
-            )
-            return [dict(r) for r in rows]
+            rows = await conn.fetch(_LIST_KEYWORDS_SQL)
+            return _records_response(rows)
     except Exception as e:
         logger.error(f"list_keywords failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Accounts metadata for author search (minimal payload)
+_LIST_ACCOUNTS_MINIMAL_SQL = """
+    SELECT
+        id::text       AS id,
+        COALESCE(NULLIF(TRIM(full_name), ''), username) AS name
+    FROM accounts
+    WHERE is_active = TRUE
+    ORDER BY COALESCE(NULLIF(TRIM(full_name), ''), username)
+    """
+
+
 @app.get("/metadata/accounts")
 async def list_accounts_minimal():
     """Return minimal accounts list for lookups: id and display name.
@@ -1506,17 +1880,8 @@ async def list_accounts_minimal():
     """
     try:
         async with db_pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT
-                    id::text       AS id,
-                    COALESCE(NULLIF(TRIM(full_name), ''), username) AS name
-                FROM accounts
-                WHERE is_active = TRUE
-                ORDER BY COALESCE(NULLIF(TRIM(full_name), ''), username)
-                """
-            )
-            return [dict(r) for r in rows]
+            rows = await conn.fetch(_LIST_ACCOUNTS_MINIMAL_SQL)
+            return _records_response(rows)
     except Exception as e:
         logger.error(f"list_accounts_minimal failed: {e}")
         # If accounts table missing, return empty list to keep frontend functional
@@ -1525,7 +1890,11 @@ async def list_accounts_minimal():
 
 # Optional: full accounts listing for admin/tools
 @app.get("/accounts")
-async def list_accounts_full():
+async def list_accounts_full(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit for all rows"),
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page's X-Next-Cursor header"),
+):
+    after = _decode_cursor(cursor)
     try:
         async with db_pool.acquire() as conn:
             rows = await conn.fetch(
@@ -1542,10 +1911,14 @@ async def list_accounts_full():
                     created_at,
                     updated_at
                 FROM accounts
-                ORDER BY username
-                """
+                WHERE $1::text IS NULL OR (username, id) > ($1::text, $2::uuid)
+                ORDER BY username, id
+                LIMIT $3
+                """,
+                *(after or (None, None)),
+                None if limit is None else limit + 1,
             )
-            return [dict(r) for r in rows]
+            return _page(rows, limit, sort_key="username")
     except Exception as e:
         logger.error(f"list_accounts_full failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1640,16 +2013,14 @@ async def global_exception_handler(request: Request, exc: Exception):
 # Document Versioning Endpoints
 # ----------------------------
 
+_VERSION_RE = re.compile(r"\s*v?(\d+)(?:\.(\d+))?", re.I)
+
+
 def _parse_version(v: Optional[str]) -> tuple[int, int]:
-    try:
-        if not v:
-            return (1, 0)
-        parts = str(v).strip().lower().replace('v', '').split('.')
-        major = int(parts[0]) if len(parts) > 0 and parts[0].isdigit() else 1
-        minor = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
-        return (major, minor)
-    except Exception:
+    m = _VERSION_RE.match(str(v)) if v else None
+    if not m:
         return (1, 0)
+    return (int(m.group(1)), int(m.group(2) or 0))
 
 
 def _bump_version(current: Optional[str], bump: str) -> str:
@@ -1672,6 +2043,19 @@ async def _resolve_user_id_from_request(request: Request) -> Optional[str]:
     return None
 
 
+async def _is_admin_request(request: Request) -> bool:
+    """Whether the request's X-Session-Id belongs to an admin login."""
+    try:
+        sess_id = request.headers.get("X-Session-Id") or request.headers.get("x-session-id")
+        if sess_id:
+            sess = await get_session(sess_id)
+            metadata = (sess or {}).get("metadata") or {}
+            return metadata.get("role") == "admin"
+    except Exception:
+        pass
+    return False
+
+
 async def _get_document_core(conn, document_id: str):
     row = await conn.fetchrow(
         """
@@ -1687,6 +2071,121 @@ async def _get_document_core(conn, document_id: str):
     return row
 
 
+@lru_cache(maxsize=1)
+def _shared_chunker():
+    """Chunker for re-chunking document versions, built once per process."""
+    config = IngestionConfig()
+    return create_chunker(ChunkingConfig(
+        chunk_size=config.chunk_size,
+        chunk_overlap=config.chunk_overlap,
+        max_chunk_size=config.max_chunk_size,
+        use_semantic_splitting=config.use_semantic_chunking
+    ))
+
+
+@lru_cache(maxsize=1)
+def _shared_embedder():
+    """Embedder (with its client and cache) shared by version uploads and rollbacks."""
+    return create_embedder()
+
+
+async def _embed_reusing_stored(embedder, document_id: str, chunks: List[Any]) -> List[Any]:
+    """
+    Embed a document's new chunks, reusing stored embeddings of unchanged text.
+
+    Chunks whose text already exists among the document's current chunks
+    (e.g. on rollback, or unchanged paragraphs of a new version) take the
+    stored embedding; only the rest are sent to the embedding API.
+    """
+    hashes = [chunk_content_hash(chunk.content) for chunk in chunks]
+    stored = await get_chunk_embeddings(document_id, list(set(hashes)))
+    missing = [chunk for chunk, content_hash in zip(chunks, hashes) if content_hash not in stored]
+    if stored:
+        logger.info(f"Reusing {len(chunks) - len(missing)} of {len(chunks)} stored chunk embeddings")
+
+    embedded = iter(await embedder.embed_chunks(missing) if missing else [])
+    result = []
+    for chunk, content_hash in zip(chunks, hashes):
+        if content_hash in stored:
+            # Reason: Keep the reused vector's provenance, so the row matches
+            # the stored one and the chunk upsert can leave it untouched
+            chunk.embedding, embedding_metadata = stored[content_hash]
+            chunk.metadata.update(embedding_metadata)
+            result.append(chunk)
+        else:
+            result.append(next(embedded))
+    return result
+
+
+# Reason: Point the document at the new version and snapshot it in one
+# statement; both writes take the same content and metadata parameters.
+# The updated_at guard makes the UPDATE the concurrency check, and the
+# snapshots are only inserted when the UPDATE matched. When $11 is set the
+# pre-update row is also kept as baseline version $11; sub-statements of a
+# WITH all see the table as it was before the UPDATE
+_INSERT_VERSION_AND_UPDATE_DOCUMENT_SQL = """
+    WITH updated AS (
+        UPDATE documents
+        SET content = $4,
+            metadata = $5::jsonb,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = $1::uuid AND updated_at = $10
+        RETURNING id
+    ),
+    baseline AS (
+        INSERT INTO document_versions (
+            document_id, version, change_summary, content, metadata,
+            file_path, file_mime, file_size, created_by
+        )
+        SELECT d.id, $11, 'Initial version snapshot', COALESCE(d.content, ''), COALESCE(d.metadata, '{}'),
+               d.metadata->>'file_path',
+               d.metadata->>'last_upload_mime',
+               CASE WHEN jsonb_typeof(d.metadata->'file_size') = 'number'
+                    THEN (d.metadata->>'file_size')::numeric::bigint END,
+               $9::uuid
+        FROM documents d
+        JOIN updated u ON u.id = d.id
+        WHERE $11::text IS NOT NULL
+        ON CONFLICT (document_id, version) DO NOTHING
+    )
+    INSERT INTO document_versions (
+        document_id, version, change_summary, content, metadata,
+        file_path, file_mime, file_size, created_by
+    )
+    SELECT id, $2, $3, $4, $5::jsonb, $6, $7, $8, $9::uuid
+    FROM updated
+    RETURNING 1
+    """
+
+_UPDATE_DOCUMENT_CONTENT_SQL = """
+    UPDATE documents
+    SET content = $2,
+        metadata = $3::jsonb,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = $1::uuid AND updated_at = $4
+    RETURNING 1
+    """
+
+_ROLLBACK_SOURCE_SQL = """
+    SELECT v.version, v.content, v.metadata, d.title, d.source, d.updated_at
+    FROM documents d
+    LEFT JOIN document_versions v ON v.document_id = d.id AND v.id = $2::uuid
+    WHERE d.id = $1::uuid
+    """
+
+
+async def _raise_update_conflict(conn, document_id: str) -> None:
+    """
+    Explain why a guarded document UPDATE matched no row.
+
+    Raises:
+        HTTPException: 404 if the document is gone, 409 if it was modified
+    """
+    if not await conn.fetchval("SELECT 1 FROM documents WHERE id = $1::uuid", document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    raise HTTPException(status_code=409, detail="Document was modified concurrently; please retry")
+
+
 @app.post("/documents/{document_id}/versions")
 async def upload_new_version(
     document_id: str,
@@ -1710,198 +2209,148 @@ async def upload_new_version(
     # Resolve user id (creator of this version)
     created_by = await _resolve_user_id_from_request(request)
 
-    # Read new content
+    # Read new content (streamed and decoded in a worker thread)
+    _check_upload_size(file)
     try:
-        raw = await file.read()
-        try:
-            new_content = raw.decode("utf-8")
-        except Exception:
-            new_content = raw.decode("latin-1", errors="ignore")
+        new_content, file_size = await asyncio.to_thread(_read_upload_text, file)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to read file: {e}")
 
     # Prepare chunker & embedder
-    config = IngestionConfig()
-    chunker = create_chunker(ChunkingConfig(
-        chunk_size=config.chunk_size,
-        chunk_overlap=config.chunk_overlap,
-        max_chunk_size=config.max_chunk_size,
-        use_semantic_splitting=config.use_semantic_chunking
-    ))
-    embedder = create_embedder()
+    chunker = _shared_chunker()
+    embedder = _shared_embedder()
 
+    # Read the current document on a short-lived connection
     async with db_pool.acquire() as conn:
-        async with conn.transaction():
-            doc = await _get_document_core(conn, document_id)
-            if not doc:
-                raise HTTPException(status_code=404, detail="Document not found")
+        doc = await _get_document_core(conn, document_id)
+        if not doc:
+            raise HTTPException(status_code=404, detail="Document not found")
 
-            # Compute next version
-            meta = doc["metadata"]
-            if isinstance(meta, str):
-                try:
-                    meta = json.loads(meta)
-                except Exception:
-                    meta = {}
-            current_version = (meta or {}).get("version")
-            # Ensure baseline (pre-update) snapshot exists in history
-            try:
-                prev_ver = current_version if (isinstance(current_version, str) and str(current_version).strip()) else "1.0"
-                exists = await conn.fetchval(
-                    "SELECT 1 FROM document_versions WHERE document_id=$1::uuid AND version=$2 LIMIT 1",
-                    document_id, prev_ver
-                )
-                if not exists:
-                    await conn.execute(
-                        """
-                        INSERT INTO document_versions (
-                            document_id, version, change_summary, content, metadata,
-                            file_path, file_mime, file_size, created_by
-                        )
-                        VALUES ($1::uuid, $2, $3, $4, $5::jsonb, $6, $7, $8, $9::uuid)
-                        """,
-                        document_id,
-                        prev_ver,
-                        "Initial version snapshot",
-                        doc["content"] or "",
-                        json.dumps(meta or {}),
-                        (meta or {}).get("file_path"),
-                        (meta or {}).get("last_upload_mime"),
-                        (meta or {}).get("file_size"),
-                        created_by,
-                    )
-                    if not current_version:
-                        current_version = prev_ver
-            except Exception as _e:
-                logger.debug(f"Baseline snapshot check failed: {_e}")
-            new_version = (version.strip() if isinstance(version, str) and version.strip() else _bump_version(current_version, bump))
-
-            # Build updated metadata
-            new_metadata = dict(meta or {})
-            new_metadata["version"] = new_version
-            # Keep optional file info for audits
-            if file and file.filename:
-                new_metadata["last_upload_filename"] = file.filename
-                new_metadata["last_upload_mime"] = file.content_type
-                new_metadata["file_path"] = file.filename
-                try:
-                    new_metadata["file_size"] = len(raw)
-                except Exception:
-                    pass
-
-            # Chunk and embed
-            title = doc["title"]
-            source = doc["source"] or (file.filename if file and file.filename else "uploaded")
-            chunks = await chunker.chunk_document(
-                content=new_content,
-                title=title,
-                source=source,
-                metadata=new_metadata
+        # Compute next version
+        meta = doc["metadata"]
+        current_version = (meta or {}).get("version")
+        # Ensure baseline (pre-update) snapshot exists in history
+        prev_ver = current_version if (isinstance(current_version, str) and str(current_version).strip()) else "1.0"
+        needs_baseline = False
+        try:
+            exists = await conn.fetchval(
+                "SELECT 1 FROM document_versions WHERE document_id=$1::uuid AND version=$2 LIMIT 1",
+                document_id, prev_ver
             )
-            embedded_chunks = await embedder.embed_chunks(chunks)
-
-            # Replace chunks for this document
-            await conn.execute("DELETE FROM chunks WHERE document_id = $1::uuid", document_id)
-            for ch in embedded_chunks:
-                embedding_data = None
-                if getattr(ch, "embedding", None):
-                    embedding_data = "[" + ",".join(map(str, ch.embedding)) + "]"
-                await conn.execute(
-                    """
-                    INSERT INTO chunks (document_id, content, embedding, chunk_index, metadata, token_count)
-                    VALUES ($1::uuid, $2, $3::vector, $4, $5, $6)
-                    """,
-                    document_id,
-                    ch.content,
-                    embedding_data,
-                    ch.index,
-                    json.dumps(getattr(ch, "metadata", {})),
-                    getattr(ch, "token_count", None),
-                )
+            needs_baseline = not exists
+        except Exception as _e:
+            logger.debug(f"Baseline snapshot check failed: {_e}")
+    if needs_baseline and not current_version:
+        current_version = prev_ver
+    new_version = (version.strip() if isinstance(version, str) and version.strip() else _bump_version(current_version, bump))
+
+    # Build updated metadata
+    new_metadata = dict(meta or {})
+    new_metadata["version"] = new_version
+    # Keep optional file info for audits
+    if file and file.filename:
+        new_metadata["last_upload_filename"] = file.filename
+        new_metadata["last_upload_mime"] = file.content_type
+        new_metadata["file_path"] = file.filename
+        new_metadata["file_size"] = file_size
+
+    # Reason: Chunk and embed before opening the transaction; the embedding
+    # calls can take seconds and must not pin a connection and a transaction
+    title = doc["title"]
+    source = doc["source"] or (file.filename if file and file.filename else "uploaded")
+    chunks = await chunker.chunk_document(
+        content=new_content,
+        title=title,
+        source=source,
+        metadata=new_metadata
+    )
+    embedded_chunks = await _embed_reusing_stored(embedder, document_id, chunks)
 
-            # Insert version snapshot
-            file_size = len(raw) if isinstance(raw, (bytes, bytearray)) else None
-            await conn.execute(
-                """
-                INSERT INTO document_versions (
-                    document_id, version, change_summary, content, metadata,
-                    file_path, file_mime, file_size, created_by
-                )
-                VALUES ($1::uuid, $2, $3, $4, $5::jsonb, $6, $7, $8, $9::uuid)
-                """,
+    async with db_pool.acquire() as conn:
+        async with conn.transaction():
+            # Update document row to current content/metadata and insert the
+            # version snapshots first; the guarded UPDATE takes the row lock
+            # and fails fast if the document changed since it was read
+            updated = await conn.fetchval(
+                _INSERT_VERSION_AND_UPDATE_DOCUMENT_SQL,
                 document_id,
                 new_version,
                 change_summary,
                 new_content,
-                json.dumps(new_metadata),
+                new_metadata,
                 file.filename if file else None,
                 file.content_type if file else None,
                 file_size,
                 created_by,
+                doc["updated_at"],
+                prev_ver if needs_baseline else None,
             )
+            if not updated:
+                await _raise_update_conflict(conn, document_id)
 
-            # Update document row to current content/metadata
-            await conn.execute(
-                """
-                UPDATE documents
-                SET content = $2,
-                    metadata = $3::jsonb,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = $1::uuid
-                """,
-                document_id,
-                new_content,
-                json.dumps(new_metadata),
-            )
+            # Replace chunks for this document
+            await replace_chunks(conn, document_id, embedded_chunks)
 
     return {"ok": True, "version": new_version}
 
 
+_LIST_VERSIONS_SQL = """
+    SELECT v.id::text AS version_id, v.version, v.change_summary, v.created_at,
+           v.created_by::text AS created_by,
+           COALESCE(a.full_name, a.username) AS created_by_name
+    FROM document_versions v
+    LEFT JOIN accounts a ON a.id = v.created_by
+    WHERE v.document_id = $1::uuid
+      AND ($2::timestamptz IS NULL OR (v.created_at, v.id) < ($2::timestamptz, $3::uuid))
+    ORDER BY v.created_at DESC, v.id DESC
+    LIMIT $4
+    """
+
+
 @app.get("/documents/{document_id}/versions")
-async def list_versions(document_id: str):
+async def list_versions(
+    document_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit for all versions"),
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page's X-Next-Cursor header"),
+):
+    after = _decode_cursor(cursor, datetime.fromisoformat)
     try:
         async with db_pool.acquire() as conn:
-            # Current doc row (to show current version at top)
-            doc = await conn.fetchrow(
-                "SELECT id::text AS id, metadata, updated_at FROM documents WHERE id = $1::uuid",
-                document_id,
-            )
-            current_meta = {}
-            if doc and doc["metadata"]:
-                if isinstance(doc["metadata"], str):
-                    try:
-                        current_meta = json.loads(doc["metadata"]) or {}
-                    except Exception:
-                        current_meta = {}
-                else:
-                    current_meta = dict(doc["metadata"])
-            current_version = current_meta.get("version")
-
+            # Current version marker at the top of the first page
+            head = []
+            if after is None:
+                doc = await conn.fetchrow(
+                    "SELECT metadata, updated_at FROM documents WHERE id = $1::uuid",
+                    document_id,
+                )
+                current_version = ((doc["metadata"] if doc else None) or {}).get("version")
+                if current_version:
+                    head = [{
+                        "version_id": None,
+                        "version": current_version,
+                        "change_summary": None,
+                        "created_at": doc["updated_at"],
+                        "created_by": None,
+                        "created_by_name": None,
+                        "is_current": True,
+                    }]
+
+            # Reason: The marker takes one slot of the first page
+            page_size = None if limit is None else limit - len(head)
             rows = await conn.fetch(
-                """
-                SELECT v.id::text AS version_id, v.version, v.change_summary, v.created_at,
-                       v.created_by::text AS created_by,
-                       COALESCE(a.full_name, a.username) AS created_by_name
-                FROM document_versions v
-                LEFT JOIN accounts a ON a.id = v.created_by
-                WHERE v.document_id = $1::uuid
-                ORDER BY v.created_at DESC
-                """,
+                _LIST_VERSIONS_SQL,
                 document_id,
+                *(after or (None, None)),
+                None if page_size is None else page_size + 1,
             )
-            out = [dict(r) for r in rows]
-            # Optionally include current version marker
-            if current_version:
-                out.insert(0, {
-                    "version_id": None,
-                    "version": current_version,
-                    "change_summary": None,
-                    "created_at": doc["updated_at"] if doc else None,
-                    "created_by": None,
-                    "created_by_name": None,
-                    "is_current": True,
-                })
-            return out
+
+            if page_size == 0 and rows:
+                # A one-item first page holds only the marker; continue from
+                # the newest version, inclusive of its timestamp
+                return _records_response(
+                    head, {NEXT_CURSOR_HEADER: _encode_cursor(rows[0]["created_at"], _LAST_UUID)}
+                )
+            return _page(rows, page_size, sort_key="created_at", key="version_id", head=head)
     except Exception as e:
         logger.error(f"list_versions failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1926,11 +2375,7 @@ async def get_version(document_id: str, version_id: str):
             if not row:
                 raise HTTPException(status_code=404, detail="Version not found")
             data = dict(row)
-            if isinstance(data.get("metadata"), str):
-                try:
-                    data["metadata"] = json.loads(data["metadata"]) or {}
-                except Exception:
-                    data["metadata"] = {}
+            data["metadata"] = data.get("metadata") or {}
             return data
     except HTTPException:
         raise
@@ -1939,6 +2384,118 @@ async def get_version(document_id: str, version_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _format_diff_range(start: int, stop: int) -> str:
+    """Format a line range in unified diff ("ed") notation."""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def _common_prefix_len(a: str, b: str) -> int:
+    """Length of the common prefix of two strings, by binary search over slice compares."""
+    low, high = 0, min(len(a), len(b))
+    mid, start = high, 0
+    while low < mid:
+        if a[start:mid] == b[start:mid]:
+            low = start = mid
+        else:
+            high = mid
+        mid = (high - low) // 2 + low
+    return mid
+
+
+def _common_suffix_len(a: str, b: str) -> int:
+    """Length of the common suffix of two strings, by binary search over slice compares."""
+    low, high = 0, min(len(a), len(b))
+    mid, end = high, 0
+    while low < mid:
+        if a[len(a) - mid:len(a) - end] == b[len(b) - mid:len(b) - end]:
+            low = end = mid
+        else:
+            high = mid
+        mid = (high - low) // 2 + low
+    return mid
+
+
+def _trim_common_lines(left: str, right: str, context: int) -> Tuple[List[str], List[str], int]:
+    """
+    Split only the differing middle of two texts into lines.
+
+    Whole lines shared at the start and end are skipped, except for
+    ``context`` lines on each side so hunks keep their context.
+
+    Returns:
+        Tuple of (left lines, right lines, number of skipped leading lines)
+    """
+    # Leading whole lines (up to the last newline inside the common prefix)
+    head = left.rfind("\n", 0, _common_prefix_len(left, right)) + 1
+    for _ in range(context):
+        if head == 0:
+            break
+        head = left.rfind("\n", 0, head - 1) + 1
+    # Reason: splitlines() also breaks on \r, \f, \v and friends, so count
+    # the skipped lines the same way the diffed lines are split
+    offset = len(left[:head].splitlines())
+
+    # Trailing whole lines, which must start on a line boundary in both texts
+    tail = _common_suffix_len(left[head:], right[head:])
+    left_end, right_end = len(left) - tail, len(right) - tail
+    if tail and not (
+        (left_end == head or left[left_end - 1] == "\n")
+        and (right_end == head or right[right_end - 1] == "\n")
+    ):
+        skip = left.find("\n", left_end) + 1
+        tail = len(left) - skip if skip else 0
+        left_end, right_end = len(left) - tail, len(right) - tail
+    for _ in range(context):
+        if not tail:
+            break
+        skip = left.find("\n", left_end) + 1
+        tail = len(left) - skip if skip else 0
+        left_end, right_end = len(left) - tail, len(right) - tail
+
+    return (
+        left[head:left_end].splitlines(keepends=True),
+        right[head:right_end].splitlines(keepends=True),
+        offset,
+    )
+
+
+def _unified_diff_str(left: str, right: str, fromfile: str, tofile: str, context: int = 3) -> str:
+    """
+    Build a unified diff of two texts in difflib.unified_diff's format.
+
+    Uses ``DiffMatcher`` (cdifflib when installed) for the line matching, on
+    the differing middle of the texts only. Kept at module level so it can
+    also run in a worker process.
+    """
+    if left == right:
+        return ""
+    a, b, offset = _trim_common_lines(left, right, context)
+    out: List[str] = []
+    for group in DiffMatcher(None, a, b).get_grouped_opcodes(context):
+        if not out:
+            out.append(f"--- {fromfile}\n")
+            out.append(f"+++ {tofile}\n")
+        first, last = group[0], group[-1]
+        old_range = _format_diff_range(first[1] + offset, last[2] + offset)
+        new_range = _format_diff_range(first[3] + offset, last[4] + offset)
+        out.append(f"@@ -{old_range} +{new_range} @@\n")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                out.extend(" " + line for line in a[i1:i2])
+                continue
+            if tag in ("replace", "delete"):
+                out.extend("-" + line for line in a[i1:i2])
+            if tag in ("replace", "insert"):
+                out.extend("+" + line for line in b[j1:j2])
+    return "".join(out)
+
+
 class CompareRequest(BaseModel):
     left_version_id: Optional[str] = None
     right_version_id: Optional[str] = None
@@ -1946,9 +2503,24 @@ class CompareRequest(BaseModel):
     right: Optional[str] = None # e.g., version id or 'current'
 
 
+async def compute_diff(left: str, right: str, fromfile: str, tofile: str) -> str:
+    """
+    Build a unified diff without blocking the event loop.
+
+    Small texts are diffed in a worker thread; texts over
+    DIFF_PROCESS_MIN_BYTES go to a process pool.
+    """
+    global _diff_executor
+    if len(left) + len(right) < DIFF_PROCESS_MIN_BYTES or left == right:
+        return await asyncio.to_thread(_unified_diff_str, left, right, fromfile, tofile)
+    if _diff_executor is None:
+        _diff_executor = ProcessPoolExecutor(max_workers=DIFF_WORKERS)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_diff_executor, _unified_diff_str, left, right, fromfile, tofile)
+
+
 @app.post("/documents/{document_id}/versions/compare")
 async def compare_versions(document_id: str, payload: CompareRequest):
-    import difflib
     try:
         async with db_pool.acquire() as conn:
             # Resolve contents
@@ -1973,10 +2545,10 @@ async def compare_versions(document_id: str, payload: CompareRequest):
             left = await get_content(left_sel)
             right = await get_content(right_sel)
 
-            left_lines = (left or "").splitlines(keepends=True)
-            right_lines = (right or "").splitlines(keepends=True)
-            diff = difflib.unified_diff(left_lines, right_lines, fromfile=str(left_sel), tofile=str(right_sel))
-            return {"diff": "".join(diff)}
+        # Reason: Diffing is CPU-bound; run it after releasing the connection
+        # and off the event loop
+        diff = await compute_diff(left or "", right or "", str(left_sel), str(right_sel))
+        return {"diff": diff}
     except HTTPException:
         raise
     except Exception as e:
@@ -1988,86 +2560,45 @@ async def compare_versions(document_id: str, payload: CompareRequest):
 async def rollback_version(document_id: str, version_id: str, request: Request):
     """Rollback by restoring the selected version as the current document (no new version created)."""
     # Prepare chunker & embedder
-    config = IngestionConfig()
-    chunker = create_chunker(ChunkingConfig(
-        chunk_size=config.chunk_size,
-        chunk_overlap=config.chunk_overlap,
-        max_chunk_size=config.max_chunk_size,
-        use_semantic_splitting=config.use_semantic_chunking
-    ))
-    embedder = create_embedder()
+    chunker = _shared_chunker()
+    embedder = _shared_embedder()
 
+    # Read the target snapshot together with the current document's title/source
     async with db_pool.acquire() as conn:
-        async with conn.transaction():
-            # Get target version snapshot
-            ver = await conn.fetchrow(
-                """
-                SELECT version, content, metadata
-                FROM document_versions
-                WHERE document_id=$1::uuid AND id=$2::uuid
-                """,
-                document_id, version_id,
-            )
-            if not ver:
-                raise HTTPException(status_code=404, detail="Version not found")
-            old_content = ver["content"] or ""
-            old_meta = ver["metadata"]
-            if isinstance(old_meta, str):
-                try:
-                    old_meta = json.loads(old_meta)
-                except Exception:
-                    old_meta = {}
-
-            # Current doc for title/source
-            doc = await _get_document_core(conn, document_id)
-            if not doc:
-                raise HTTPException(status_code=404, detail="Document not found")
-
-            new_metadata = dict(old_meta or {})
-
-            # Chunk and embed
-            title = doc["title"]
-            source = doc["source"] or "rollback"
-            chunks = await chunker.chunk_document(
-                content=old_content,
-                title=title,
-                source=source,
-                metadata=new_metadata
-            )
-            embedded_chunks = await embedder.embed_chunks(chunks)
-
-            # Replace chunks
-            await conn.execute("DELETE FROM chunks WHERE document_id = $1::uuid", document_id)
-            for ch in embedded_chunks:
-                embedding_data = None
-                if getattr(ch, "embedding", None):
-                    embedding_data = "[" + ",".join(map(str, ch.embedding)) + "]"
-                await conn.execute(
-                    """
-                    INSERT INTO chunks (document_id, content, embedding, chunk_index, metadata, token_count)
-                    VALUES ($1::uuid, $2, $3::vector, $4, $5, $6)
-                    """,
-                    document_id,
-                    ch.content,
-                    embedding_data,
-                    ch.index,
-                    json.dumps(getattr(ch, "metadata", {})),
-                    getattr(ch, "token_count", None),
-                )
+        ver = await conn.fetchrow(_ROLLBACK_SOURCE_SQL, document_id, version_id)
+    if not ver or ver["version"] is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+
+    old_content = ver["content"] or ""
+    new_metadata = dict(ver["metadata"] or {})
+
+    # Chunk and embed outside the transaction
+    title = ver["title"]
+    source = ver["source"] or "rollback"
+    chunks = await chunker.chunk_document(
+        content=old_content,
+        title=title,
+        source=source,
+        metadata=new_metadata
+    )
+    embedded_chunks = await _embed_reusing_stored(embedder, document_id, chunks)
 
-            # Update documents
-            await conn.execute(
-                """
-                UPDATE documents
-                SET content = $2,
-                    metadata = $3::jsonb,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = $1::uuid
-                """,
+    async with db_pool.acquire() as conn:
+        async with conn.transaction():
+            # Update documents first; the guarded UPDATE takes the row lock
+            # and fails fast if the document changed since it was read
+            updated = await conn.fetchval(
+                _UPDATE_DOCUMENT_CONTENT_SQL,
                 document_id,
                 old_content,
-                json.dumps(new_metadata),
+                new_metadata,
+                ver["updated_at"],
             )
+            if not updated:
+                await _raise_update_conflict(conn, document_id)
+
+            # Replace chunks
+            await replace_chunks(conn, document_id, embedded_chunks)
 
     return {"ok": True, "version": ver["version"]}
 
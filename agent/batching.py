@@ -0,0 +1,188 @@
+"""
+Micro-batching utilities for coalescing concurrent requests.
+"""
+
+import asyncio
+import functools
+import logging
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class BatchScheduler(Generic[T, R]):
+    """
+    Coalesce concurrent submissions into batched calls.
+
+    Items submitted while the worker is collecting are grouped until either
+    ``max_batch`` items are queued or ``max_wait_ms`` has elapsed since the
+    first item arrived, then handed to ``batch_fn`` in a single call.
+    ``batch_fn`` must return one result per item, in submission order.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[T]], Awaitable[Sequence[R]]],
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "batch"
+    ):
+        """
+        Initialize batch scheduler.
+
+        Args:
+            batch_fn: Coroutine function processing a list of items
+            max_batch: Maximum number of items per batch
+            max_wait_ms: Maximum time to wait for a batch to fill
+            name: Name used in log messages
+        """
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+
+    @property
+    def running(self) -> bool:
+        """Whether the background worker is active."""
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """Start the background worker on the running event loop."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"{self.name} scheduler started")
+
+    async def stop(self):
+        """Stop the background worker, failing any pending submissions."""
+        if not self._worker:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        while self._queue and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} scheduler stopped"))
+        self._queue = None
+        logger.info(f"{self.name} scheduler stopped")
+
+    async def submit(self, item: T) -> R:
+        """
+        Submit an item and wait for its result.
+
+        Falls back to a direct single-item call when the worker is not running
+        (e.g. in scripts and tests that never start the scheduler).
+
+        Args:
+            item: Item to process
+
+        Returns:
+            Result for the item
+        """
+        if not self.running:
+            results = await self.batch_fn([item])
+            return results[0]
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self, batch: List[Tuple[T, asyncio.Future]]):
+        """Wait for the first item, then gather more until full or timed out."""
+        batch.append(await self._queue.get())
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self):
+        """Worker loop dispatching collected batches."""
+        while True:
+            batch: List[Tuple[T, asyncio.Future]] = []
+            try:
+                await self._collect(batch)
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"{self.name} scheduler stopped"))
+                raise
+            # Reason: Dispatch without awaiting so the next batch can be
+            # collected while this one waits on the network.
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[T, asyncio.Future]]):
+        """Run the batch function and resolve each submitter's future."""
+        items = [item for item, _ in batch]
+        try:
+            results = await self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"{self.name} batch returned {len(results)} results for {len(items)} items"
+                )
+        except Exception as e:
+            logger.error(f"{self.name} batch of {len(items)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def single_flight(key_fn: Callable[..., Any]):
+    """
+    Share one in-flight call among concurrent callers with the same key.
+
+    While a call for a key is running, later callers await its result (or
+    exception) instead of starting their own. The call runs as a task, so a
+    caller being cancelled does not cancel it for the others.
+
+    Args:
+        key_fn: Maps the call's arguments to a hashable key
+    """
+    def decorator(fn: Callable[..., Awaitable[R]]) -> Callable[..., Awaitable[R]]:
+        inflight: Dict[Any, asyncio.Future] = {}
+
+        def forget(key: Any, task: asyncio.Future):
+            if inflight.get(key) is task:
+                del inflight[key]
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs) -> R:
+            key = key_fn(*args, **kwargs)
+            task = inflight.get(key)
+            # Reason: A task left over from another (e.g. closed test) loop cannot be awaited here
+            if task is None or task.get_loop() is not asyncio.get_running_loop():
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                inflight[key] = task
+                task.add_done_callback(functools.partial(forget, key))
+            return await asyncio.shield(task)
+
+        return wrapper
+
+    return decorator
@@ -3,25 +3,160 @@ Database utilities for PostgreSQL connection and operations.
 """
 
 import os
-import json
+import re
 import asyncio
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta, timezone
 from contextlib import asynccontextmanager
-from uuid import UUID
+from uuid import UUID, uuid4
 import logging
 import hashlib
+import hmac
+import struct
 
 import asyncpg
+import numpy as np
+import orjson
 from asyncpg.pool import Pool
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
+from .batching import BatchScheduler, single_flight
+
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 
+# pgvector binary wire format: uint16 dimensions, uint16 unused, float4[] big-endian
+_VECTOR_HEADER = struct.Struct(">HH")
+
+
+def encode_vector(value: Any) -> bytes:
+    """
+    Encode an embedding in pgvector's binary format.
+
+    Args:
+        value: Sequence of floats, numpy array, '[a,b]' literal, or bytes
+            already produced by pack_vectors
+
+    Returns:
+        Binary vector payload
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if isinstance(value, str):
+        value = orjson.loads(value)
+    array = np.asarray(value, dtype=">f4")
+    return _VECTOR_HEADER.pack(array.shape[0], 0) + array.tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """Decode a pgvector binary payload into a float32 array."""
+    dimensions, _ = _VECTOR_HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=">f4", count=dimensions, offset=4).astype(np.float32)
+
+
+def pack_vectors(embeddings: List[Any]) -> List[Optional[bytes]]:
+    """
+    Encode many embeddings at once.
+
+    Converts all vectors to big-endian float32 in a single numpy call and
+    slices the result, instead of converting each embedding separately.
+
+    Args:
+        embeddings: Embeddings; None or empty entries stay None
+
+    Returns:
+        Binary vector payloads in input order
+    """
+    packed: List[Optional[bytes]] = [None] * len(embeddings)
+    present = [i for i, e in enumerate(embeddings) if e is not None and len(e)]
+    if not present:
+        return packed
+
+    try:
+        matrix = np.asarray([embeddings[i] for i in present], dtype=">f4")
+    except ValueError:
+        # Ragged dimensions; let the database reject them row by row
+        for i in present:
+            packed[i] = encode_vector(embeddings[i])
+        return packed
+
+    header = _VECTOR_HEADER.pack(matrix.shape[1], 0)
+    for i, row in zip(present, matrix):
+        packed[i] = header + row.tobytes()
+    return packed
+
+
+# jsonb binary wire format: a version byte (1) followed by the JSON text
+_JSONB_VERSION = b"\x01"
+
+
+def encode_jsonb(value: Any) -> bytes:
+    """
+    Encode a value as binary jsonb.
+
+    Args:
+        value: Python object to serialize, or already-serialized JSON as str/bytes
+
+    Returns:
+        Binary jsonb payload
+    """
+    if isinstance(value, str):
+        return _JSONB_VERSION + value.encode("utf-8")
+    if isinstance(value, (bytes, bytearray)):
+        return _JSONB_VERSION + bytes(value)
+    return _JSONB_VERSION + orjson.dumps(value)
+
+
+def decode_jsonb(data: bytes) -> Any:
+    """Decode a binary jsonb payload into Python objects."""
+    return orjson.loads(data[1:])
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    """Register the vector and jsonb codecs on a freshly opened connection."""
+    # Reason: Codecs must be set before any statement is prepared, since
+    # set_type_codec invalidates statements prepared earlier on the connection
+    try:
+        await conn.set_type_codec(
+            "vector",
+            schema="public",
+            encoder=encode_vector,
+            decoder=decode_vector,
+            format="binary"
+        )
+    except ValueError as e:
+        logger.warning(f"pgvector type not available, vector codec not registered: {e}")
+    # Reason: jsonb values cross the wire as dicts in both directions and
+    # are (de)serialized once by orjson, with no text casts
+    await conn.set_type_codec(
+        "jsonb",
+        schema="pg_catalog",
+        encoder=encode_jsonb,
+        decoder=decode_jsonb,
+        format="binary"
+    )
+
+
+# Pool sizing; min == max keeps every connection open so requests never pay
+# for connection setup. Size it per process to the expected concurrent
+# queries (worker processes x DB_POOL_MAX_SIZE must fit max_connections)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "16"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", str(max(DB_POOL_MIN_SIZE, 16))))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "60"))
+# asyncpg prepares each statement text on first use and caches it per
+# connection; the cache must hold every query the app issues
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "2048"))
+DB_STATEMENT_CACHE_LIFETIME = float(os.getenv("DB_STATEMENT_CACHE_LIFETIME", "3600"))
+# Connections are replaced after this many queries, bounding the backend's
+# per-session memory (plan and catalog caches) on long-lived pools
+DB_MAX_QUERIES = int(os.getenv("DB_MAX_QUERIES", "50000"))
+
+
 class DatabasePool:
     """Manages PostgreSQL connection pool."""
     
@@ -43,10 +178,14 @@ class DatabasePool:
         if not self.pool:
             self.pool = await asyncpg.create_pool(
                 self.database_url,
-                min_size=5,
-                max_size=20,
-                max_inactive_connection_lifetime=300,
-                command_timeout=60
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+                command_timeout=DB_COMMAND_TIMEOUT,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                max_cached_statement_lifetime=DB_STATEMENT_CACHE_LIFETIME,
+                max_queries=DB_MAX_QUERIES,
+                init=_init_connection
             )
             logger.info("Database connection pool initialized")
     
@@ -82,12 +221,56 @@ async def close_database():
 
 
 # Account Management Functions
+ACCOUNT_CACHE_SIZE = int(os.getenv("ACCOUNT_CACHE_SIZE", "1024"))
+ACCOUNT_CACHE_TTL = float(os.getenv("ACCOUNT_CACHE_TTL", "5"))
+
+# Short-lived username -> account cache for login bursts; passwords are still
+# verified against the cached hash on every attempt
+_account_cache: TTLCache = TTLCache(maxsize=ACCOUNT_CACHE_SIZE, ttl=ACCOUNT_CACHE_TTL)
+
+
+def invalidate_account_cache(account_id: Optional[str] = None) -> None:
+    """
+    Drop cached account lookups.
+
+    Args:
+        account_id: Only drop entries for this account; drops all when omitted
+    """
+    if account_id is None:
+        _account_cache.clear()
+        return
+    for username in [u for u, a in _account_cache.items() if a["id"] == account_id]:
+        _account_cache.pop(username, None)
+
+
+_SHA256_HEX_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+
 def _sha256(password: str) -> str:
     return hashlib.sha256(password.encode("utf-8")).hexdigest()
 
 
 async def get_account_by_username(username: str) -> Optional[Dict[str, Any]]:
     """Fetch account by username from accounts table (if exists)."""
+    account = _account_cache.get(username)
+    if account is None:
+        account = await _load_account(username)
+    return _with_pending_login(account)
+
+
+def _with_pending_login(account: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Overlay a login not yet flushed, which is newer than the stored timestamp."""
+    if account is None:
+        return None
+    logged_in_at = _last_login_pending.get(account["id"])
+    if logged_in_at is None:
+        return account
+    return {**account, "last_login_at": logged_in_at.isoformat()}
+
+
+# Reason: Concurrent cache misses for one user (e.g. a login burst) share a query
+@single_flight(lambda username: username)
+async def _load_account(username: str) -> Optional[Dict[str, Any]]:
     async with db_pool.acquire() as conn:
         try:
             row = await conn.fetchrow(
@@ -104,13 +287,9 @@ async def get_account_by_username(username: str) -> Optional[Dict[str, Any]]:
             return None
         if not row:
             return None
-        meta_val = row["metadata"]
-        if isinstance(meta_val, str):
-            try:
-                meta_val = json.loads(meta_val)
-            except Exception:
-                meta_val = {}
-        return {
+        meta_val = row["metadata"] or {}
+        last_login_at = row["last_login_at"]
+        account = {
             "id": row["id"],
             "username": row["username"],
             "password_hash": row["password_hash"],
@@ -120,11 +299,13 @@ async def get_account_by_username(username: str) -> Optional[Dict[str, Any]]:
             "title": row["title"],
             "role": row["role"],
             "is_active": row["is_active"],
-            "last_login_at": row["last_login_at"].isoformat() if row["last_login_at"] else None,
+            "last_login_at": last_login_at.isoformat() if last_login_at else None,
             "created_at": row["created_at"].isoformat() if row["created_at"] else None,
             "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None,
             "metadata": meta_val or {},
         }
+        _account_cache[username] = account
+        return account
 
 
 def verify_password(password: str, stored_hash: str) -> bool:
@@ -139,18 +320,71 @@ def verify_password(password: str, stored_hash: str) -> bool:
         except Exception:
             return False
     # sha256 hex
-    if len(stored_hash) == 64 and all(c in "0123456789abcdef" for c in stored_hash.lower()):
-        return _sha256(password) == stored_hash
+    # Reason: A per-character scan cost more than the digest itself
+    if _SHA256_HEX_RE.fullmatch(stored_hash):
+        return hmac.compare_digest(_sha256(password), stored_hash)
     # dev fallback: plaintext
     return password == stored_hash
 
 
+# Logins are recorded in memory and written at most once per interval, so
+# a burst of logins costs one UPDATE instead of one per login
+LAST_LOGIN_FLUSH_INTERVAL = float(os.getenv("LAST_LOGIN_FLUSH_INTERVAL", "30"))
+_last_login_pending: Dict[str, datetime] = {}
+_last_login_flush: Optional[asyncio.Task] = None
+
+
 async def touch_last_login(account_id: str) -> None:
-    async with db_pool.acquire() as conn:
-        try:
-            await conn.execute("UPDATE accounts SET last_login_at = CURRENT_TIMESTAMP WHERE id=$1::uuid", account_id)
-        except Exception as e:
-            logger.debug(f"touch_last_login failed: {e}")
+    """Record a login; the timestamp is written by the next flush."""
+    global _last_login_flush
+    # Reason: Lookups overlay the pending timestamp on cached accounts, so a
+    # login neither lags nor evicts the account cache
+    _last_login_pending[account_id] = datetime.now(timezone.utc)
+    if (
+        _last_login_flush is None
+        or _last_login_flush.done()
+        or _last_login_flush.get_loop() is not asyncio.get_running_loop()
+    ):
+        _last_login_flush = asyncio.create_task(_flush_last_logins_later())
+
+
+async def _flush_last_logins_later() -> None:
+    # Reason: Logins recorded while a flush ran are written by the next round
+    while _last_login_pending:
+        await asyncio.sleep(LAST_LOGIN_FLUSH_INTERVAL)
+        await flush_last_logins()
+
+
+async def flush_last_logins() -> None:
+    """Write the pending last-login timestamps with a single UPDATE."""
+    if not _last_login_pending:
+        return
+    pending = list(_last_login_pending.items())
+
+    try:
+        async with db_pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE accounts a SET last_login_at = u.logged_in_at
+                FROM unnest($1::uuid[], $2::timestamptz[]) AS u(id, logged_in_at)
+                WHERE a.id = u.id
+                """,
+                [account_id for account_id, _ in pending],
+                [logged_in_at for _, logged_in_at in pending]
+            )
+    except Exception as e:
+        # Reason: Entries stay pending until written, so the next round retries them
+        logger.warning(f"Failed to write last_login_at for {len(pending)} accounts: {e}")
+        return
+    # Reason: Newer logins recorded during the write stay for the next flush
+    written = set()
+    for account_id, logged_in_at in pending:
+        if _last_login_pending.get(account_id) == logged_in_at:
+            del _last_login_pending[account_id]
+            written.add(account_id)
+    # Cached rows predate the write; evict them so the overlay is not lost
+    for username in [u for u, a in _account_cache.items() if a["id"] in written]:
+        _account_cache.pop(username, None)
 
 
 async def create_default_accounts_if_missing() -> None:
@@ -177,6 +411,14 @@ async def create_default_accounts_if_missing() -> None:
 
 
 # Session Management Functions
+SESSION_READ_CACHE_SIZE = int(os.getenv("SESSION_READ_CACHE_SIZE", "10000"))
+SESSION_READ_CACHE_TTL = float(os.getenv("SESSION_READ_CACHE_TTL", "30"))
+
+# session_id -> (expires_at, session) for recently read sessions; expiry is
+# re-checked on every hit, and writes in this process evict the entry
+_session_cache: TTLCache = TTLCache(maxsize=SESSION_READ_CACHE_SIZE, ttl=SESSION_READ_CACHE_TTL)
+
+
 async def create_session(
     user_id: Optional[str] = None,
     metadata: Optional[Dict[str, Any]] = None,
@@ -203,49 +445,107 @@ async def create_session(
             RETURNING id::text
             """,
             user_id,
-            json.dumps(metadata or {}),
+            metadata or {},
             expires_at
         )
         
         return result["id"]
 
 
-async def get_session(session_id: str) -> Optional[Dict[str, Any]]:
+async def touch_session(session_id: str) -> Optional[Dict[str, Any]]:
     """
-    Get session by ID.
-    
+    Mark an existing, unexpired session as used.
+
+    A session in the read cache is returned without a query; otherwise a
+    single UPDATE both checks the session and bumps its updated_at.
+
     Args:
         session_id: Session UUID
-    
+
     Returns:
-        Session data or None if not found/expired
+        Session data, or None if the session is missing or expired
     """
+    cached = _session_cache.get(session_id)
+    if cached is not None:
+        return _unexpired_session(session_id, cached)
     async with db_pool.acquire() as conn:
         result = await conn.fetchrow(
             """
-            SELECT 
-                id::text,
-                user_id,
-                metadata,
-                created_at,
-                updated_at,
-                expires_at
-            FROM sessions
+            UPDATE sessions
+            SET updated_at = CURRENT_TIMESTAMP
             WHERE id = $1::uuid
             AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+            RETURNING id::text, user_id, metadata, created_at, updated_at, expires_at
             """,
             session_id
         )
+    return _cache_session(session_id, result) if result else None
+
+
+_GET_SESSION_SQL = """
+    SELECT 
+        id::text,
+        user_id,
+        metadata,
+        created_at,
+        updated_at,
+        expires_at
+    FROM sessions
+    WHERE id = $1::uuid
+    AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+    """
+
+
+async def get_session(session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get session by ID.
+    
+    Args:
+        session_id: Session UUID
+    
+    Returns:
+        Session data or None if not found/expired
+    """
+    cached = _session_cache.get(session_id)
+    if cached is not None:
+        return _unexpired_session(session_id, cached)
+    return await _load_session(session_id)
+
+
+def _unexpired_session(
+    session_id: str,
+    cached: Tuple[Optional[datetime], Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """Return a cached session, or drop it and return None once it has expired."""
+    expires_at, session = cached
+    if expires_at is None or expires_at > datetime.now(timezone.utc):
+        return session
+    _session_cache.pop(session_id, None)
+    return None
+
+
+def _cache_session(session_id: str, result) -> Dict[str, Any]:
+    """Build the session dict from a sessions row and cache it until it expires."""
+    session = {
+        "id": result["id"],
+        "user_id": result["user_id"],
+        "metadata": result["metadata"],
+        "created_at": result["created_at"].isoformat(),
+        "updated_at": result["updated_at"].isoformat(),
+        "expires_at": result["expires_at"].isoformat() if result["expires_at"] else None
+    }
+    _session_cache[session_id] = (result["expires_at"], session)
+    return session
+
+
+# Reason: Concurrent cache misses for one session (e.g. parallel SSE streams) share a query
+@single_flight(lambda session_id: session_id)
+async def _load_session(session_id: str) -> Optional[Dict[str, Any]]:
+    async with db_pool.acquire() as conn:
+        result = await conn.fetchrow(_GET_SESSION_SQL, session_id)
         
         if result:
-            return {
-                "id": result["id"],
-                "user_id": result["user_id"],
-                "metadata": json.loads(result["metadata"]),
-                "created_at": result["created_at"].isoformat(),
-                "updated_at": result["updated_at"].isoformat(),
-                "expires_at": result["expires_at"].isoformat() if result["expires_at"] else None
-            }
+            return _cache_session(session_id, result)
         
         return None
 
@@ -270,13 +570,100 @@ async def update_session(session_id: str, metadata: Dict[str, Any]) -> bool:
             AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
             """,
             session_id,
-            json.dumps(metadata)
+            metadata
         )
-        
-        return result.split()[-1] != "0"
+    _session_cache.pop(session_id, None)
+    
+    return result.split()[-1] != "0"
 
 
 # Message Management Functions
+# Reason: clock_timestamp() advances per row, keeping the messages ordered
+# by created_at (CURRENT_TIMESTAMP would give them all the same value)
+_ADD_MESSAGES_SQL = """
+    INSERT INTO messages (id, session_id, role, content, metadata, created_at)
+    SELECT m.id, m.session_id, m.role, m.content, m.metadata, clock_timestamp()
+    FROM unnest($1::uuid[], $2::uuid[], $3::text[], $4::text[], $5::jsonb[])
+        WITH ORDINALITY AS m(id, session_id, role, content, metadata, ord)
+    ORDER BY m.ord
+    """
+
+_MANY_RECENT_MESSAGES_SQL = """
+    SELECT s.ord, m.role, m.content
+    FROM unnest($1::uuid[]) WITH ORDINALITY AS s(id, ord)
+    CROSS JOIN LATERAL (
+        SELECT role, content, created_at
+        FROM messages
+        WHERE session_id = s.id
+        ORDER BY created_at DESC
+        LIMIT $2
+    ) m
+    ORDER BY s.ord, m.created_at
+    """
+
+
+async def _insert_messages(groups: List[Tuple[str, List[Dict[str, Any]]]]) -> List[List[str]]:
+    """Insert the messages of several sessions with one statement."""
+    session_ids, message_ids, roles, contents, metadatas = [], [], [], [], []
+    for session_id, messages in groups:
+        for m in messages:
+            session_ids.append(session_id)
+            message_ids.append(uuid4())
+            roles.append(m["role"])
+            contents.append(m["content"])
+            metadatas.append(m.get("metadata") or {})
+
+    async with db_pool.acquire() as conn:
+        await conn.fetch(_ADD_MESSAGES_SQL, message_ids, session_ids, roles, contents, metadatas)
+
+    ids = iter(message_ids)
+    return [[str(next(ids)) for _ in messages] for _, messages in groups]
+
+
+async def _write_message_groups(
+    groups: List[Tuple[str, List[Dict[str, Any]]]]
+) -> List[Any]:
+    """
+    Batch function for the message writer.
+
+    Returns:
+        Message IDs per group, or the exception that group's write raised
+    """
+    try:
+        return await _insert_messages(groups)
+    except Exception as e:
+        if len(groups) == 1:
+            raise
+        # Reason: One bad session id (e.g. deleted mid-turn) must not fail
+        # the unrelated writes it happened to be batched with
+        logger.warning(f"Batched message write of {len(groups)} sessions failed, retrying singly: {e}")
+
+    results: List[Any] = []
+    for group in groups:
+        try:
+            results.extend(await _insert_messages([group]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+# Coalesces message writes from concurrent turns into one INSERT
+message_write_scheduler = BatchScheduler(
+    _write_message_groups,
+    max_batch=int(os.getenv("MESSAGE_MAX_BATCH", "256")),
+    max_wait_ms=float(os.getenv("MESSAGE_MAX_WAIT_MS", "2")),
+    name="message_write"
+)
+
+
+async def _submit_messages(session_id: str, messages: List[Dict[str, Any]]) -> List[str]:
+    """Queue messages on the writer and wait until they are stored."""
+    result = await message_write_scheduler.submit((session_id, messages))
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
 async def add_message(
     session_id: str,
     role: str,
@@ -295,20 +682,46 @@ async def add_message(
     Returns:
         Message ID
     """
-    async with db_pool.acquire() as conn:
-        result = await conn.fetchrow(
-            """
-            INSERT INTO messages (session_id, role, content, metadata)
-            VALUES ($1::uuid, $2, $3, $4)
-            RETURNING id::text
-            """,
-            session_id,
-            role,
-            content,
-            json.dumps(metadata or {})
-        )
-        
-        return result["id"]
+    message_ids = await _submit_messages(
+        session_id,
+        [{"role": role, "content": content, "metadata": metadata}]
+    )
+    return message_ids[0]
+
+
+async def add_messages_bulk(
+    session_id: str,
+    messages: List[Dict[str, Any]]
+) -> List[str]:
+    """
+    Add several messages to a session in order with a single INSERT.
+
+    Args:
+        session_id: Session UUID
+        messages: Messages with role, content and optional metadata, in order
+
+    Returns:
+        Message IDs in input order
+    """
+    if not messages:
+        return []
+
+    return await _submit_messages(session_id, messages)
+
+
+# Reason: LIMIT NULL means no limit, so one statement serves every call
+_SESSION_MESSAGES_SQL = """
+    SELECT 
+        id::text,
+        role,
+        content,
+        metadata,
+        created_at
+    FROM messages
+    WHERE session_id = $1::uuid
+    ORDER BY created_at
+    LIMIT $2
+    """
 
 
 async def get_session_messages(
@@ -326,172 +739,264 @@ async def get_session_messages(
         List of messages ordered by creation time
     """
     async with db_pool.acquire() as conn:
-        query = """
-            SELECT 
-                id::text,
-                role,
-                content,
-                metadata,
-                created_at
-            FROM messages
-            WHERE session_id = $1::uuid
-            ORDER BY created_at
-        """
-        
-        if limit:
-            query += f" LIMIT {limit}"
-        
-        results = await conn.fetch(query, session_id)
+        results = await conn.fetch(_SESSION_MESSAGES_SQL, session_id, limit or None)
         
         return [
             {
                 "id": row["id"],
                 "role": row["role"],
                 "content": row["content"],
-                "metadata": json.loads(row["metadata"]),
+                "metadata": row["metadata"],
                 "created_at": row["created_at"].isoformat()
             }
             for row in results
         ]
 
 
+async def get_many_session_messages(
+    session_ids: List[str],
+    limit_each: int = 20
+) -> List[List[Dict[str, str]]]:
+    """
+    Get the most recent messages of several sessions in one round-trip.
+
+    Args:
+        session_ids: Session UUIDs
+        limit_each: Maximum number of messages per session
+
+    Returns:
+        One message list per session, in input order, each chronological
+    """
+    if not session_ids:
+        return []
+
+    async with db_pool.acquire() as conn:
+        results = await conn.fetch(_MANY_RECENT_MESSAGES_SQL, session_ids, limit_each)
+
+        grouped: List[List[Dict[str, str]]] = [[] for _ in session_ids]
+        for row in results:
+            grouped[row["ord"] - 1].append({
+                "role": row["role"],
+                "content": row["content"]
+            })
+        return grouped
+
+
 # Document Management Functions
-async def get_document(document_id: str) -> Optional[Dict[str, Any]]:
+_GET_DOCUMENTS_SQL = """
+    SELECT 
+        d.id::text AS id,
+        d.title,
+        d.source,
+        d.content,
+        /* merge normalized columns and lookup names into metadata for UI */
+        (d.metadata 
+          || jsonb_build_object(
+                'author_id', d.author_id::text,
+                'author', COALESCE(a.full_name, a.username),
+                'effective_date', to_char(d.effective_date, 'YYYY-MM-DD'),
+                'document_type_id', d.document_type_id::text,
+                'issuing_unit_id', d.issuing_unit_id::text,
+                'site_id', d.site_id::text,
+                'document_type_name', COALESCE(dt.name, NULL),
+                'issuing_unit_name', COALESCE(ou.name, NULL),
+                'site_name', COALESCE(s.name, NULL)
+            )
+        ) AS metadata,
+        d.created_at,
+        d.updated_at
+    FROM documents d
+    LEFT JOIN document_types dt ON dt.id = d.document_type_id
+    LEFT JOIN org_units ou ON ou.id = d.issuing_unit_id
+    LEFT JOIN sites s ON s.id = d.site_id
+    LEFT JOIN accounts a ON a.id = d.author_id
+    WHERE d.id = ANY($1::uuid[]) AND d.status <> 'loading'
     """
-    Get document by ID.
+
+
+async def get_documents(document_ids: List[str]) -> List[Any]:
+    """
+    Get several documents by ID with a single query.
     
     Args:
-        document_id: Document UUID
+        document_ids: Document UUIDs; duplicates are allowed
     
     Returns:
-        Document data or None if not found
+        Per input ID, the document data, None if not found, or the
+        ValueError for an ID that is not a UUID
     """
-    async with db_pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            SELECT 
-                d.id::text AS id,
-                d.title,
-                d.source,
-                d.content,
-                /* merge normalized columns and lookup names into metadata for UI */
-                (d.metadata 
-                  || jsonb_build_object(
-                        'author_id', d.author_id::text,
-                        'author', COALESCE(a.full_name, a.username),
-                        'effective_date', to_char(d.effective_date, 'YYYY-MM-DD'),
-                        'document_type_id', d.document_type_id::text,
-                        'issuing_unit_id', d.issuing_unit_id::text,
-                        'site_id', d.site_id::text,
-                        'document_type_name', COALESCE(dt.name, NULL),
-                        'issuing_unit_name', COALESCE(ou.name, NULL),
-                        'site_name', COALESCE(s.name, NULL)
-                    )
-                ) AS metadata,
-                d.created_at,
-                d.updated_at
-            FROM documents d
-            LEFT JOIN document_types dt ON dt.id = d.document_type_id
-            LEFT JOIN org_units ou ON ou.id = d.issuing_unit_id
-            LEFT JOIN sites s ON s.id = d.site_id
-            LEFT JOIN accounts a ON a.id = d.author_id
-            WHERE d.id = $1::uuid
-            """,
-            document_id
-        )
-
-        if not row:
-            return None
-        meta_val = row["metadata"]
-        if isinstance(meta_val, str):
-            try:
-                meta_val = json.loads(meta_val)
-            except Exception:
-                meta_val = {}
-        return {
+    parsed: List[Any] = []
+    for document_id in document_ids:
+        try:
+            parsed.append(UUID(str(document_id)))
+        except ValueError as e:
+            parsed.append(ValueError(f"invalid document id {document_id!r}: {e}"))
+    
+    wanted = list({p for p in parsed if isinstance(p, UUID)})
+    rows = []
+    if wanted:
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch(_GET_DOCUMENTS_SQL, wanted)
+    
+    documents = {
+        UUID(row["id"]): {
             "id": row["id"],
             "title": row["title"],
             "source": row["source"],
             "content": row["content"],
-            "metadata": meta_val or {},
+            "metadata": row["metadata"] or {},
             "created_at": row["created_at"].isoformat() if row["created_at"] else None,
             "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None,
         }
+        for row in rows
+    }
+    return [p if isinstance(p, ValueError) else documents.get(p) for p in parsed]
+
+
+# Coalesces concurrent single-document reads into one ANY() query
+document_read_scheduler = BatchScheduler(
+    get_documents,
+    max_batch=int(os.getenv("DOCUMENT_MAX_BATCH", "64")),
+    max_wait_ms=float(os.getenv("DOCUMENT_MAX_WAIT_MS", "2")),
+    name="document_read"
+)
+
+
+async def get_document(document_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get document by ID.
+    
+    Args:
+        document_id: Document UUID
+    
+    Returns:
+        Document data or None if not found
+    """
+    document = await _load_document(document_id)
+    if document is None:
+        return None
+    # Reason: Coalesced callers receive the same dict; copy it so one caller's
+    # edits (e.g. attaching chunks) never leak into another's result
+    return {**document, "metadata": dict(document["metadata"])}
+
+
+# Reason: Concurrent reads of one document share a single batch slot
+@single_flight(lambda document_id: document_id)
+async def _load_document(document_id: str) -> Optional[Dict[str, Any]]:
+    document = await document_read_scheduler.submit(document_id)
+    if isinstance(document, ValueError):
+        raise document
+    return document
+
+
+def start_db_schedulers():
+    """Start the read and write micro-batching workers on the running event loop."""
+    document_read_scheduler.start()
+    message_write_scheduler.start()
+    # Reason: Finish an index rebuild that a crash or failed build left pending
+    schedule_vector_index_rebuild()
+
+
+async def stop_db_schedulers():
+    """Stop the micro-batching workers and index rebuild, and write pending logins."""
+    await document_read_scheduler.stop()
+    await message_write_scheduler.stop()
+    await _cancel_vector_index_rebuild()
+    if _last_login_flush is not None and not _last_login_flush.done():
+        _last_login_flush.cancel()
+    await flush_last_logins()
+
+
+def _list_documents_sql(by_metadata: bool, after_cursor: bool) -> str:
+    """Build the document listing statement for one combination of filters."""
+    params = 0
+    # Reason: Documents whose chunks are still loading are hidden until done
+    conditions = ["d.status <> 'loading'"]
+    if by_metadata:
+        params += 1
+        conditions.append(f"d.metadata @> ${params}::jsonb")
+    if after_cursor:
+        params += 2
+        conditions.append(f"(d.created_at, d.id) < (${params - 1}::timestamptz, ${params}::uuid)")
+    where = "WHERE " + " AND ".join(conditions)
+    return f"""
+    SELECT 
+        d.id::text,
+        d.title,
+        d.source,
+        /* merge normalized columns and lookup names into metadata for UI */
+        (d.metadata 
+          || jsonb_build_object(
+                'author_id', d.author_id::text,
+                'author', COALESCE(a.full_name, a.username),
+                'effective_date', to_char(d.effective_date, 'YYYY-MM-DD'),
+                'document_type_id', d.document_type_id::text,
+                'issuing_unit_id', d.issuing_unit_id::text,
+                'site_id', d.site_id::text,
+                'document_type_name', COALESCE(dt.name, NULL),
+                'issuing_unit_name', COALESCE(ou.name, NULL),
+                'site_name', COALESCE(s.name, NULL)
+            )
+        ) AS metadata,
+        d.created_at,
+        d.updated_at,
+        d.chunk_count
+    FROM documents d
+    LEFT JOIN document_types dt ON dt.id = d.document_type_id
+    LEFT JOIN org_units ou ON ou.id = d.issuing_unit_id
+    LEFT JOIN sites s ON s.id = d.site_id
+    LEFT JOIN accounts a ON a.id = d.author_id
+    {where}
+    ORDER BY d.created_at DESC, d.id DESC
+    LIMIT ${params + 1} OFFSET ${params + 2}
+    """
+
+
+# One statement text per filter combination, keyed by
+# (metadata filter given, cursor given); asyncpg caches each on the
+# connection on first use. Reason: separate texts keep each plan able to
+# use the GIN / created_at index its filter needs, which a single
+# "$1 IS NULL OR ..." statement would not
+_LIST_DOCUMENTS_SQL = {
+    (by_metadata, after_cursor): _list_documents_sql(by_metadata, after_cursor)
+    for by_metadata in (False, True)
+    for after_cursor in (False, True)
+}
 
 
 async def list_documents(
     limit: int = 100,
     offset: int = 0,
-    metadata_filter: Optional[Dict[str, Any]] = None
+    metadata_filter: Optional[Dict[str, Any]] = None,
+    after: Optional[Tuple[datetime, str]] = None
 ) -> List[Dict[str, Any]]:
     """
-    List documents with optional filtering.
+    List documents with optional filtering, newest first.
     
     Args:
         limit: Maximum number of documents to return
         offset: Number of documents to skip
         metadata_filter: Optional metadata filter
+        after: (created_at, id) of the last document of the previous page;
+            prefer this over offset, which re-scans every skipped row
     
     Returns:
         List of documents
     """
+    params = [metadata_filter] if metadata_filter else []
+    if after:
+        params.extend(after)
+    params.extend([limit, offset])
+    
     async with db_pool.acquire() as conn:
-        query = """
-            SELECT 
-                d.id::text,
-                d.title,
-                d.source,
-                /* merge normalized columns and lookup names into metadata for UI */
-                (d.metadata 
-                  || jsonb_build_object(
-                        'author_id', d.author_id::text,
-                        'author', COALESCE(a.full_name, a.username),
-                        'effective_date', to_char(d.effective_date, 'YYYY-MM-DD'),
-                        'document_type_id', d.document_type_id::text,
-                        'issuing_unit_id', d.issuing_unit_id::text,
-                        'site_id', d.site_id::text,
-                        'document_type_name', COALESCE(dt.name, NULL),
-                        'issuing_unit_name', COALESCE(ou.name, NULL),
-                        'site_name', COALESCE(s.name, NULL)
-                    )
-                ) AS metadata,
-                d.created_at,
-                d.updated_at,
-                COUNT(c.id) AS chunk_count
-            FROM documents d
-            LEFT JOIN document_types dt ON dt.id = d.document_type_id
-            LEFT JOIN org_units ou ON ou.id = d.issuing_unit_id
-            LEFT JOIN sites s ON s.id = d.site_id
-            LEFT JOIN accounts a ON a.id = d.author_id
-            LEFT JOIN chunks c ON d.id = c.document_id
-        """
-        
-        params = []
-        conditions = []
-        
-        if metadata_filter:
-            conditions.append(f"d.metadata @> ${len(params) + 1}::jsonb")
-            params.append(json.dumps(metadata_filter))
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        query += """
-            GROUP BY d.id, d.title, d.source, d.metadata, d.created_at, d.updated_at, dt.name, ou.name, s.name, a.full_name, a.username
-            ORDER BY d.created_at DESC
-            LIMIT $%d OFFSET $%d
-        """ % (len(params) + 1, len(params) + 2)
-        
-        params.extend([limit, offset])
-        
-        results = await conn.fetch(query, *params)
+        results = await conn.fetch(_LIST_DOCUMENTS_SQL[bool(metadata_filter), bool(after)], *params)
         
         return [
             {
                 "id": row["id"],
                 "title": row["title"],
                 "source": row["source"],
-                "metadata": json.loads(row["metadata"]),
+                "metadata": row["metadata"],
                 "created_at": row["created_at"].isoformat(),
                 "updated_at": row["updated_at"].isoformat(),
                 "chunk_count": row["chunk_count"]
@@ -501,6 +1006,28 @@ async def list_documents(
 
 
 # Vector Search Functions
+_VECTOR_SEARCH_SQL = "SELECT * FROM match_chunks($1::vector, $2)"
+
+_HYBRID_SEARCH_SQL = "SELECT * FROM hybrid_search($1::vector, $2, $3, $4)"
+
+_VECTOR_SEARCH_BATCH_SQL = """
+    SELECT q.ord, m.*
+    FROM unnest($1::vector[], $2::int[]) WITH ORDINALITY AS q(embedding, match_count, ord)
+    CROSS JOIN LATERAL match_chunks(q.embedding, q.match_count) AS m
+    ORDER BY q.ord, m.similarity DESC
+    """
+
+_HYBRID_SEARCH_BATCH_SQL = """
+    SELECT q.ord, h.*
+    FROM unnest($1::vector[], $2::text[], $3::int[], $4::float8[])
+        WITH ORDINALITY AS q(embedding, query_text, match_count, text_weight, ord)
+    CROSS JOIN LATERAL hybrid_search(
+        q.embedding, q.query_text, q.match_count, q.text_weight
+    ) AS h
+    ORDER BY q.ord, h.combined_score DESC
+    """
+
+
 async def vector_search(
     embedding: List[float],
     limit: int = 10
@@ -516,15 +1043,7 @@ async def vector_search(
         List of matching chunks ordered by similarity (best first)
     """
     async with db_pool.acquire() as conn:
-        # Convert embedding to PostgreSQL vector string format
-        # PostgreSQL vector format: '[1.0,2.0,3.0]' (no spaces after commas)
-        embedding_str = '[' + ','.join(map(str, embedding)) + ']'
-        
-        results = await conn.fetch(
-            "SELECT * FROM match_chunks($1::vector, $2)",
-            embedding_str,
-            limit
-        )
+        results = await conn.fetch(_VECTOR_SEARCH_SQL, embedding, limit)
         
         return [
             {
@@ -532,7 +1051,7 @@ async def vector_search(
                 "document_id": row["document_id"],
                 "content": row["content"],
                 "similarity": row["similarity"],
-                "metadata": json.loads(row["metadata"]),
+                "metadata": row["metadata"],
                 "document_title": row["document_title"],
                 "document_source": row["document_source"]
             }
@@ -559,17 +1078,7 @@ async def hybrid_search(
         List of matching chunks ordered by combined score (best first)
     """
     async with db_pool.acquire() as conn:
-        # Convert embedding to PostgreSQL vector string format
-        # PostgreSQL vector format: '[1.0,2.0,3.0]' (no spaces after commas)
-        embedding_str = '[' + ','.join(map(str, embedding)) + ']'
-        
-        results = await conn.fetch(
-            "SELECT * FROM hybrid_search($1::vector, $2, $3, $4)",
-            embedding_str,
-            query_text,
-            limit,
-            text_weight
-        )
+        results = await conn.fetch(_HYBRID_SEARCH_SQL, embedding, query_text, limit, text_weight)
         
         return [
             {
@@ -579,7 +1088,7 @@ async def hybrid_search(
                 "combined_score": row["combined_score"],
                 "vector_similarity": row["vector_similarity"],
                 "text_similarity": row["text_similarity"],
-                "metadata": json.loads(row["metadata"]),
+                "metadata": row["metadata"],
                 "document_title": row["document_title"],
                 "document_source": row["document_source"]
             }
@@ -587,6 +1096,80 @@ async def hybrid_search(
         ]
 
 
+async def vector_search_batch(
+    embeddings: List[List[float]],
+    limits: List[int]
+) -> List[List[Dict[str, Any]]]:
+    """
+    Perform several vector similarity searches in one round-trip.
+
+    Args:
+        embeddings: Query embedding vectors
+        limits: Maximum number of results for each query
+
+    Returns:
+        One result list per query, in input order (best first)
+    """
+    if not embeddings:
+        return []
+
+    async with db_pool.acquire() as conn:
+        results = await conn.fetch(_VECTOR_SEARCH_BATCH_SQL, pack_vectors(embeddings), limits)
+
+        grouped: List[List[Dict[str, Any]]] = [[] for _ in embeddings]
+        for row in results:
+            grouped[row["ord"] - 1].append({
+                "chunk_id": row["chunk_id"],
+                "document_id": row["document_id"],
+                "content": row["content"],
+                "similarity": row["similarity"],
+                "metadata": row["metadata"],
+                "document_title": row["document_title"],
+                "document_source": row["document_source"]
+            })
+        return grouped
+
+
+async def hybrid_search_batch(
+    embeddings: List[List[float]],
+    query_texts: List[str],
+    limits: List[int],
+    text_weights: List[float]
+) -> List[List[Dict[str, Any]]]:
+    """
+    Perform several hybrid searches in one round-trip.
+
+    Args:
+        embeddings: Query embedding vectors
+        query_texts: Query texts for keyword search
+        limits: Maximum number of results for each query
+        text_weights: Weight for text similarity for each query
+
+    Returns:
+        One result list per query, in input order (best first)
+    """
+    if not embeddings:
+        return []
+
+    async with db_pool.acquire() as conn:
+        results = await conn.fetch(_HYBRID_SEARCH_BATCH_SQL, pack_vectors(embeddings), query_texts, limits, text_weights)
+
+        grouped: List[List[Dict[str, Any]]] = [[] for _ in embeddings]
+        for row in results:
+            grouped[row["ord"] - 1].append({
+                "chunk_id": row["chunk_id"],
+                "document_id": row["document_id"],
+                "content": row["content"],
+                "combined_score": row["combined_score"],
+                "vector_similarity": row["vector_similarity"],
+                "text_similarity": row["text_similarity"],
+                "metadata": row["metadata"],
+                "document_title": row["document_title"],
+                "document_source": row["document_source"]
+            })
+        return grouped
+
+
 # Chunk Management Functions
 async def get_document_chunks(document_id: str) -> List[Dict[str, Any]]:
     """
@@ -609,26 +1192,474 @@ async def get_document_chunks(document_id: str) -> List[Dict[str, Any]]:
                 "chunk_id": row["chunk_id"],
                 "content": row["content"],
                 "chunk_index": row["chunk_index"],
-                "metadata": json.loads(row["metadata"])
+                "metadata": row["metadata"]
             }
             for row in results
         ]
 
 
+def chunk_content_hash(content: str) -> str:
+    """Hex MD5 of a chunk's text, matching PostgreSQL's md5(content)."""
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+async def get_chunk_embeddings(
+    document_id: str,
+    content_hashes: List[str]
+) -> Dict[str, Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    Look up stored embeddings of a document's chunks by content hash.
+
+    Args:
+        document_id: Document UUID
+        content_hashes: chunk_content_hash values to look up
+
+    Returns:
+        Per content hash with a stored non-zero embedding, the embedding and
+        the embedding_model/embedding_generated_at metadata it was stored with
+    """
+    if not content_hashes:
+        return {}
+
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT DISTINCT ON (h.hash) h.hash, c.embedding,
+                   c.metadata->>'embedding_model' AS embedding_model,
+                   c.metadata->>'embedding_generated_at' AS embedding_generated_at
+            FROM unnest($2::text[]) AS h(hash)
+            JOIN chunks c ON c.document_id = $1::uuid AND md5(c.content) = h.hash
+            WHERE c.embedding IS NOT NULL
+            """,
+            document_id,
+            content_hashes
+        )
+
+    stored = {}
+    for row in rows:
+        embedding = row["embedding"]
+        # Reason: Zero vectors are the embedder's placeholder for failed batches
+        if embedding is None or len(embedding) == 0 or not np.any(embedding):
+            continue
+        stored[row["hash"]] = (embedding, {
+            key: row[key]
+            for key in ("embedding_model", "embedding_generated_at")
+            if row[key] is not None
+        })
+    return stored
+
+
+_CHUNK_STAGE_COLUMNS = ["content", "embedding", "chunk_index", "metadata", "token_count"]
+
+# Documents with fewer chunks are inserted with one unnest() statement; larger
+# ones are streamed with COPY, which scales better but costs extra round-trips
+CHUNK_COPY_MIN_ROWS = int(os.getenv("CHUNK_COPY_MIN_ROWS", "256"))
+# Documents with at least two COPY-sized partitions are loaded over up to
+# this many pooled connections at once
+CHUNK_LOAD_WORKERS = int(os.getenv("CHUNK_LOAD_WORKERS", "4"))
+
+_INSERT_CHUNKS_SQL = """
+    INSERT INTO chunks (document_id, content, embedding, chunk_index, metadata, token_count)
+    SELECT $1::uuid, c, e, i, m, t
+    FROM unnest($2::text[], $3::vector[], $4::int[], $5::jsonb[], $6::int[]) AS x(c, e, i, m, t)
+    """
+
+# Reason: Rows whose chunk is unchanged are left alone, so replacing a
+# document only writes new tuples (and vector index entries) for the
+# chunks that actually differ. Metadata keys that change on every re-chunk
+# or re-embed are left out of the comparison; untouched rows keep their
+# previous values for them
+_UPSERT_CHUNKS_CLAUSE = """
+    ON CONFLICT (document_id, chunk_index) DO UPDATE
+    SET content = excluded.content,
+        embedding = excluded.embedding,
+        metadata = excluded.metadata,
+        token_count = excluded.token_count
+    WHERE (chunks.content, chunks.embedding, chunks.metadata - '{embedding_generated_at,version,total_chunks}'::text[], chunks.token_count)
+        IS DISTINCT FROM
+        (excluded.content, excluded.embedding, excluded.metadata - '{embedding_generated_at,version,total_chunks}'::text[], excluded.token_count)
+    """
+
+_UPSERT_CHUNKS_SQL = _INSERT_CHUNKS_SQL + _UPSERT_CHUNKS_CLAUSE
+
+_DELETE_STALE_CHUNKS_SQL = (
+    "DELETE FROM chunks WHERE document_id = $1::uuid AND chunk_index <> ALL($2::int[])"
+)
+
+
+async def insert_chunks(conn, document_id: str, chunks: List[Any], upsert: bool = False) -> int:
+    """
+    Insert a document's chunks in bulk.
+
+    Up to ``CHUNK_COPY_MIN_ROWS`` chunks are sent as parallel column arrays
+    and inserted with a single INSERT ... SELECT FROM unnest(...). Larger
+    documents are streamed into a session-local staging table with COPY and
+    moved into ``chunks`` with one INSERT ... SELECT. Embeddings travel in
+    pgvector's binary format either way.
+
+    Args:
+        conn: Pooled connection to insert on (may already be inside a transaction)
+        document_id: Document UUID
+        chunks: Chunks exposing content, index, metadata, token_count and embedding
+        upsert: Update existing rows with the same chunk index instead of failing
+
+    Returns:
+        Number of chunks inserted
+    """
+    if not chunks:
+        return 0
+
+    contents = [chunk.content for chunk in chunks]
+    embeddings = pack_vectors([getattr(chunk, "embedding", None) for chunk in chunks])
+    indexes = [chunk.index for chunk in chunks]
+    metadatas = [getattr(chunk, "metadata", None) or {} for chunk in chunks]
+    token_counts = [getattr(chunk, "token_count", None) for chunk in chunks]
+
+    if len(chunks) < CHUNK_COPY_MIN_ROWS:
+        await conn.fetch(
+            _UPSERT_CHUNKS_SQL if upsert else _INSERT_CHUNKS_SQL,
+            document_id,
+            contents,
+            embeddings,
+            indexes,
+            metadatas,
+            token_counts
+        )
+        return len(chunks)
+
+    async with conn.transaction():
+        await conn.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS _chunk_stage (
+                content TEXT,
+                embedding vector,
+                chunk_index INT,
+                metadata JSONB,
+                token_count INT
+            )
+            """
+        )
+        await conn.copy_records_to_table(
+            "_chunk_stage",
+            records=zip(contents, embeddings, indexes, metadatas, token_counts),
+            columns=_CHUNK_STAGE_COLUMNS
+        )
+        # Reason: Deleting while selecting leaves the staging table empty for
+        # the next call on this connection without a separate TRUNCATE
+        await conn.execute(
+            """
+            WITH staged AS (
+                DELETE FROM _chunk_stage
+                RETURNING content, embedding, chunk_index, metadata, token_count
+            )
+            INSERT INTO chunks (document_id, content, embedding, chunk_index, metadata, token_count)
+            SELECT $1::uuid, content, embedding, chunk_index, metadata, token_count
+            FROM staged
+            """ + (_UPSERT_CHUNKS_CLAUSE if upsert else ""),
+            document_id
+        )
+
+    return len(chunks)
+
+
+async def replace_chunks(conn, document_id: str, chunks: List[Any]) -> int:
+    """
+    Replace all chunks of a document.
+
+    New chunks are upserted on (document_id, chunk_index) and only rows past
+    the new chunk set are deleted, instead of deleting and re-inserting
+    every row. Should run inside the caller's transaction so readers never
+    see a mix of old and new chunks.
+
+    Args:
+        conn: Pooled connection to use
+        document_id: Document UUID
+        chunks: New chunks, as accepted by insert_chunks
+
+    Returns:
+        Number of chunks inserted
+    """
+    inserted = await insert_chunks(conn, document_id, chunks, upsert=True)
+    await conn.fetch(_DELETE_STALE_CHUNKS_SQL, document_id, [chunk.index for chunk in chunks])
+    return inserted
+
+
+def chunk_load_partitions(chunk_count: int) -> int:
+    """Number of connections ``insert_chunks_parallel`` would use for a document."""
+    return max(1, min(CHUNK_LOAD_WORKERS, chunk_count // max(CHUNK_COPY_MIN_ROWS, 1)))
+
+
+async def insert_chunks_parallel(document_id: str, chunks: List[Any]) -> int:
+    """
+    Insert a committed document's chunks over several pooled connections.
+
+    The chunks are split into contiguous partitions of at least
+    ``CHUNK_COPY_MIN_ROWS`` rows, each loaded with ``insert_chunks`` in its
+    own transaction, so the COPY streams run concurrently on separate
+    backends. The document row must already be committed (the partitions
+    cannot see an open transaction), and a failure can leave other
+    partitions committed; callers delete the document to roll back.
+
+    Args:
+        document_id: Committed document UUID
+        chunks: Chunk objects in chunk_index order
+
+    Returns:
+        Number of chunks inserted
+    """
+    if not chunks:
+        return 0
+    partitions = chunk_load_partitions(len(chunks))
+    size = -(-len(chunks) // partitions)
+
+    async def _load(part: List[Any]) -> int:
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                return await insert_chunks(conn, document_id, part)
+
+    counts = await asyncio.gather(
+        *(_load(chunks[start:start + size]) for start in range(0, len(chunks), size))
+    )
+    return sum(counts)
+
+
+# Bulk loads can drop the chunk embedding index and rebuild it once at the
+# end, instead of updating it for every inserted row
+VECTOR_INDEX_NAME = os.getenv("VECTOR_INDEX_NAME", "idx_chunks_embedding")
+VECTOR_INDEX_BUILD_TIMEOUT = float(os.getenv("VECTOR_INDEX_BUILD_TIMEOUT", "3600"))
+VECTOR_INDEX_REBUILD_ATTEMPTS = int(os.getenv("VECTOR_INDEX_REBUILD_ATTEMPTS", "5"))
+VECTOR_INDEX_REBUILD_RETRY_DELAY = float(os.getenv("VECTOR_INDEX_REBUILD_RETRY_DELAY", "60"))
+_CREATE_INDEX_RE = re.compile(r"^CREATE (UNIQUE )?INDEX ", re.I)
+
+# NULL when the index is missing, false while a concurrent build is running
+# or after one failed
+_INDEX_VALID_SQL = """
+    SELECT i.indisvalid
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = $1 AND c.relnamespace = current_schema()::regnamespace
+"""
+
+# Advisory lock keys shared by every app process: the index lock serializes
+# the drop and the rebuild, and each running bulk load holds the bulk lock
+# in shared mode, so a rebuild can tell a load is still running elsewhere
+_INDEX_LOCK_KEY = VECTOR_INDEX_NAME
+_BULK_LOCK_KEY = f"{VECTOR_INDEX_NAME}:bulk"
+
+_vector_index_lock = asyncio.Lock()
+_bulk_loads = 0
+_vector_index_task: Optional[asyncio.Task] = None
+
+
+async def _build_deferred_vector_index() -> None:
+    """
+    Recreate the embedding index recorded in deferred_indexes, if any.
+
+    Does nothing while another process is rebuilding the index or any
+    process is still inside a bulk load; that process rebuilds it when
+    its own work ends.
+    """
+    async with db_pool.acquire() as conn:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", _INDEX_LOCK_KEY):
+            logger.info(f"Vector index {VECTOR_INDEX_NAME} is being rebuilt or dropped elsewhere")
+            return
+        try:
+            # Reason: An exclusive lock is only granted while no load holds
+            # the bulk lock; it is released at once so new loads are not held
+            # up by the probe (their drop waits on the index lock instead)
+            if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", _BULK_LOCK_KEY):
+                logger.info(f"Bulk load in progress; deferring rebuild of {VECTOR_INDEX_NAME}")
+                return
+            await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", _BULK_LOCK_KEY)
+            
+            indexdef = await conn.fetchval(
+                "SELECT indexdef FROM deferred_indexes WHERE indexname = $1", VECTOR_INDEX_NAME
+            )
+            if not indexdef:
+                return
+            
+            valid = await conn.fetchval(_INDEX_VALID_SQL, VECTOR_INDEX_NAME)
+            if valid is False:
+                # Reason: A failed or cancelled build leaves an INVALID index
+                # behind, which CREATE ... IF NOT EXISTS would silently keep;
+                # builds only run under the index lock, so this is not a build
+                # still in progress in another process
+                await conn.execute(
+                    f'DROP INDEX CONCURRENTLY IF EXISTS "{VECTOR_INDEX_NAME}"',
+                    timeout=VECTOR_INDEX_BUILD_TIMEOUT
+                )
+            if valid is not True:
+                # Reason: CONCURRENTLY keeps chunks writable while the index builds
+                sql = _CREATE_INDEX_RE.sub(r"CREATE \1INDEX CONCURRENTLY IF NOT EXISTS ", indexdef, count=1)
+                await conn.execute(sql, timeout=VECTOR_INDEX_BUILD_TIMEOUT)
+                if not await conn.fetchval(_INDEX_VALID_SQL, VECTOR_INDEX_NAME):
+                    raise RuntimeError(f"index {VECTOR_INDEX_NAME} is still invalid after {sql}")
+            
+            await conn.execute("DELETE FROM deferred_indexes WHERE indexname = $1", VECTOR_INDEX_NAME)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", _INDEX_LOCK_KEY)
+    logger.info(f"Rebuilt vector index {VECTOR_INDEX_NAME}")
+
+
+async def _rebuild_vector_index() -> None:
+    """Rebuild the deferred embedding index, retrying failed builds with backoff."""
+    for attempt in range(1, VECTOR_INDEX_REBUILD_ATTEMPTS + 1):
+        try:
+            await _build_deferred_vector_index()
+            return
+        except asyncpg.UndefinedTableError:
+            logger.warning("deferred_indexes table missing; apply sql/schema.sql to enable index rebuilds")
+            return
+        except Exception as e:
+            logger.error(f"Failed to rebuild vector index {VECTOR_INDEX_NAME} (attempt {attempt}): {e}")
+        if attempt < VECTOR_INDEX_REBUILD_ATTEMPTS:
+            await asyncio.sleep(VECTOR_INDEX_REBUILD_RETRY_DELAY * attempt)
+    logger.error(
+        f"Gave up rebuilding vector index {VECTOR_INDEX_NAME}; "
+        "it is rebuilt on the next bulk load or restart"
+    )
+
+
+def schedule_vector_index_rebuild():
+    """Start rebuilding a deferred embedding index in the background, if none is running."""
+    global _vector_index_task
+    if _vector_index_task is None or _vector_index_task.done():
+        _vector_index_task = asyncio.create_task(_rebuild_vector_index())
+
+
+async def _cancel_vector_index_rebuild():
+    """Cancel a running rebuild; the INVALID index it leaves is dropped or rebuilt later."""
+    if _vector_index_task is not None and not _vector_index_task.done():
+        _vector_index_task.cancel()
+        try:
+            await _vector_index_task
+        except asyncio.CancelledError:
+            pass
+
+
+@asynccontextmanager
+async def deferred_vector_index():
+    """
+    Drop the chunk embedding index for the duration of a bulk load.
+
+    Overlapping bulk loads share one drop; when the last one finishes the
+    index is recreated from its original definition in a background task.
+    Each load holds a shared advisory lock on its own connection, so no app
+    process rebuilds the index while a load is running anywhere.
+    The definition is stored in deferred_indexes in the same transaction
+    as the drop, so a crash or failed build is retried on the next start.
+    Vector searches fall back to sequential scans until the rebuild is done.
+    """
+    async with db_pool.acquire() as lock_conn:
+        await lock_conn.execute("SELECT pg_advisory_lock_shared(hashtext($1))", _BULK_LOCK_KEY)
+        try:
+            async with _deferred_vector_index():
+                yield
+        finally:
+            await lock_conn.execute("SELECT pg_advisory_unlock_shared(hashtext($1))", _BULK_LOCK_KEY)
+            # Reason: Scheduled after the unlock, so the rebuild's probe of
+            # the bulk lock does not see this load
+            if _bulk_loads == 0:
+                schedule_vector_index_rebuild()
+
+
+@asynccontextmanager
+async def _deferred_vector_index():
+    """Drop the index for the first of overlapping loads in this process."""
+    global _bulk_loads
+    async with _vector_index_lock:
+        if _bulk_loads == 0:
+            # Reason: A rebuild still running from an earlier load would only
+            # be dropped again, and its build would block the DROP INDEX
+            await _cancel_vector_index_rebuild()
+            async with db_pool.acquire() as conn:
+                async with conn.transaction():
+                    # Reason: Serialize with other app processes, so only one
+                    # of them records the definition and drops the index, and
+                    # never while another process is rebuilding it
+                    await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", _INDEX_LOCK_KEY)
+                    indexdef = await conn.fetchval(
+                        "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND indexname = $1",
+                        VECTOR_INDEX_NAME
+                    )
+                    if indexdef:
+                        await conn.execute(
+                            """
+                            INSERT INTO deferred_indexes (indexname, indexdef)
+                            VALUES ($1, $2)
+                            ON CONFLICT (indexname) DO NOTHING
+                            """,
+                            VECTOR_INDEX_NAME,
+                            indexdef
+                        )
+                        await conn.execute(f'DROP INDEX IF EXISTS "{VECTOR_INDEX_NAME}"')
+                        logger.warning(f"Dropped vector index for bulk load; will recreate: {indexdef}")
+        _bulk_loads += 1
+    try:
+        yield
+    finally:
+        async with _vector_index_lock:
+            _bulk_loads -= 1
+
+
+async def insert_document_tags(
+    conn,
+    document_id: str,
+    equipment_ids: Optional[List[str]] = None,
+    keyword_ids: Optional[List[str]] = None
+) -> None:
+    """
+    Link a document to equipment and keyword tags in one statement.
+
+    Args:
+        conn: Connection to insert on (may already be inside a transaction)
+        document_id: Document UUID
+        equipment_ids: Equipment UUIDs; duplicates are ignored
+        keyword_ids: Keyword UUIDs; duplicates are ignored
+    """
+    equipment_ids = list(dict.fromkeys(equipment_ids or []))
+    keyword_ids = list(dict.fromkeys(keyword_ids or []))
+    if not equipment_ids and not keyword_ids:
+        return
+
+    # Reason: Array parameters and a data-modifying CTE insert both tag sets in
+    # one round-trip instead of a Bind/Execute per row and per table
+    await conn.execute(
+        """
+        WITH equipment AS (
+            INSERT INTO document_equipment (document_id, equipment_id)
+            SELECT $1::uuid, unnest($2::uuid[])
+            ON CONFLICT DO NOTHING
+        )
+        INSERT INTO document_keywords (document_id, keyword_id)
+        SELECT $1::uuid, unnest($3::uuid[])
+        ON CONFLICT DO NOTHING
+        """,
+        document_id,
+        equipment_ids,
+        keyword_ids
+    )
+
+
 # Utility Functions
-async def execute_query(query: str, *params) -> List[Dict[str, Any]]:
+async def execute_query(query: str, *params, as_dict: bool = True) -> List[Any]:
     """
     Execute a custom query.
     
     Args:
         query: SQL query
         *params: Query parameters
+        as_dict: Copy each row into a dict; pass False to get the asyncpg
+            Records themselves, which support key and index access without
+            a per-row copy
     
     Returns:
         Query results
     """
     async with db_pool.acquire() as conn:
         results = await conn.fetch(query, *params)
+        if not as_dict:
+            return results
         return [dict(row) for row in results]
 
 
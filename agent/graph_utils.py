@@ -3,7 +3,6 @@ Graph utilities for Neo4j/Graphiti integration.
 """
 
 import os
-import json
 import logging
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timezone
@@ -30,7 +30,7 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="Session ID for conversation continuity")
     user_id: Optional[str] = Field(None, description="User identifier")
     metadata: Dict[str, Any] = Field(default_factory=dict, description="Additional metadata")
-    search_type: SearchType = Field(default=SearchType.HYBRID, description="Type of search to perform")
+    search_type: SearchType = Field(default=SearchType.HYBRID, validate_default=True, description="Type of search to perform")
     
     model_config = ConfigDict(use_enum_values=True)
 
@@ -38,7 +38,7 @@ class ChatRequest(BaseModel):
 class SearchRequest(BaseModel):
     """Search request model."""
     query: str = Field(..., description="Search query")
-    search_type: SearchType = Field(default=SearchType.HYBRID, description="Type of search")
+    search_type: SearchType = Field(default=SearchType.HYBRID, validate_default=True, description="Type of search")
     limit: int = Field(default=10, ge=1, le=50, description="Maximum results")
     filters: Dict[str, Any] = Field(default_factory=dict, description="Search filters")
     
@@ -227,7 +227,7 @@ class IngestionResult(BaseModel):
     title: str
     chunks_created: int
     entities_extracted: int
-    relationships_created: int
+    relationships_created: Optional[int]  # None while a background graph build is pending
     processing_time_ms: float
     errors: List[str] = Field(default_factory=list)
 
@@ -14,6 +14,8 @@ from dotenv import load_dotenv
 from .db_utils import (
     vector_search,
     hybrid_search,
+    vector_search_batch,
+    hybrid_search_batch,
     get_document,
     list_documents,
     get_document_chunks
@@ -25,6 +27,7 @@ from .graph_utils import (
 )
 from .models import ChunkResult, GraphSearchResult, DocumentMetadata
 from .providers import get_embedding_client, get_embedding_model
+from .batching import BatchScheduler
 
 # Load environment variables
 load_dotenv()
@@ -57,6 +60,30 @@ async def generate_embedding(text: str) -> List[float]:
         raise
 
 
+async def generate_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Generate embeddings for several texts in a single API call.
+    
+    Args:
+        texts: Texts to embed
+    
+    Returns:
+        Embedding vectors in input order
+    """
+    if not texts:
+        return []
+    
+    try:
+        response = await embedding_client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=texts
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+    except Exception as e:
+        logger.error(f"Failed to generate embeddings: {e}")
+        raise
+
+
 # Tool Input Models
 class VectorSearchInput(BaseModel):
     """Input for vector search tool."""
@@ -85,6 +112,8 @@ class DocumentListInput(BaseModel):
     """Input for listing documents."""
     limit: int = Field(default=20, description="Maximum number of documents")
     offset: int = Field(default=0, description="Number of documents to skip")
+    after_created_at: Optional[datetime] = Field(default=None, description="Creation time of the last document of the previous page")
+    after_id: Optional[str] = Field(default=None, description="ID of the last document of the previous page")
 
 
 class EntityRelationshipInput(BaseModel):
@@ -213,6 +242,142 @@ async def hybrid_search_tool(input_data: HybridSearchInput) -> List[ChunkResult]
         return []
 
 
+async def vector_search_tool_batch(
+    inputs: List[VectorSearchInput]
+) -> List[List[ChunkResult]]:
+    """
+    Perform several vector searches with one embedding call and one query.
+
+    Args:
+        inputs: Search parameters for each query
+
+    Returns:
+        One list of matching chunks per input, in input order
+    """
+    try:
+        embeddings = await generate_embeddings([i.query for i in inputs])
+
+        results = await vector_search_batch(
+            embeddings=embeddings,
+            limits=[i.limit for i in inputs]
+        )
+
+        return [
+            [
+                ChunkResult(
+                    chunk_id=str(r["chunk_id"]),
+                    document_id=str(r["document_id"]),
+                    content=r["content"],
+                    score=r["similarity"],
+                    metadata=r["metadata"],
+                    document_title=r["document_title"],
+                    document_source=r["document_source"]
+                )
+                for r in rows
+            ]
+            for rows in results
+        ]
+
+    except Exception as e:
+        logger.error(f"Batched vector search failed: {e}")
+        return [[] for _ in inputs]
+
+
+async def graph_search_tool_batch(
+    inputs: List[GraphSearchInput]
+) -> List[List[GraphSearchResult]]:
+    """
+    Run several knowledge graph searches concurrently.
+
+    Graphiti embeds queries internally, so identical queries are collapsed
+    and the remaining ones are issued concurrently rather than batched.
+
+    Args:
+        inputs: Search parameters for each query
+
+    Returns:
+        One list of graph search results per input, in input order
+    """
+    unique_queries = list(dict.fromkeys(i.query for i in inputs))
+    results = await asyncio.gather(
+        *(graph_search_tool(GraphSearchInput(query=q)) for q in unique_queries)
+    )
+    by_query = dict(zip(unique_queries, results))
+    return [by_query[i.query] for i in inputs]
+
+
+async def hybrid_search_tool_batch(
+    inputs: List[HybridSearchInput]
+) -> List[List[ChunkResult]]:
+    """
+    Perform several hybrid searches with one embedding call and one query.
+
+    Args:
+        inputs: Search parameters for each query
+
+    Returns:
+        One list of matching chunks per input, in input order
+    """
+    try:
+        embeddings = await generate_embeddings([i.query for i in inputs])
+
+        results = await hybrid_search_batch(
+            embeddings=embeddings,
+            query_texts=[i.query for i in inputs],
+            limits=[i.limit for i in inputs],
+            text_weights=[i.text_weight for i in inputs]
+        )
+
+        return [
+            [
+                ChunkResult(
+                    chunk_id=str(r["chunk_id"]),
+                    document_id=str(r["document_id"]),
+                    content=r["content"],
+                    score=r["combined_score"],
+                    metadata=r["metadata"],
+                    document_title=r["document_title"],
+                    document_source=r["document_source"]
+                )
+                for r in rows
+            ]
+            for rows in results
+        ]
+
+    except Exception as e:
+        logger.error(f"Batched hybrid search failed: {e}")
+        return [[] for _ in inputs]
+
+
+# Micro-batching schedulers shared by the API endpoints and agent tools
+SEARCH_MAX_BATCH = int(os.getenv("SEARCH_MAX_BATCH", "32"))
+SEARCH_MAX_WAIT_MS = float(os.getenv("SEARCH_MAX_WAIT_MS", "5"))
+
+vector_search_scheduler = BatchScheduler(
+    vector_search_tool_batch, SEARCH_MAX_BATCH, SEARCH_MAX_WAIT_MS, name="vector_search"
+)
+graph_search_scheduler = BatchScheduler(
+    graph_search_tool_batch, SEARCH_MAX_BATCH, SEARCH_MAX_WAIT_MS, name="graph_search"
+)
+hybrid_search_scheduler = BatchScheduler(
+    hybrid_search_tool_batch, SEARCH_MAX_BATCH, SEARCH_MAX_WAIT_MS, name="hybrid_search"
+)
+
+
+def start_search_schedulers():
+    """Start the search micro-batching workers on the running event loop."""
+    vector_search_scheduler.start()
+    graph_search_scheduler.start()
+    hybrid_search_scheduler.start()
+
+
+async def stop_search_schedulers():
+    """Stop the search micro-batching workers."""
+    await vector_search_scheduler.stop()
+    await graph_search_scheduler.stop()
+    await hybrid_search_scheduler.stop()
+
+
 async def get_document_tool(input_data: DocumentInput) -> Optional[Dict[str, Any]]:
     """
     Retrieve a complete document.
@@ -251,7 +416,11 @@ async def list_documents_tool(input_data: DocumentListInput) -> List[DocumentMet
     try:
         documents = await list_documents(
             limit=input_data.limit,
-            offset=input_data.offset
+            offset=input_data.offset,
+            after=(
+                (input_data.after_created_at, input_data.after_id)
+                if input_data.after_created_at and input_data.after_id else None
+            )
         )
         
         # Convert to DocumentMetadata models
@@ -7,7 +7,6 @@ import asyncio
 import logging
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
-import json
 
 from openai import RateLimitError, APIError
 from dotenv import load_dotenv
@@ -29,6 +28,9 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Embedding batches of one embed_chunks call in flight at the same time
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+
 # Initialize client with flexible provider
 embedding_client = get_embedding_client()
 EMBEDDING_MODEL = get_embedding_model()
@@ -42,7 +44,8 @@ class EmbeddingGenerator:
         model: str = EMBEDDING_MODEL,
         batch_size: int = 100,
         max_retries: int = 3,
-        retry_delay: float = 1.0
+        retry_delay: float = 1.0,
+        max_concurrency: int = EMBEDDING_CONCURRENCY
     ):
         """
         Initialize embedding generator.
@@ -52,11 +55,13 @@ class EmbeddingGenerator:
             batch_size: Number of texts to process in parallel
             max_retries: Maximum number of retry attempts
             retry_delay: Delay between retries in seconds
+            max_concurrency: Maximum number of batch requests in flight at once
         """
         self.model = model
         self.batch_size = batch_size
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.max_concurrency = max(1, max_concurrency)
         
         # Model-specific configurations
         self.model_configs = {
@@ -225,58 +230,89 @@ class EmbeddingGenerator:
         
         logger.info(f"Generating embeddings for {len(chunks)} chunks")
         
-        # Process chunks in batches
-        embedded_chunks = []
+        # Reason: Batches are independent network calls; overlapping them
+        # (bounded by a semaphore) hides the per-request latency
         total_batches = (len(chunks) + self.batch_size - 1) // self.batch_size
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        completed = 0
+        
+        async def run_batch(batch_number: int, batch_chunks: List[DocumentChunk]) -> List[DocumentChunk]:
+            nonlocal completed
+            async with semaphore:
+                embedded = await self._embed_batch(batch_number, total_batches, batch_chunks)
+            completed += 1
+            if progress_callback:
+                progress_callback(completed, total_batches)
+            return embedded
+        
+        batches = await asyncio.gather(*(
+            run_batch(i // self.batch_size + 1, chunks[i:i + self.batch_size])
+            for i in range(0, len(chunks), self.batch_size)
+        ))
+        embedded_chunks = [chunk for batch in batches for chunk in batch]
+        
+        logger.info(f"Generated embeddings for {len(embedded_chunks)} chunks")
+        return embedded_chunks
+    
+    async def _embed_batch(
+        self,
+        batch_number: int,
+        total_batches: int,
+        batch_chunks: List[DocumentChunk]
+    ) -> List[DocumentChunk]:
+        """
+        Embed one batch of chunks, falling back to zero vectors on failure.
+        
+        Args:
+            batch_number: 1-based batch number, for logging
+            total_batches: Number of batches in the call, for logging
+            batch_chunks: Chunks to embed
+        
+        Returns:
+            Chunks with embeddings added, in input order
+        """
+        batch_texts = [chunk.content for chunk in batch_chunks]
+        embedded_chunks = []
         
-        for i in range(0, len(chunks), self.batch_size):
-            batch_chunks = chunks[i:i + self.batch_size]
-            batch_texts = [chunk.content for chunk in batch_chunks]
+        try:
+            # Generate embeddings for this batch
+            embeddings = await self.generate_embeddings_batch(batch_texts)
             
-            try:
-                # Generate embeddings for this batch
-                embeddings = await self.generate_embeddings_batch(batch_texts)
-                
-                # Add embeddings to chunks
-                for chunk, embedding in zip(batch_chunks, embeddings):
-                    # Create a new chunk with embedding
-                    embedded_chunk = DocumentChunk(
-                        content=chunk.content,
-                        index=chunk.index,
-                        start_char=chunk.start_char,
-                        end_char=chunk.end_char,
-                        metadata={
-                            **chunk.metadata,
-                            "embedding_model": self.model,
-                            "embedding_generated_at": datetime.now().isoformat()
-                        },
-                        token_count=chunk.token_count
-                    )
-                    
-                    # Add embedding as a separate attribute
-                    embedded_chunk.embedding = embedding
-                    embedded_chunks.append(embedded_chunk)
-                
-                # Progress update
-                current_batch = (i // self.batch_size) + 1
-                if progress_callback:
-                    progress_callback(current_batch, total_batches)
-                
-                logger.info(f"Processed batch {current_batch}/{total_batches}")
-                
-            except Exception as e:
-                logger.error(f"Failed to process batch {i//self.batch_size + 1}: {e}")
-                
-                # Add chunks without embeddings as fallback
-                for chunk in batch_chunks:
-                    chunk.metadata.update({
-                        "embedding_error": str(e),
+            # Add embeddings to chunks
+            for chunk, embedding in zip(batch_chunks, embeddings):
+                # Create a new chunk with embedding
+                embedded_chunk = DocumentChunk(
+                    content=chunk.content,
+                    index=chunk.index,
+                    start_char=chunk.start_char,
+                    end_char=chunk.end_char,
+                    metadata={
+                        **chunk.metadata,
+                        "embedding_model": self.model,
                         "embedding_generated_at": datetime.now().isoformat()
-                    })
-                    chunk.embedding = [0.0] * self.config["dimensions"]
-                    embedded_chunks.append(chunk)
+                    },
+                    token_count=chunk.token_count
+                )
+                
+                # Add embedding as a separate attribute
+                embedded_chunk.embedding = embedding
+                embedded_chunks.append(embedded_chunk)
+            
+            logger.info(f"Processed batch {batch_number}/{total_batches}")
+            
+        except Exception as e:
+            logger.error(f"Failed to process batch {batch_number}: {e}")
+            
+            # Add chunks without embeddings as fallback
+            embedded_chunks = []
+            for chunk in batch_chunks:
+                chunk.metadata.update({
+                    "embedding_error": str(e),
+                    "embedding_generated_at": datetime.now().isoformat()
+                })
+                chunk.embedding = [0.0] * self.config["dimensions"]
+                embedded_chunks.append(chunk)
         
-        logger.info(f"Generated embeddings for {len(embedded_chunks)} chunks")
         return embedded_chunks
     
     async def embed_query(self, query: str) -> List[float]:
@@ -3,13 +3,14 @@ Main ingestion script for processing markdown documents into vector DB and knowl
 """
 
 import os
+import re
 import asyncio
+import calendar
 import logging
-import json
 import glob
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Sequence, Tuple
-from datetime import datetime
+from datetime import datetime, date
 import argparse
 
 import asyncpg
@@ -22,7 +23,15 @@ from . import ocr
 
 # Import agent utilities
 try:
-    from ..agent.db_utils import initialize_database, close_database, db_pool
+    from ..agent.db_utils import (
+        initialize_database,
+        close_database,
+        db_pool,
+        insert_chunks,
+        insert_chunks_parallel,
+        chunk_load_partitions,
+        insert_document_tags,
+    )
     from ..agent.graph_utils import initialize_graph, close_graph
     from ..agent.models import IngestionConfig, IngestionResult
 except ImportError:
@@ -30,7 +39,15 @@ except ImportError:
     import sys
     import os
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from agent.db_utils import initialize_database, close_database, db_pool
+    from agent.db_utils import (
+        initialize_database,
+        close_database,
+        db_pool,
+        insert_chunks,
+        insert_chunks_parallel,
+        chunk_load_partitions,
+        insert_document_tags,
+    )
     from agent.graph_utils import initialize_graph, close_graph
     from agent.models import IngestionConfig, IngestionResult
 
@@ -39,6 +56,31 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+_ISO_DATE_RE = re.compile(r"\s*(\d{4})-(\d{2})-(\d{2})\s*")
+
+
+def parse_iso_date(value: Any) -> Optional[date]:
+    """Normalize an effective date field to a ``date``.
+
+    Strings must be ``YYYY-MM-DD``; blank or malformed strings become None.
+    Validation is done up front so bad input never raises.
+
+    Args:
+        value: ISO date string, ``date`` or None.
+
+    Returns:
+        The parsed date, or None.
+    """
+    if not isinstance(value, str):
+        return value
+    match = _ISO_DATE_RE.fullmatch(value)
+    if not match:
+        return None
+    year, month, day = (int(part) for part in match.groups())
+    if year < 1 or not 1 <= month <= 12 or not 1 <= day <= calendar.monthrange(year, month)[1]:
+        return None
+    return date(year, month, day)
+
 TEXT_EXTENSIONS = {".md", ".markdown", ".txt"}
 SUPPORTED_DOCUMENT_EXTENSIONS = TEXT_EXTENSIONS | ocr.SUPPORTED_EXTENSIONS
 
@@ -93,12 +135,19 @@ class DocumentIngestionPipeline:
         self._initialized = True
         logger.info("Ingestion pipeline initialized")
     
-    async def close(self):
-        """Close database connections."""
+    async def close(self, close_shared: bool = True):
+        """
+        Close database connections.
+        
+        Args:
+            close_shared: Also close the process-wide database pool and graph
+                client; pass False when they are shared with a running API
+        """
         if self._initialized:
             await self.graph_builder.close()
-            await close_graph()
-            await close_database()
+            if close_shared:
+                await close_graph()
+                await close_database()
             self._initialized = False
     
     async def ingest_documents(
@@ -174,8 +223,9 @@ class DocumentIngestionPipeline:
         """
         start_time = datetime.now()
         
-        # Read document (with OCR support as needed)
-        document_content, read_metadata = self._read_document(file_path)
+        # Read document (with OCR support as needed) in a worker thread so
+        # file I/O and OCR do not block the event loop
+        document_content, read_metadata = await asyncio.to_thread(self._read_document, file_path)
         document_title = self._extract_title(document_content, file_path)
         document_source = os.path.relpath(file_path, self.documents_folder)
 
@@ -390,6 +440,10 @@ class DocumentIngestionPipeline:
         extra_fields: Optional[Dict[str, Any]] = None,
     ) -> str:
         """Save document and chunks to PostgreSQL."""
+        # Reason: Large documents load their chunks over several connections
+        # after the document row commits, hidden as 'loading' until they are
+        # all in; smaller ones stay in one transaction
+        parallel_load = chunk_load_partitions(len(chunks)) > 1
         async with db_pool.acquire() as conn:
             async with conn.transaction():
                 extra = extra_fields or {}
@@ -402,88 +456,61 @@ class DocumentIngestionPipeline:
                 site_id = extra.get("site_id")
 
                 author_id = extra.get("author_id")
-                effective_date = extra.get("effective_date")  # Expect ISO date string or None
-                # Normalize effective_date to Python date if string provided
-                if isinstance(effective_date, str) and effective_date.strip():
-                    try:
-                        from datetime import date as _date
-                        effective_date = _date.fromisoformat(effective_date)
-                    except Exception:
-                        effective_date = None
+                # Expect ISO date string or None
+                effective_date = parse_iso_date(extra.get("effective_date"))
 
                 # Insert document with new mandatory fields
                 document_result = await conn.fetchrow(
                     """
                     INSERT INTO documents (
                         title, source, content, metadata,
-                        document_type_id, issuing_unit_id, site_id, author_id, effective_date
+                        document_type_id, issuing_unit_id, site_id, author_id, effective_date,
+                        status
                     )
-                    VALUES ($1, $2, $3, $4, $5::uuid, $6::uuid, $7::uuid, $8::uuid, $9)
+                    VALUES ($1, $2, $3, $4, $5::uuid, $6::uuid, $7::uuid, $8::uuid, $9, $10)
                     RETURNING id::text
                     """,
                     title_to_use,
                     source,
                     content,
-                    json.dumps(metadata),
+                    metadata,
                     doc_type_id,
                     issuing_unit_id,
                     site_id,
                     author_id,
                     effective_date,
+                    "loading" if parallel_load else "active",
                 )
                 
                 document_id = document_result["id"]
                 
                 # Insert chunks
-                for chunk in chunks:
-                    # Convert embedding to PostgreSQL vector string format
-                    embedding_data = None
-                    if hasattr(chunk, 'embedding') and chunk.embedding:
-                        # PostgreSQL vector format: '[1.0,2.0,3.0]' (no spaces after commas)
-                        embedding_data = '[' + ','.join(map(str, chunk.embedding)) + ']'
-                    
-                    await conn.execute(
-                        """
-                        INSERT INTO chunks (document_id, content, embedding, chunk_index, metadata, token_count)
-                        VALUES ($1::uuid, $2, $3::vector, $4, $5, $6)
-                        """,
-                        document_id,
-                        chunk.content,
-                        embedding_data,
-                        chunk.index,
-                        json.dumps(chunk.metadata),
-                        chunk.token_count
-                    )
+                if not parallel_load:
+                    await insert_chunks(conn, document_id, chunks)
+
                 # Insert equipment and keyword tag relations if provided
-                equipment_ids: Sequence[str] = extra.get("equipment_ids") or []
-                keyword_ids: Sequence[str] = extra.get("keyword_ids") or []
-
-                if equipment_ids:
-                    # Deduplicate while preserving order
-                    seen = set()
-                    equipment_ids = [e for e in equipment_ids if not (e in seen or seen.add(e))]
-                    await conn.executemany(
-                        """
-                        INSERT INTO document_equipment (document_id, equipment_id)
-                        VALUES ($1::uuid, $2::uuid)
-                        ON CONFLICT DO NOTHING
-                        """,
-                        [(document_id, eid) for eid in equipment_ids]
-                    )
+                await insert_document_tags(
+                    conn,
+                    document_id,
+                    extra.get("equipment_ids"),
+                    extra.get("keyword_ids")
+                )
 
-                if keyword_ids:
-                    seenk = set()
-                    keyword_ids = [k for k in keyword_ids if not (k in seenk or seenk.add(k))]
-                    await conn.executemany(
-                        """
-                        INSERT INTO document_keywords (document_id, keyword_id)
-                        VALUES ($1::uuid, $2::uuid)
-                        ON CONFLICT DO NOTHING
-                        """,
-                        [(document_id, kid) for kid in keyword_ids]
+        if parallel_load:
+            try:
+                await insert_chunks_parallel(document_id, chunks)
+                async with db_pool.acquire() as conn:
+                    await conn.execute(
+                        "UPDATE documents SET status = 'active' WHERE id = $1::uuid", document_id
                     )
-
-                return document_id
+            except BaseException:
+                # Remove the half-loaded document (chunks cascade) so a failure
+                # or cancellation leaves nothing behind, as the transaction would
+                async with db_pool.acquire() as conn:
+                    await conn.execute("DELETE FROM documents WHERE id = $1::uuid", document_id)
+                raise
+
+        return document_id
     
     async def _clean_databases(self):
         """Clean existing data from databases."""
@@ -504,10 +531,262 @@ class DocumentIngestionPipeline:
         logger.info("Cleaned knowledge graph")
 
 
+# Strong references to running background graph builds (the event loop
+# only keeps weak ones)
+_graph_tasks: set = set()
+
+
+async def _build_graph_bg(documents: List[Tuple[str, Dict[str, Any], List[DocumentChunk]]]) -> None:
+    """Add stored documents to the knowledge graph, logging instead of raising.
+
+    Uses its own graph builder because the request's pipeline is closed as
+    soon as the response has been sent.
+
+    Args:
+        documents: (document_id, prepared document, embedded chunks) tuples.
+    """
+    graph_builder = create_graph_builder()
+    try:
+        await graph_builder.initialize()
+        for document_id, prepared, embedded_chunks in documents:
+            try:
+                graph_result = await graph_builder.add_document_to_graph(
+                    chunks=embedded_chunks,
+                    document_title=prepared["title"],
+                    document_source=prepared["source"],
+                    document_metadata=prepared["metadata"]
+                )
+                logger.info(
+                    f"Added {graph_result.get('episodes_created', 0)} episodes to knowledge graph "
+                    f"for document {document_id}"
+                )
+                for error in graph_result.get("errors", []):
+                    logger.warning(f"Graph build for document {document_id}: {error}")
+            except Exception as e:
+                logger.error(f"Background graph build failed for document {document_id}: {e}")
+    except Exception as e:
+        logger.error(f"Background graph build failed: {e}")
+    finally:
+        try:
+            await graph_builder.close()
+        except Exception as e:
+            logger.warning(f"Failed to close background graph builder: {e}")
+
+
+def schedule_graph_build(
+    documents: List[Tuple[str, Dict[str, Any], List[DocumentChunk]]]
+) -> Optional[asyncio.Task]:
+    """Start building the knowledge graph for stored documents in the background.
+
+    Args:
+        documents: (document_id, prepared document, embedded chunks) tuples.
+
+    Returns:
+        The background task, or None if there is nothing to build.
+    """
+    if not documents:
+        return None
+    task = asyncio.create_task(_build_graph_bg(documents))
+    _graph_tasks.add(task)
+    task.add_done_callback(_graph_tasks.discard)
+    return task
+
+
+async def cancel_graph_builds() -> None:
+    """Cancel background graph builds that are still running (e.g. on shutdown)."""
+    if not _graph_tasks:
+        return
+    logger.warning(f"Cancelling {len(_graph_tasks)} pending background graph build(s)")
+    for task in list(_graph_tasks):
+        task.cancel()
+    await asyncio.gather(*_graph_tasks, return_exceptions=True)
+
+
+async def _prepare_file(
+    pipeline: DocumentIngestionPipeline,
+    file_path: str,
+    extra_fields: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Read, chunk and (optionally) extract entities for one file, without embedding."""
+    # Reason: File reads and OCR are blocking; concurrent files read in parallel threads
+    content, read_metadata = await asyncio.to_thread(pipeline._read_document, file_path)
+    title = pipeline._extract_title(content, file_path)
+    source = os.path.relpath(file_path, pipeline.documents_folder)
+    metadata = pipeline._extract_document_metadata(content, file_path, read_metadata)
+
+    chunks = await pipeline.chunker.chunk_document(
+        content=content,
+        title=title,
+        source=source,
+        metadata=metadata
+    )
+    if pipeline.config.extract_entities:
+        chunks = await pipeline.graph_builder.extract_entities_from_chunks(chunks)
+    # Merge optional UI-provided metadata fields
+    if extra_fields:
+        if extra_fields.get("description"):
+            metadata["description"] = extra_fields["description"]
+        if extra_fields.get("access_level"):
+            metadata["access_level"] = extra_fields["access_level"]
+        if extra_fields.get("version"):
+            metadata["version"] = extra_fields["version"]
+
+    return {
+        "title": title,
+        "source": source,
+        "content": content,
+        "metadata": metadata,
+        "chunks": chunks,
+    }
+
+
+async def _store_prepared(
+    pipeline: DocumentIngestionPipeline,
+    prepared: Dict[str, Any],
+    embedded_chunks: List[DocumentChunk],
+    extra_fields: Optional[Dict[str, Any]] = None,
+    build_graph: bool = True,
+) -> IngestionResult:
+    """Save an embedded document to PostgreSQL and optionally the knowledge graph."""
+    doc_id = await pipeline._save_to_postgres(
+        title=prepared["title"],
+        source=prepared["source"],
+        content=prepared["content"],
+        chunks=embedded_chunks,
+        metadata=prepared["metadata"],
+        extra_fields=extra_fields,
+    )
+    # Optionally build graph if not skipped
+    relationships_created = 0
+    graph_errors = []
+    if not pipeline.config.skip_graph_building and not build_graph:
+        # Built later by the caller; the count is not known yet
+        relationships_created = None
+    elif not pipeline.config.skip_graph_building:
+        try:
+            graph_result = await pipeline.graph_builder.add_document_to_graph(
+                chunks=embedded_chunks,
+                document_title=prepared["title"],
+                document_source=prepared["source"],
+                document_metadata=prepared["metadata"]
+            )
+            relationships_created = graph_result.get("episodes_created", 0)
+            graph_errors = graph_result.get("errors", [])
+        except Exception as e:
+            graph_errors = [f"Failed to add to knowledge graph: {e}"]
+
+    # Return IngestionResult structure similar to pipeline._ingest_single_document
+    return IngestionResult(
+        document_id=doc_id,
+        title=prepared["title"],
+        chunks_created=len(prepared["chunks"]),
+        entities_extracted=0,  # not tracked here precisely
+        relationships_created=relationships_created,
+        processing_time_ms=0.0,
+        errors=graph_errors,
+    )
+
+
+def _raise_first_error(outcomes: Sequence[Any]) -> None:
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+
+
+async def ingest_files(
+    file_paths: Sequence[str],
+    config: Optional[IngestionConfig] = None,
+    extra_fields: Optional[Dict[str, Any]] = None,
+    pipeline: Optional[DocumentIngestionPipeline] = None,
+    concurrency: int = 4,
+    background_graph: bool = False,
+) -> List[IngestionResult]:
+    """Ingest several document files, embedding all of their chunks together.
+
+    Files are read and chunked concurrently, then every chunk is sent to the
+    embedder in a single ``embed_chunks`` call so small files fill the same
+    embedding batches, and finally each document is stored concurrently.
+
+    Args:
+        file_paths: Paths to the files on disk (all in the same folder).
+        config: Optional ingestion configuration.
+        extra_fields: Optional document fields and tag relations to store.
+        pipeline: Initialized pipeline to reuse; it is left open for the caller.
+        concurrency: Maximum number of files read or stored at the same time.
+        background_graph: Return once the documents are in PostgreSQL and build
+            the knowledge graph in a background task; results then report
+            ``relationships_created=None``. Requires a running event loop
+            that outlives the call (e.g. the API server).
+
+    Returns:
+        One IngestionResult per file, in input order.
+
+    Raises:
+        Exception: The first per-file failure, once every file has finished.
+    """
+    if not file_paths:
+        return []
+
+    owns_pipeline = pipeline is None
+    if owns_pipeline:
+        cfg = config or IngestionConfig()
+        pipeline = DocumentIngestionPipeline(cfg, documents_folder=os.path.dirname(file_paths[0]))
+        await pipeline.initialize()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _bounded(coro):
+        async with semaphore:
+            return await coro
+
+    try:
+        prepared = await asyncio.gather(
+            *(_bounded(_prepare_file(pipeline, path, extra_fields)) for path in file_paths),
+            return_exceptions=True
+        )
+        _raise_first_error(prepared)
+
+        # One embedder call for every chunk of the request, split back per file
+        flat_chunks = [chunk for doc in prepared for chunk in doc["chunks"]]
+        embedded = await pipeline.embedder.embed_chunks(flat_chunks)
+        embedded_per_file = []
+        offset = 0
+        for doc in prepared:
+            count = len(doc["chunks"])
+            embedded_per_file.append(embedded[offset:offset + count])
+            offset += count
+
+        results = await asyncio.gather(
+            *(
+                _bounded(_store_prepared(
+                    pipeline, doc, doc_chunks, extra_fields, build_graph=not background_graph
+                ))
+                for doc, doc_chunks in zip(prepared, embedded_per_file)
+            ),
+            return_exceptions=True
+        )
+        if background_graph and not pipeline.config.skip_graph_building:
+            # Reason: Documents that were stored are committed even if another
+            # file failed, so they still get their graph built
+            stored = [
+                (result.document_id, doc, doc_chunks)
+                for result, doc, doc_chunks in zip(results, prepared, embedded_per_file)
+                if not isinstance(result, BaseException)
+            ]
+            if stored:
+                schedule_graph_build(stored)
+        _raise_first_error(results)
+        return list(results)
+    finally:
+        if owns_pipeline:
+            await pipeline.close()
+
+
 async def ingest_file(
     file_path: str,
     config: Optional[IngestionConfig] = None,
     extra_fields: Optional[Dict[str, Any]] = None,
+    pipeline: Optional[DocumentIngestionPipeline] = None,
 ) -> IngestionResult:
     """Ingest a single document file.
 
@@ -518,81 +797,19 @@ async def ingest_file(
     Args:
         file_path: Path to the file on disk.
         config: Optional ingestion configuration.
+        extra_fields: Optional document fields and tag relations to store.
+        pipeline: Initialized pipeline to reuse; it is left open for the caller.
 
     Returns:
         IngestionResult describing the ingestion outcome.
     """
-    cfg = config or IngestionConfig()
-    pipeline = DocumentIngestionPipeline(cfg, documents_folder=os.path.dirname(file_path))
-    await pipeline.initialize()
-    try:
-        # We need to inject extra_fields into the save step. Easiest is to
-        # temporarily monkey-patch the _save_to_postgres call by wrapping it.
-        # However, we can instead replicate the steps here to pass extra.
-        # Reuse the private method by calling the individual pipeline steps.
-        from pathlib import Path as _P
-        content, read_metadata = pipeline._read_document(file_path)
-        title = pipeline._extract_title(content, file_path)
-        source = os.path.relpath(file_path, pipeline.documents_folder)
-        metadata = pipeline._extract_document_metadata(content, file_path, read_metadata)
-
-        chunks = await pipeline.chunker.chunk_document(
-            content=content,
-            title=title,
-            source=source,
-            metadata=metadata
-        )
-        if pipeline.config.extract_entities:
-            chunks = await pipeline.graph_builder.extract_entities_from_chunks(chunks)
-        embedded_chunks = await pipeline.embedder.embed_chunks(chunks)
-        # Merge optional UI-provided metadata fields
-        if extra_fields:
-            if extra_fields.get("description"):
-                metadata["description"] = extra_fields["description"]
-            if extra_fields.get("access_level"):
-                metadata["access_level"] = extra_fields["access_level"]
-            if extra_fields.get("version"):
-                metadata["version"] = extra_fields["version"]
-
-        doc_id = await pipeline._save_to_postgres(
-            title=title,
-            source=source,
-            content=content,
-            chunks=embedded_chunks,
-            metadata=metadata,
-            extra_fields=extra_fields,
-        )
-        # Optionally build graph if not skipped
-        relationships_created = 0
-        graph_errors = []
-        if not pipeline.config.skip_graph_building:
-            try:
-                graph_result = await pipeline.graph_builder.add_document_to_graph(
-                    chunks=embedded_chunks,
-                    document_title=title,
-                    document_source=source,
-                    document_metadata=metadata
-                )
-                relationships_created = graph_result.get("episodes_created", 0)
-                graph_errors = graph_result.get("errors", [])
-            except Exception as e:
-                graph_errors = [f"Failed to add to knowledge graph: {e}"]
-
-        from datetime import datetime as _dt
-        processing_time = 0.0
-        # Return IngestionResult structure similar to pipeline._ingest_single_document
-        result = IngestionResult(
-            document_id=doc_id,
-            title=title,
-            chunks_created=len(chunks),
-            entities_extracted=0,  # not tracked here precisely
-            relationships_created=relationships_created,
-            processing_time_ms=processing_time,
-            errors=graph_errors,
-        )
-    finally:
-        await pipeline.close()
-    return result
+    results = await ingest_files(
+        [file_path],
+        config,
+        extra_fields=extra_fields,
+        pipeline=pipeline,
+    )
+    return results[0]
 
 async def main():
     """Main function for running ingestion."""
@@ -3,6 +3,8 @@ from __future__ import annotations
 
 import logging
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Sequence, Tuple
@@ -21,9 +23,21 @@ except ImportError as exc:  # pragma: no cover - handled at runtime
     Image = None  # type: ignore
 
 try:
-    from pdf2image import convert_from_path
+    import cv2
+    import numpy as np
+except ImportError:  # pragma: no cover - binarization is optional
+    cv2 = None  # type: ignore
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
 except ImportError:  # pragma: no cover - optional dep until OCR is invoked
     convert_from_path = None  # type: ignore
+    pdfinfo_from_path = None  # type: ignore
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # pragma: no cover - pypdf is used instead
+    pdfium = None  # type: ignore
 
 try:
     from pypdf import PdfReader
@@ -48,6 +62,24 @@ _DEFAULT_LANG = os.getenv("OCR_LANGUAGES", "vie+eng")
 _FALLBACK_LANG = os.getenv("OCR_FALLBACK_LANGUAGES", "eng")
 _TESS_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "")
 _PDF_DPI = int(os.getenv("OCR_PDF_DPI", "300"))
+# Pages rendered and recognized concurrently; Tesseract and poppler run as
+# subprocesses, so threads scale with cores (set OMP_THREAD_LIMIT=1 to keep
+# Tesseract from also spawning its own threads per page)
+_OCR_WORKERS = max(1, int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1))))
+# Adaptive-threshold scans with OpenCV before recognition; helps uneven
+# lighting on photographed pages, but is left off for clean digital scans
+_BINARIZE = os.getenv("OCR_BINARIZE", "false").lower() in ("1", "true", "yes")
+
+
+# Tesseract reports each missing language model as e.g.
+# "Error opening data file .../vie.traineddata" / "Failed loading language 'vie'"
+_MISSING_LANG_RE = re.compile(
+    r"(?:([\w-]+)\.traineddata|Failed loading language '([\w-]+)')"
+)
+
+# Languages whose model failed to load in this process; dropped from later
+# attempts so each page does not pay for the same failing Tesseract start
+_missing_languages: set = set()
 
 
 class OCRError(RuntimeError):
@@ -113,30 +145,27 @@ def _extract_from_image(path: Path, languages: Optional[str]) -> OCRResult:
 
 def _extract_from_pdf(path: Path, languages: Optional[str]) -> OCRResult:
     """Extract text from a PDF via direct text first, then OCR as needed."""
-    # Step 1: try direct text extraction if pypdf is available.
-    if PdfReader is not None:
+    # Step 1: try direct text extraction, preferring PDFium's native parser.
+    for engine, extractor in (("pdfium", _pdfium_page_texts), ("pypdf", _pypdf_page_texts)):
         try:
-            reader = PdfReader(str(path))
-            direct_chunks: List[str] = []
-            for index, page in enumerate(reader.pages):
-                try:
-                    chunk = page.extract_text() or ""
-                except Exception as exc:  # pragma: no cover - edge case logging
-                    logger.debug("Failed to extract text from PDF page %s: %s", index, exc)
-                    chunk = ""
-                if chunk.strip():
-                    direct_chunks.append(chunk.strip())
-            direct_text = "\n\n".join(direct_chunks).strip()
-            if direct_text:
-                metadata = {
-                    "engine": "pypdf",
-                    "source": "pdf_text",
-                    "page_count": len(reader.pages),
-                    "used_ocr": False,
-                }
-                return OCRResult(text=direct_text, metadata=metadata)
+            extracted = extractor(path)
         except Exception as exc:  # pragma: no cover - fallback will handle
-            logger.debug("Direct PDF text extraction failed for %s: %s", path, exc)
+            logger.debug("Direct PDF text extraction with %s failed for %s: %s", engine, path, exc)
+            continue
+        if extracted is None:
+            continue
+        page_texts, page_count = extracted
+        direct_text = "\n\n".join(chunk.strip() for chunk in page_texts if chunk.strip()).strip()
+        if direct_text:
+            metadata = {
+                "engine": engine,
+                "source": "pdf_text",
+                "page_count": page_count,
+                "used_ocr": False,
+            }
+            return OCRResult(text=direct_text, metadata=metadata)
+        # Reason: No text layer (scanned PDF); a second parser will not find one either
+        break
 
     # Step 2: fallback to page-by-page OCR.
     if convert_from_path is None:
@@ -145,61 +174,139 @@ def _extract_from_pdf(path: Path, languages: Optional[str]) -> OCRResult:
             "provide a PDF with selectable text."
         )
 
-    images = convert_from_path(str(path), dpi=_PDF_DPI)
-    if not images:
+    page_count = int(pdfinfo_from_path(str(path)).get("Pages", 0))
+    if not page_count:
         raise OCRError("No pages found in PDF for OCR processing.")
 
     candidates = _resolve_language_attempts(languages)
-    ocr_text_chunks: List[str] = []
-    used_languages: List[str] = []
-    try:
-        for idx, image in enumerate(images):
-            text, lang_used = _run_tesseract(image, candidates)
-            ocr_text_chunks.append(text)
-            used_languages.append(lang_used)
-            logger.debug("OCR complete for PDF page %s using lang '%s'", idx, lang_used)
-    finally:
-        for image in images:
-            try:
-                image.close()
-            except Exception:  # pragma: no cover - best effort cleanup
-                pass
+    # Reason: Each worker renders and recognizes one page at a time, so at
+    # most _OCR_WORKERS page bitmaps are held in memory instead of all of them
+    with ThreadPoolExecutor(max_workers=min(_OCR_WORKERS, page_count)) as executor:
+        results = list(executor.map(
+            lambda page_number: _ocr_pdf_page(path, page_number, candidates),
+            range(1, page_count + 1),
+        ))
+    ocr_text_chunks = [text for text, _ in results]
+    used_languages = [lang_used for _, lang_used in results]
 
     combined_text = "\n\n".join(chunk.strip() for chunk in ocr_text_chunks if chunk.strip()).strip()
     metadata = {
         "engine": "tesseract",
         "source": "pdf_ocr",
-        "page_count": len(images),
+        "page_count": page_count,
         "languages": _dedupe_preserve_order(used_languages),
         "used_ocr": True,
     }
     return OCRResult(text=combined_text, metadata=metadata)
 
 
+def _pdfium_page_texts(path: Path) -> Optional[Tuple[List[str], int]]:
+    """Return the text of every page using PDFium, or None if it is not installed."""
+    if pdfium is None:
+        return None
+    pdf = pdfium.PdfDocument(str(path))
+    try:
+        texts: List[str] = []
+        for index in range(len(pdf)):
+            page = pdf[index]
+            try:
+                textpage = page.get_textpage()
+                try:
+                    texts.append(textpage.get_text_bounded() or "")
+                finally:
+                    textpage.close()
+            except Exception as exc:  # pragma: no cover - edge case logging
+                logger.debug("Failed to extract text from PDF page %s: %s", index, exc)
+            finally:
+                page.close()
+        return texts, len(pdf)
+    finally:
+        pdf.close()
+
+
+def _pypdf_page_texts(path: Path) -> Optional[Tuple[List[str], int]]:
+    """Return the text of every page using pypdf, or None if it is not installed."""
+    if PdfReader is None:
+        return None
+    reader = PdfReader(str(path))
+    texts: List[str] = []
+    for index, page in enumerate(reader.pages):
+        try:
+            texts.append(page.extract_text() or "")
+        except Exception as exc:  # pragma: no cover - edge case logging
+            logger.debug("Failed to extract text from PDF page %s: %s", index, exc)
+    return texts, len(reader.pages)
+
+
+def _ocr_pdf_page(path: Path, page_number: int, candidates: Sequence[str]) -> Tuple[str, str]:
+    """Render a single PDF page and run Tesseract on it."""
+    images = convert_from_path(str(path), dpi=_PDF_DPI, first_page=page_number, last_page=page_number)
+    try:
+        if not images:
+            return "", ""
+        text, lang_used = _run_tesseract(images[0], candidates)
+        logger.debug("OCR complete for PDF page %s using lang '%s'", page_number, lang_used)
+        return text, lang_used
+    finally:
+        for image in images:
+            try:
+                image.close()
+            except Exception:  # pragma: no cover - best effort cleanup
+                pass
+
+
+def _prepare_image(image: "Image.Image") -> "Image.Image":
+    """Reduce an image to what Tesseract reads: one 8-bit grayscale channel."""
+    # Reason: Tesseract binarizes grayscale internally, so colour channels
+    # only triple the bytes it has to copy and scale
+    gray = image if image.mode == "L" else image.convert("L")
+    if not _BINARIZE or cv2 is None:
+        return gray
+    binary = cv2.adaptiveThreshold(
+        np.asarray(gray), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10
+    )
+    return Image.fromarray(binary)
+
+
 def _run_tesseract(image: "Image.Image", candidates: Sequence[str]) -> Tuple[str, str]:
     """Run Tesseract against an image trying multiple language options."""
     if pytesseract is None:
         raise OCRError("pytesseract is not installed. Please add pytesseract to requirements.")
 
-    prepared = image.convert("RGB") if image.mode not in ("L", "RGB") else image
+    prepared = _prepare_image(image)
     errors: List[str] = []
-    for lang in candidates:
-        kwargs = {"lang": lang}
-        if _TESS_CONFIG:
-            kwargs["config"] = _TESS_CONFIG
-        try:
-            text = pytesseract.image_to_string(prepared, **kwargs)
-            return text.strip(), lang
-        except TesseractNotFoundError as exc:  # pragma: no cover - env issue
-            raise OCRError(
-                "Tesseract binary not found. Ensure Tesseract OCR is installed and "
-                "available on PATH."
-            ) from exc
-        except TesseractError as exc:
-            error_msg = f"lang='{lang}' -> {exc}" if lang else str(exc)
-            errors.append(error_msg)
-            logger.debug("Tesseract failed for %s: %s", lang or "default", exc)
-
+    tried: set = set()
+    for candidate in candidates:
+        while True:
+            lang = "+".join(part for part in candidate.split("+") if part not in _missing_languages)
+            if not lang or lang in tried:
+                break
+            tried.add(lang)
+            kwargs = {"lang": lang}
+            if _TESS_CONFIG:
+                kwargs["config"] = _TESS_CONFIG
+            try:
+                text = pytesseract.image_to_string(prepared, **kwargs)
+                return text.strip(), lang
+            except TesseractNotFoundError as exc:  # pragma: no cover - env issue
+                raise OCRError(
+                    "Tesseract binary not found. Ensure Tesseract OCR is installed and "
+                    "available on PATH."
+                ) from exc
+            except TesseractError as exc:
+                error_msg = f"lang='{lang}' -> {exc}" if lang else str(exc)
+                errors.append(error_msg)
+                logger.debug("Tesseract failed for %s: %s", lang or "default", exc)
+                missing = {a or b for a, b in _MISSING_LANG_RE.findall(str(exc))}
+                if not missing & set(lang.split("+")):
+                    break
+                # Reason: Retry the same combination without the missing
+                # models instead of moving on to a narrower fallback
+                logger.warning("Tesseract language data missing for %s; skipping it", sorted(missing))
+                _missing_languages.update(missing)
+
+    if not errors:
+        errors.append(f"language data missing for {sorted(_missing_languages)}")
     raise OCRError("Tesseract failed for all language candidates: " + "; ".join(errors))
 
 
@@ -223,13 +330,7 @@ def _split_languages(spec: Optional[str]) -> List[str]:
 
 
 def _dedupe_preserve_order(items: Sequence[str]) -> List[str]:
-    seen = set()
-    result: List[str] = []
-    for item in items:
-        if item and item not in seen:
-            seen.add(item)
-            result.append(item)
-    return result
+    return list(dict.fromkeys(item for item in items if item))
 
 
 def _ensure_dependencies(path: Path) -> None:
@@ -239,10 +340,16 @@ def _ensure_dependencies(path: Path) -> None:
         raise OCRError("Pillow is required for OCR but is not installed.")
     if suffix in SUPPORTED_EXTENSIONS and pytesseract is None:
         raise OCRError("pytesseract is required for OCR but is not installed.")
-    if suffix in SUPPORTED_PDF_EXTENSIONS and convert_from_path is None and PdfReader is None:
+    if (
+        suffix in SUPPORTED_PDF_EXTENSIONS
+        and convert_from_path is None
+        and pdfium is None
+        and PdfReader is None
+    ):
         raise OCRError(
-            "PDF OCR requested but neither pdf2image nor pypdf is available. Install "
-            "pdf2image (for raster OCR) and/or pypdf (for direct text extraction)."
+            "PDF OCR requested but none of pdf2image, pypdfium2 or pypdf is available. "
+            "Install pdf2image (for raster OCR) and/or pypdfium2 or pypdf (for direct "
+            "text extraction)."
         )
 
 
@@ -11,6 +11,8 @@ DROP FUNCTION IF EXISTS match_chunks(vector, int);
 DROP FUNCTION IF EXISTS hybrid_search(vector, text, int, float);
 DROP FUNCTION IF EXISTS get_document_chunks(uuid);
 DROP FUNCTION IF EXISTS update_updated_at_column();
+DROP FUNCTION IF EXISTS count_inserted_chunks() CASCADE;
+DROP FUNCTION IF EXISTS count_deleted_chunks() CASCADE;
 
 DROP INDEX IF EXISTS idx_chunks_embedding;
 DROP INDEX IF EXISTS idx_chunks_document_id;
@@ -26,6 +28,7 @@ DROP TABLE IF EXISTS messages CASCADE;
 DROP TABLE IF EXISTS sessions CASCADE;
 DROP TABLE IF EXISTS document_keywords CASCADE;
 DROP TABLE IF EXISTS document_equipment CASCADE;
+DROP TABLE IF EXISTS deferred_indexes CASCADE;
 DROP TABLE IF EXISTS chunks CASCADE;
 DROP TABLE IF EXISTS document_versions CASCADE;
 DROP TABLE IF EXISTS documents CASCADE;
@@ -116,14 +119,19 @@ CREATE TABLE documents (
     site_id UUID NOT NULL REFERENCES sites(id),
     author TEXT,
     effective_date DATE,
-    status TEXT NOT NULL DEFAULT 'active' CHECK (status IN ('active','archived','expired')),
+    -- 'loading' hides a document whose chunks are loaded over several connections
+    status TEXT NOT NULL DEFAULT 'active' CHECK (status IN ('active','archived','expired','loading')),
+    -- maintained by the chunk count triggers below
+    chunk_count INTEGER NOT NULL DEFAULT 0,
     created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 CREATE INDEX idx_documents_metadata ON documents USING GIN (metadata);
-CREATE INDEX idx_documents_created_at ON documents (created_at DESC);
+CREATE INDEX idx_documents_created_at ON documents (created_at DESC, id DESC);
+-- Chunk count maintenance is not an edit of the document
 CREATE TRIGGER update_documents_updated_at BEFORE UPDATE ON documents
-    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+    FOR EACH ROW WHEN (OLD.chunk_count IS NOT DISTINCT FROM NEW.chunk_count)
+    EXECUTE FUNCTION update_updated_at_column();
 
 -- Optional: versioning (history of changes)
 CREATE TABLE document_versions (
@@ -138,6 +146,7 @@ CREATE TABLE document_versions (
     created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 CREATE UNIQUE INDEX idx_doc_versions_unique ON document_versions(document_id, version);
+CREATE INDEX idx_doc_versions_created_at ON document_versions(document_id, created_at DESC, id DESC);
 
 -- Many-to-many relations
 CREATE TABLE document_equipment (
@@ -165,9 +174,50 @@ CREATE TABLE chunks (
 );
 CREATE INDEX idx_chunks_embedding ON chunks USING ivfflat (embedding vector_cosine_ops) WITH (lists = 1);
 CREATE INDEX idx_chunks_document_id ON chunks (document_id);
-CREATE INDEX idx_chunks_chunk_index ON chunks (document_id, chunk_index);
+-- Unique, so chunk replacement can upsert rows in place
+CREATE UNIQUE INDEX idx_chunks_chunk_index ON chunks (document_id, chunk_index);
 CREATE INDEX idx_chunks_content_trgm ON chunks USING GIN (content gin_trgm_ops);
 
+-- Definitions of indexes dropped for a bulk load and not yet rebuilt; the
+-- API recreates them when the load ends, or on its next start
+CREATE TABLE deferred_indexes (
+    indexname TEXT PRIMARY KEY,
+    indexdef TEXT NOT NULL,
+    dropped_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Keep documents.chunk_count current. Statement-level triggers with
+-- transition tables issue one UPDATE per document per statement, rather
+-- than one per chunk row for bulk COPY/unnest loads
+CREATE OR REPLACE FUNCTION count_inserted_chunks()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE documents d
+    SET chunk_count = d.chunk_count + n.added
+    FROM (SELECT document_id, COUNT(*) AS added FROM new_chunks GROUP BY document_id) n
+    WHERE d.id = n.document_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_deleted_chunks()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE documents d
+    SET chunk_count = d.chunk_count - o.removed
+    FROM (SELECT document_id, COUNT(*) AS removed FROM old_chunks GROUP BY document_id) o
+    WHERE d.id = o.document_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_chunks_counted_insert AFTER INSERT ON chunks
+    REFERENCING NEW TABLE AS new_chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION count_inserted_chunks();
+CREATE TRIGGER trg_chunks_counted_delete AFTER DELETE ON chunks
+    REFERENCING OLD TABLE AS old_chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION count_deleted_chunks();
+
 -- Sessions and messages (chat history)
 CREATE TABLE sessions (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -220,7 +270,7 @@ BEGIN
         d.source AS document_source
     FROM chunks c
     JOIN documents d ON c.document_id = d.id
-    WHERE c.embedding IS NOT NULL
+    WHERE c.embedding IS NOT NULL AND d.status <> 'loading'
     ORDER BY c.embedding <=> query_embedding
     LIMIT match_count;
 END;
@@ -258,7 +308,7 @@ BEGIN
             d.source AS doc_source
         FROM chunks c
         JOIN documents d ON c.document_id = d.id
-        WHERE c.embedding IS NOT NULL
+        WHERE c.embedding IS NOT NULL AND d.status <> 'loading'
     ),
     text_results AS (
         SELECT 
@@ -272,6 +322,7 @@ BEGIN
         FROM chunks c
         JOIN documents d ON c.document_id = d.id
         WHERE to_tsvector('english', c.content) @@ plainto_tsquery('english', query_text)
+          AND d.status <> 'loading'
     )
     SELECT 
         COALESCE(v.chunk_id, t.chunk_id) AS chunk_id,
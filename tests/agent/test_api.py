@@ -0,0 +1,130 @@
+"""
+Tests for API helpers.
+"""
+
+import difflib
+import os
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from agent.api import (
+    _decode_cursor,
+    _encode_cursor,
+    _is_admin_request,
+    _unified_diff_str,
+    _unique_upload_paths,
+    get_or_create_session,
+)
+from agent.models import ChatRequest
+
+
+def _reference_diff(left: str, right: str) -> str:
+    return "".join(difflib.unified_diff(
+        left.splitlines(keepends=True), right.splitlines(keepends=True), "left", "right"
+    ))
+
+
+class TestUnifiedDiff:
+    """Test the trimmed unified diff."""
+    
+    def test_matches_difflib(self):
+        """Test the diff of a long text with one edit matches difflib."""
+        left = "".join(f"line {i}\n" for i in range(200))
+        right = left.replace("line 120\n", "line 120 edited\n")
+        
+        assert _unified_diff_str(left, right, "left", "right") == _reference_diff(left, right)
+    
+    def test_identical_texts(self):
+        """Test identical texts produce an empty diff."""
+        assert _unified_diff_str("same\n", "same\n", "left", "right") == ""
+    
+    def test_line_numbers_with_other_line_breaks(self):
+        """Test hunk line numbers count form feeds in the skipped prefix as line breaks."""
+        left = "title\fpage two\r\nintro\n" + "".join(f"{i}\n" for i in range(20))
+        right = left.replace("15\n", "fifteen\n")
+        
+        diff = _unified_diff_str(left, right, "left", "right")
+        
+        assert diff == _reference_diff(left, right)
+        assert "@@ -16,7 +16,7 @@" in diff
+
+
+class TestCursor:
+    """Test keyset cursor encoding."""
+    
+    def test_round_trip(self):
+        """Test sort keys with separators, non-ASCII text and timestamps survive encoding."""
+        row_id = uuid.uuid4()
+        created_at = datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)
+        
+        cursor = _encode_cursor("Phòng|Kỹ thuật", str(row_id))
+        assert cursor.isascii()
+        assert _decode_cursor(cursor) == ("Phòng|Kỹ thuật", row_id)
+        assert _decode_cursor(_encode_cursor(created_at, row_id), datetime.fromisoformat) == (created_at, row_id)
+        assert _decode_cursor(None) is None
+    
+    @pytest.mark.parametrize("cursor", ["not base64!", _encode_cursor("name", "not-a-uuid"), "bmFtZQ=="])
+    def test_malformed_cursor_is_rejected(self, cursor):
+        """Test malformed cursors raise a 400."""
+        with pytest.raises(HTTPException) as exc_info:
+            _decode_cursor(cursor, datetime.fromisoformat)
+        assert exc_info.value.status_code == 400
+
+
+class TestUniqueUploadPaths:
+    """Test upload path assignment."""
+    
+    def test_repeated_basenames_get_suffixes(self):
+        """Test files with the same basename are saved to distinct paths."""
+        paths = _unique_upload_paths("docs", ["a/report.pdf", "b/report.pdf", "report-2.pdf", "notes"])
+        
+        assert paths == [
+            os.path.join("docs", "report.pdf"),
+            os.path.join("docs", "report-3.pdf"),
+            os.path.join("docs", "report-2.pdf"),
+            os.path.join("docs", "notes"),
+        ]
+    
+    def test_strips_directories(self):
+        """Test client-supplied directories cannot escape the folder."""
+        assert _unique_upload_paths("docs", ["../../etc/passwd"]) == [os.path.join("docs", "passwd")]
+
+
+class TestAdminRequest:
+    """Test the admin session check guarding bulk uploads."""
+    
+    @pytest.mark.asyncio
+    async def test_only_admin_sessions_pass(self):
+        """Test the role comes from the server-side session, not the request."""
+        sessions = {
+            "s-admin": {"user_id": "u1", "metadata": {"role": "admin"}},
+            "s-user": {"user_id": "u2", "metadata": {"role": "user"}},
+        }
+        with patch("agent.api.get_session", AsyncMock(side_effect=sessions.get)):
+            def request(headers):
+                return SimpleNamespace(headers=headers)
+            
+            assert await _is_admin_request(request({"X-Session-Id": "s-admin"}))
+            assert not await _is_admin_request(request({"X-Session-Id": "s-user"}))
+            assert not await _is_admin_request(request({"X-Session-Id": "unknown"}))
+            assert not await _is_admin_request(request({}))
+
+
+class TestGetOrCreateSession:
+    """Test resolving the chat session of a request."""
+    
+    @pytest.mark.asyncio
+    async def test_unknown_ids_get_a_server_made_session(self):
+        """Test only existing sessions are reused; other ids never become session ids."""
+        known = str(uuid.uuid4())
+        with patch("agent.api.touch_session", AsyncMock(side_effect=lambda sid: {"id": sid} if sid == known else None)), \
+             patch("agent.api.create_session", AsyncMock(return_value="server-made")) as mock_create:
+            assert await get_or_create_session(ChatRequest(message="hi", session_id=known)) == known
+            assert await get_or_create_session(ChatRequest(message="hi", session_id=str(uuid.uuid4()))) == "server-made"
+            assert await get_or_create_session(ChatRequest(message="hi", session_id="not-a-uuid")) == "server-made"
+            assert mock_create.call_count == 2
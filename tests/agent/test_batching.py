@@ -0,0 +1,105 @@
+"""
+Tests for micro-batching utilities.
+"""
+
+import pytest
+import asyncio
+
+from agent.batching import BatchScheduler, single_flight
+
+
+class TestBatchScheduler:
+    """Test request coalescing."""
+    
+    @pytest.mark.asyncio
+    async def test_submit_without_worker_calls_directly(self):
+        """Test submissions run immediately when the worker is not started."""
+        calls = []
+        
+        async def batch_fn(items):
+            calls.append(list(items))
+            return [i * 2 for i in items]
+        
+        scheduler = BatchScheduler(batch_fn)
+        
+        assert await scheduler.submit(3) == 6
+        assert calls == [[3]]
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_submissions_are_batched(self):
+        """Test concurrent submissions share one batch call."""
+        calls = []
+        
+        async def batch_fn(items):
+            calls.append(list(items))
+            return [i * 2 for i in items]
+        
+        scheduler = BatchScheduler(batch_fn, max_batch=8, max_wait_ms=20)
+        scheduler.start()
+        try:
+            results = await asyncio.gather(*(scheduler.submit(i) for i in range(5)))
+        finally:
+            await scheduler.stop()
+        
+        assert results == [0, 2, 4, 6, 8]
+        assert calls == [[0, 1, 2, 3, 4]]
+    
+    @pytest.mark.asyncio
+    async def test_batch_failure_propagates(self):
+        """Test a failing batch raises in every submitter."""
+        async def batch_fn(items):
+            raise ValueError("boom")
+        
+        scheduler = BatchScheduler(batch_fn, max_wait_ms=5)
+        scheduler.start()
+        try:
+            with pytest.raises(ValueError):
+                await scheduler.submit(1)
+        finally:
+            await scheduler.stop()
+
+
+
+class TestSingleFlight:
+    """Test in-flight call sharing."""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_execution(self):
+        """Test same-key callers share a call, other keys and later calls run their own."""
+        calls = []
+        
+        @single_flight(lambda key: key)
+        async def load(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return {"key": key}
+        
+        a, b, c = await asyncio.gather(load("x"), load("x"), load("y"))
+        assert a is b and a == {"key": "x"}
+        assert c == {"key": "y"}
+        assert calls == ["x", "y"]
+        
+        await load("x")
+        assert calls == ["x", "y", "x"]
+    
+    @pytest.mark.asyncio
+    async def test_failure_and_cancellation(self):
+        """Test errors reach every caller and one caller's cancellation spares the rest."""
+        @single_flight(lambda key: key)
+        async def fail(key):
+            await asyncio.sleep(0.01)
+            raise ValueError(key)
+        
+        results = await asyncio.gather(fail("x"), fail("x"), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        
+        @single_flight(lambda key: key)
+        async def slow(key):
+            await asyncio.sleep(0.02)
+            return key
+        
+        first = asyncio.create_task(slow("x"))
+        second = asyncio.create_task(slow("x"))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "x"
@@ -7,19 +7,42 @@ import asyncio
 import json
 from unittest.mock import Mock, AsyncMock, patch
 from datetime import datetime, timezone, timedelta
+import numpy as np
+from uuid import uuid4
 
+import agent.db_utils as db_utils
 from agent.db_utils import (
     DatabasePool,
+    _init_connection,
     create_session,
+    touch_session,
     get_session,
     update_session,
     add_message,
+    add_messages_bulk,
     get_session_messages,
+    get_many_session_messages,
     get_document,
     list_documents,
     vector_search,
     hybrid_search,
+    vector_search_batch,
     get_document_chunks,
+    insert_chunks,
+    insert_chunks_parallel,
+    replace_chunks,
+    get_chunk_embeddings,
+    chunk_content_hash,
+    deferred_vector_index,
+    insert_document_tags,
+    encode_vector,
+    decode_vector,
+    encode_jsonb,
+    decode_jsonb,
+    pack_vectors,
+    get_account_by_username,
+    touch_last_login,
+    _account_cache,
     test_connection as db_test_connection
 )
 
@@ -53,12 +76,26 @@ class TestDatabasePool:
             assert pool.pool == mock_pool
             mock_create_pool.assert_called_once_with(
                 "postgresql://test",
-                min_size=5,
-                max_size=20,
+                min_size=16,
+                max_size=16,
                 max_inactive_connection_lifetime=300,
-                command_timeout=60
+                command_timeout=60,
+                statement_cache_size=2048,
+                max_cached_statement_lifetime=3600,
+                max_queries=50000,
+                init=_init_connection
             )
     
+    @pytest.mark.asyncio
+    async def test_init_connection_registers_codecs(self):
+        """Test new connections get the binary vector and jsonb codecs."""
+        mock_conn = AsyncMock()
+        
+        await _init_connection(mock_conn)
+        
+        assert [c.args[0] for c in mock_conn.set_type_codec.call_args_list] == ["vector", "jsonb"]
+        assert all(c.kwargs["format"] == "binary" for c in mock_conn.set_type_codec.call_args_list)
+    
     @pytest.mark.asyncio
     async def test_close(self):
         """Test pool closure."""
@@ -119,17 +156,50 @@ class TestSessionManagement:
             call_args = mock_conn.fetchrow.call_args
             assert "INSERT INTO sessions" in call_args[0][0]
             assert call_args[0][1] == "user-123"  # user_id
-            assert json.loads(call_args[0][2]) == {"client": "web"}  # metadata
+            assert call_args[0][2] == {"client": "web"}  # metadata
+    
+    @pytest.mark.asyncio
+    async def test_touch_session(self):
+        """Test only existing, unexpired sessions are touched, and cached ones need no query."""
+        db_utils._session_cache.clear()
+        now = datetime.now(timezone.utc)
+        row = {
+            "id": "session-123", "user_id": "user-123", "metadata": {},
+            "created_at": now, "updated_at": now, "expires_at": now + timedelta(hours=1)
+        }
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_conn.fetchrow.side_effect = [row, None]
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+            
+            session = await touch_session("session-123")
+            assert session["id"] == "session-123"
+            assert await touch_session("session-123") == session
+            assert mock_conn.fetchrow.call_count == 1
+            call_args = mock_conn.fetchrow.call_args
+            assert "UPDATE sessions" in call_args[0][0]
+            assert "INSERT" not in call_args[0][0]
+            
+            # Unknown ids are not created
+            assert await touch_session("session-999") is None
+            
+            # A cached session past its expiry is not served
+            db_utils._session_cache["session-123"] = (now - timedelta(seconds=1), session)
+            assert await touch_session("session-123") is None
+            assert mock_conn.fetchrow.call_count == 2
+        db_utils._session_cache.clear()
     
     @pytest.mark.asyncio
     async def test_get_session_exists(self):
         """Test getting existing session."""
+        db_utils._session_cache.clear()
         with patch('agent.db_utils.db_pool') as mock_pool:
             mock_conn = AsyncMock()
             mock_result = {
                 "id": "session-123",
                 "user_id": "user-123",
-                "metadata": '{"client": "web"}',
+                "metadata": {"client": "web"},
                 "created_at": datetime.now(timezone.utc),
                 "updated_at": datetime.now(timezone.utc),
                 "expires_at": datetime.now(timezone.utc) + timedelta(hours=1)
@@ -147,6 +217,35 @@ class TestSessionManagement:
             assert session["user_id"] == "user-123"
             assert session["metadata"] == {"client": "web"}
     
+    @pytest.mark.asyncio
+    async def test_get_session_cached_until_update(self):
+        """Test repeated reads hit the cache, which expiry and updates bypass."""
+        db_utils._session_cache.clear()
+        now = datetime.now(timezone.utc)
+        row = {
+            "id": "session-456", "user_id": "user-123", "metadata": {},
+            "created_at": now, "updated_at": now, "expires_at": now + timedelta(hours=1)
+        }
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_conn.fetchrow.return_value = row
+            mock_conn.execute.return_value = "UPDATE 1"
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            first = await get_session("session-456")
+            assert await get_session("session-456") == first
+            assert mock_conn.fetchrow.call_count == 1
+
+            await update_session("session-456", {"k": "v"})
+            await get_session("session-456")
+            assert mock_conn.fetchrow.call_count == 2
+
+            # An entry past its expiry is not served
+            db_utils._session_cache["session-456"] = (now - timedelta(seconds=1), first)
+            assert await get_session("session-456") is None
+        db_utils._session_cache.clear()
+
     @pytest.mark.asyncio
     async def test_get_session_not_found(self):
         """Test getting non-existent session."""
@@ -183,7 +282,6 @@ class TestMessageManagement:
         """Test adding message."""
         with patch('agent.db_utils.db_pool') as mock_pool:
             mock_conn = AsyncMock()
-            mock_conn.fetchrow.return_value = {"id": "message-123"}
             mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
             mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
             
@@ -194,14 +292,86 @@ class TestMessageManagement:
                 metadata={"client": "web"}
             )
             
-            assert message_id == "message-123"
-            mock_conn.fetchrow.assert_called_once()
+            mock_conn.fetch.assert_called_once()
             
             # Check the SQL call
-            call_args = mock_conn.fetchrow.call_args
-            assert "INSERT INTO messages" in call_args[0][0]
-            assert call_args[0][2] == "user"  # role
-            assert call_args[0][3] == "Hello"  # content
+            assert "INSERT INTO messages" in mock_conn.fetch.call_args[0][0]
+            call_args = mock_conn.fetch.call_args[0][1:]
+            assert [str(i) for i in call_args[0]] == [message_id]
+            assert call_args[1] == ["session-123"]
+            assert call_args[2] == ["user"]  # role
+            assert call_args[3] == ["Hello"]  # content
+            assert call_args[4] == [{"client": "web"}]
+    
+    @pytest.mark.asyncio
+    async def test_add_messages_bulk(self):
+        """Test adding several messages with one statement."""
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+            
+            message_ids = await add_messages_bulk(
+                "session-123",
+                [
+                    {"role": "user", "content": "Hello"},
+                    {"role": "assistant", "content": "Hi!", "metadata": {"tool_calls": 0}}
+                ]
+            )
+            
+            assert len(message_ids) == 2
+            assert "INSERT INTO messages" in mock_conn.fetch.call_args[0][0]
+            mock_conn.fetch.assert_called_once()
+            call_args = mock_conn.fetch.call_args[0][1:]
+            assert [str(i) for i in call_args[0]] == message_ids
+            assert call_args[1] == ["session-123", "session-123"]
+            assert call_args[2] == ["user", "assistant"]
+            assert call_args[3] == ["Hello", "Hi!"]
+            assert call_args[4][1] == {"tool_calls": 0}
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_writes_share_one_insert(self):
+        """Test writes from concurrent sessions are coalesced, and a failing batch is retried per session."""
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+            
+            db_utils.message_write_scheduler.start()
+            try:
+                ids = await asyncio.gather(
+                    add_message("session-1", "user", "a"),
+                    add_messages_bulk("session-2", [
+                        {"role": "user", "content": "b"},
+                        {"role": "assistant", "content": "c"}
+                    ])
+                )
+                mock_conn.fetch.assert_called_once()
+                call_args = mock_conn.fetch.call_args[0][1:]
+                assert call_args[1] == ["session-1", "session-2", "session-2"]
+                assert [str(i) for i in call_args[0]] == [ids[0], *ids[1]]
+                
+                # A foreign key failure only fails the offending session
+                async def fetch(query, message_ids, session_ids, *args):
+                    if "missing" in session_ids:
+                        raise ValueError("no such session")
+                mock_conn.fetch.side_effect = fetch
+                ok, failed = await asyncio.gather(
+                    add_message("session-1", "user", "a"),
+                    add_message("missing", "user", "b"),
+                    return_exceptions=True
+                )
+                assert isinstance(ok, str)
+                assert isinstance(failed, ValueError)
+            finally:
+                await db_utils.message_write_scheduler.stop()
+    
+    @pytest.mark.asyncio
+    async def test_add_messages_bulk_empty(self):
+        """Test adding no messages skips the database."""
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            assert await add_messages_bulk("session-123", []) == []
+            mock_pool.acquire.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_get_session_messages(self):
@@ -234,6 +404,39 @@ class TestMessageManagement:
             assert messages[0]["role"] == "user"
             assert messages[1]["role"] == "assistant"
             mock_conn.fetch.assert_called_once()
+            assert mock_conn.fetch.call_args[0][1:] == ("session-123", 10)
+            
+            # The limit is a parameter, so unlimited reads reuse the statement
+            await get_session_messages("session-123")
+            assert mock_conn.fetch.call_args[0][1:] == ("session-123", None)
+            assert len({call[0][0] for call in mock_conn.fetch.call_args_list}) == 1
+    
+    @pytest.mark.asyncio
+    async def test_get_many_session_messages(self):
+        """Test loading several sessions' messages with one query."""
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_conn.fetch.return_value = [
+                {"ord": 1, "role": "user", "content": "Hello"},
+                {"ord": 3, "role": "user", "content": "Bye"},
+                {"ord": 3, "role": "assistant", "content": "Goodbye"}
+            ]
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            grouped = await get_many_session_messages(["s1", "s2", "s3"], limit_each=5)
+
+            assert grouped == [
+                [{"role": "user", "content": "Hello"}],
+                [],
+                [
+                    {"role": "user", "content": "Bye"},
+                    {"role": "assistant", "content": "Goodbye"}
+                ]
+            ]
+            assert "LATERAL" in mock_conn.fetch.call_args[0][0]
+            mock_conn.fetch.assert_called_once()
+            assert mock_conn.fetch.call_args[0][1:] == (["s1", "s2", "s3"], 5)
 
 
 class TestDocumentManagement:
@@ -245,26 +448,59 @@ class TestDocumentManagement:
         with patch('agent.db_utils.db_pool') as mock_pool:
             mock_conn = AsyncMock()
             mock_result = {
-                "id": "doc-123",
+                "id": str(uuid4()),
                 "title": "Test Document",
                 "source": "test.md",
                 "content": "Test content",
-                "metadata": '{"author": "test"}',
+                "metadata": {"author": "test"},
                 "created_at": datetime.now(timezone.utc),
                 "updated_at": datetime.now(timezone.utc)
             }
-            mock_conn.fetchrow.return_value = mock_result
+            mock_conn.fetch.return_value = [mock_result]
             mock_context_manager = AsyncMock()
             mock_context_manager.__aenter__ = AsyncMock(return_value=mock_conn)
             mock_context_manager.__aexit__ = AsyncMock(return_value=None)
             mock_pool.acquire.return_value = mock_context_manager
             
-            document = await get_document("doc-123")
+            document = await get_document(mock_result["id"])
             
             assert document is not None
-            assert document["id"] == "doc-123"
+            assert document["id"] == mock_result["id"]
             assert document["title"] == "Test Document"
             assert document["metadata"] == {"author": "test"}
+            
+            with pytest.raises(ValueError):
+                await get_document("doc-123")
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_document_reads_share_one_query(self):
+        """Test concurrent reads are coalesced and each caller gets its own document."""
+        found = str(uuid4())
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_conn.fetch.return_value = [{
+                "id": found, "title": "Found", "source": "a.md", "content": "",
+                "metadata": {}, "created_at": None, "updated_at": None
+            }]
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+            
+            db_utils.document_read_scheduler.start()
+            try:
+                first, missing, again = await asyncio.gather(
+                    get_document(found), get_document(str(uuid4())), get_document(found.upper())
+                )
+            finally:
+                await db_utils.document_read_scheduler.stop()
+            
+            mock_conn.fetch.assert_called_once()
+            assert len(mock_conn.fetch.call_args[0][1]) == 2
+            assert first["title"] == again["title"] == "Found"
+            assert missing is None
+            
+            first["chunks"] = []
+            first["metadata"]["seen"] = True
+            assert "chunks" not in again and again["metadata"] == {}
     
     @pytest.mark.asyncio
     async def test_list_documents(self):
@@ -300,6 +536,17 @@ class TestDocumentManagement:
             assert len(documents) == 2
             assert documents[0]["title"] == "Document 1"
             assert documents[1]["title"] == "Document 2"
+            
+            assert mock_conn.fetch.call_args[0][1:] == (10, 0)
+            
+            # A cursor becomes a keyset condition placed before LIMIT/OFFSET
+            cursor = (mock_results[1]["created_at"], "doc-2")
+            await list_documents(limit=10, metadata_filter={"k": "v"}, after=cursor)
+            query = mock_conn.fetch.call_args[0][0]
+            assert "d.metadata @> $1::jsonb" in query
+            assert "(d.created_at, d.id) < ($2::timestamptz, $3::uuid)" in query
+            assert "LIMIT $4 OFFSET $5" in query
+            assert mock_conn.fetch.call_args[0][1:] == ({"k": "v"}, *cursor, 10, 0)
 
 
 class TestVectorSearch:
@@ -334,8 +581,8 @@ class TestVectorSearch:
             
             # Check that match_chunks function was called
             mock_conn.fetch.assert_called_once()
-            call_args = mock_conn.fetch.call_args
-            assert "match_chunks" in call_args[0][0]
+            assert "match_chunks" in mock_conn.fetch.call_args[0][0]
+            assert mock_conn.fetch.call_args[0][2] == 5
     
     @pytest.mark.asyncio
     async def test_hybrid_search(self):
@@ -372,6 +619,34 @@ class TestVectorSearch:
             assert results[0]["vector_similarity"] == 0.85
             assert results[0]["text_similarity"] == 0.70
     
+    @pytest.mark.asyncio
+    async def test_vector_search_batch(self):
+        """Test batched vector search groups rows per query."""
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            row = {
+                "chunk_id": "chunk-1",
+                "document_id": "doc-1",
+                "content": "Test content",
+                "similarity": 0.9,
+                "metadata": '{}',
+                "document_title": "Test Doc",
+                "document_source": "test.md"
+            }
+            mock_conn.fetch.return_value = [
+                {**row, "ord": 1},
+                {**row, "ord": 3, "chunk_id": "chunk-3"}
+            ]
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+            
+            results = await vector_search_batch([[0.1] * 4] * 3, [5, 5, 5])
+            
+            assert [len(r) for r in results] == [1, 0, 1]
+            assert results[2][0]["chunk_id"] == "chunk-3"
+            mock_conn.fetch.assert_called_once()
+            assert "match_chunks" in mock_conn.fetch.call_args[0][0]
+    
     @pytest.mark.asyncio
     async def test_get_document_chunks(self):
         """Test getting document chunks."""
@@ -401,10 +676,345 @@ class TestVectorSearch:
             assert chunks[0]["chunk_index"] == 0
             assert chunks[1]["chunk_index"] == 1
 
+    @pytest.mark.asyncio
+    async def test_insert_chunks_uses_copy(self):
+        """Test chunks are staged with one COPY and moved in one statement."""
+        mock_conn = Mock()
+        mock_conn.execute = AsyncMock()
+        mock_conn.copy_records_to_table = AsyncMock()
+        mock_conn.transaction.return_value.__aenter__ = AsyncMock(return_value=None)
+        mock_conn.transaction.return_value.__aexit__ = AsyncMock(return_value=None)
+        chunks = [
+            Mock(content="First", index=0, metadata={"a": 1}, token_count=2, embedding=[0.5, 1.0]),
+            Mock(content="Second", index=1, metadata={}, token_count=1, embedding=None)
+        ]
+
+        with patch('agent.db_utils.CHUNK_COPY_MIN_ROWS', 2):
+            count = await insert_chunks(mock_conn, "doc-123", chunks)
+
+        assert count == 2
+        mock_conn.copy_records_to_table.assert_called_once()
+        records = list(mock_conn.copy_records_to_table.call_args.kwargs["records"])
+        assert records[0] == ("First", encode_vector([0.5, 1.0]), 0, {"a": 1}, 2)
+        assert records[1][1] is None
+        insert_sql, document_id = mock_conn.execute.call_args[0]
+        assert "INSERT INTO chunks" in insert_sql
+        assert document_id == "doc-123"
+
+    @pytest.mark.asyncio
+    async def test_insert_chunks_small_batch_uses_unnest(self):
+        """Test small documents are inserted with a single unnest statement."""
+        mock_conn = AsyncMock()
+        chunks = [
+            Mock(content="First", index=0, metadata={"a": 1}, token_count=2, embedding=[0.5, 1.0]),
+            Mock(content="Second", index=1, metadata={}, token_count=1, embedding=None)
+        ]
+
+        count = await insert_chunks(mock_conn, "doc-123", chunks)
+
+        assert count == 2
+        mock_conn.copy_records_to_table.assert_not_called()
+        mock_conn.execute.assert_not_called()
+        assert "unnest(" in mock_conn.fetch.call_args[0][0]
+        mock_conn.fetch.assert_called_once()
+        document_id, contents, embeddings, indexes, metadatas, tokens = mock_conn.fetch.call_args[0][1:]
+        assert document_id == "doc-123"
+        assert contents == ["First", "Second"]
+        assert embeddings == [encode_vector([0.5, 1.0]), None]
+        assert indexes == [0, 1]
+        assert metadatas == [{"a": 1}, {}]
+        assert tokens == [2, 1]
+
+    @pytest.mark.asyncio
+    async def test_get_chunk_embeddings(self):
+        """Test stored embeddings are keyed by content hash, skipping zero vectors."""
+        assert await get_chunk_embeddings("doc-123", []) == {}
+
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_conn.fetch.return_value = [
+                {"hash": "h1", "embedding": np.array([0.5, 1.0], dtype=np.float32),
+                 "embedding_model": "model-a", "embedding_generated_at": "2026-01-01T00:00:00"},
+                {"hash": "h2", "embedding": np.zeros(2, dtype=np.float32),
+                 "embedding_model": "model-a", "embedding_generated_at": None},
+                {"hash": "h3", "embedding": np.array([], dtype=np.float32),
+                 "embedding_model": None, "embedding_generated_at": None}
+            ]
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            stored = await get_chunk_embeddings("doc-123", ["h1", "h2", "h3"])
+
+        assert list(stored) == ["h1"]
+        assert stored["h1"][1] == {"embedding_model": "model-a", "embedding_generated_at": "2026-01-01T00:00:00"}
+        assert mock_conn.fetch.call_args[0][1:] == ("doc-123", ["h1", "h2", "h3"])
+        assert chunk_content_hash("ä") == "8419b71c87a225a2c70b50486fbee545"
+
+    @pytest.mark.asyncio
+    async def test_replace_chunks(self):
+        """Test chunks are upserted in place and only stale rows are deleted."""
+        mock_conn = AsyncMock()
+        chunks = [
+            Mock(content="First", index=0, metadata={}, token_count=1, embedding=None),
+            Mock(content="Second", index=1, metadata={}, token_count=1, embedding=None)
+        ]
+
+        count = await replace_chunks(mock_conn, "doc-123", chunks)
+
+        assert count == 2
+        upsert_sql, delete_sql = [c[0][0] for c in mock_conn.fetch.call_args_list]
+        assert "ON CONFLICT (document_id, chunk_index) DO UPDATE" in upsert_sql
+        assert delete_sql.startswith("DELETE FROM chunks")
+        assert mock_conn.fetch.call_args_list[1][0][1:] == ("doc-123", [0, 1])
+
+    @pytest.mark.asyncio
+    async def test_insert_document_tags(self):
+        """Test both tag sets are inserted in one deduplicated statement."""
+        mock_conn = AsyncMock()
+
+        await insert_document_tags(mock_conn, "doc-123", ["e1", "e2", "e1"], ["k1"])
+
+        mock_conn.execute.assert_called_once()
+        sql, document_id, equipment_ids, keyword_ids = mock_conn.execute.call_args[0]
+        assert "unnest($2::uuid[])" in sql and "unnest($3::uuid[])" in sql
+        assert document_id == "doc-123"
+        assert equipment_ids == ["e1", "e2"]
+        assert keyword_ids == ["k1"]
+
+        mock_conn.execute.reset_mock()
+        await insert_document_tags(mock_conn, "doc-123", None, [])
+        mock_conn.execute.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_insert_chunks_empty(self):
+        """Test inserting no chunks skips the database."""
+        mock_conn = Mock()
+        assert await insert_chunks(mock_conn, "doc-123", []) == 0
+        mock_conn.transaction.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_insert_chunks_parallel_partitions(self):
+        """Test large documents are split into contiguous per-connection partitions."""
+        with patch('agent.db_utils.db_pool') as mock_pool, \
+             patch('agent.db_utils.CHUNK_COPY_MIN_ROWS', 2), \
+             patch('agent.db_utils.CHUNK_LOAD_WORKERS', 3), \
+             patch('agent.db_utils.insert_chunks', new_callable=AsyncMock) as mock_insert:
+            mock_conn = Mock()
+            mock_conn.transaction.return_value.__aenter__ = AsyncMock()
+            mock_conn.transaction.return_value.__aexit__ = AsyncMock(return_value=None)
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+            mock_insert.side_effect = lambda conn, doc_id, part: len(part)
+
+            inserted = await insert_chunks_parallel("doc-123", list(range(7)))
+
+            assert inserted == 7
+            parts = [call.args[2] for call in mock_insert.call_args_list]
+            assert parts == [[0, 1, 2], [3, 4, 5], [6]]
+            assert mock_pool.acquire.call_count == 3
+
+
+class TestVectorIndexDeferral:
+    """Test dropping the vector index during bulk loads."""
+
+    @pytest.mark.asyncio
+    async def test_overlapping_loads_drop_and_rebuild_once(self):
+        """Test overlapping bulk loads share one drop and one concurrent rebuild."""
+        indexdef = "CREATE INDEX idx_chunks_embedding ON public.chunks USING ivfflat (embedding vector_cosine_ops)"
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            # pg_indexes lookup, index and bulk lock probes, recorded definition,
+            # validity before and after the build
+            mock_conn.fetchval.side_effect = [indexdef, True, True, indexdef, None, True]
+            mock_conn.transaction = Mock()
+            mock_conn.transaction.return_value.__aenter__ = AsyncMock(return_value=None)
+            mock_conn.transaction.return_value.__aexit__ = AsyncMock(return_value=None)
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            async with deferred_vector_index():
+                async with deferred_vector_index():
+                    pass
+            await db_utils._vector_index_task
+
+            statements = [" ".join(call.args[0].split()) for call in mock_conn.execute.call_args_list]
+            assert statements == [
+                "SELECT pg_advisory_lock_shared(hashtext($1))",
+                "SELECT pg_advisory_xact_lock(hashtext($1))",
+                "INSERT INTO deferred_indexes (indexname, indexdef) VALUES ($1, $2) ON CONFLICT (indexname) DO NOTHING",
+                'DROP INDEX IF EXISTS "idx_chunks_embedding"',
+                "SELECT pg_advisory_lock_shared(hashtext($1))",
+                "SELECT pg_advisory_unlock_shared(hashtext($1))",
+                "SELECT pg_advisory_unlock_shared(hashtext($1))",
+                "SELECT pg_advisory_unlock(hashtext($1))",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chunks_embedding "
+                "ON public.chunks USING ivfflat (embedding vector_cosine_ops)",
+                "DELETE FROM deferred_indexes WHERE indexname = $1",
+                "SELECT pg_advisory_unlock(hashtext($1))",
+            ]
+
+    @pytest.mark.asyncio
+    async def test_rebuild_drops_invalid_index_and_retries(self):
+        """Test an INVALID leftover is dropped first and a failed build is retried."""
+        indexdef = "CREATE INDEX idx_chunks_embedding ON public.chunks USING ivfflat (embedding vector_cosine_ops)"
+        with patch('agent.db_utils.db_pool') as mock_pool, \
+             patch('agent.db_utils.VECTOR_INDEX_REBUILD_RETRY_DELAY', 0):
+            mock_conn = AsyncMock()
+            # First attempt: build fails; second attempt: INVALID leftover, then valid
+            mock_conn.fetchval.side_effect = [True, True, indexdef, None, True, True, indexdef, False, True]
+            mock_conn.execute.side_effect = [None, Exception("deadlock detected"), None, None, None, None, None, None]
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            await db_utils._rebuild_vector_index()
+
+            statements = [
+                call.args[0] for call in mock_conn.execute.call_args_list
+                if "advisory" not in call.args[0]
+            ]
+            assert statements[0].startswith("CREATE INDEX CONCURRENTLY")
+            assert statements[1] == 'DROP INDEX CONCURRENTLY IF EXISTS "idx_chunks_embedding"'
+            assert statements[2].startswith("CREATE INDEX CONCURRENTLY")
+            assert statements[3] == "DELETE FROM deferred_indexes WHERE indexname = $1"
+            # The index lock is released after the failed attempt too
+            unlocks = [
+                call for call in mock_conn.execute.call_args_list
+                if call.args[0] == "SELECT pg_advisory_unlock(hashtext($1))"
+                and call.args[1] == "idx_chunks_embedding"
+            ]
+            assert len(unlocks) == 2
+    
+    @pytest.mark.asyncio
+    async def test_rebuild_waits_for_bulk_loads_elsewhere(self):
+        """Test no rebuild runs while another process holds the index or bulk lock."""
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            # Another process is rebuilding or dropping the index
+            mock_conn.fetchval.side_effect = [False]
+            await db_utils._build_deferred_vector_index()
+            mock_conn.execute.assert_not_called()
+
+            # Another process is inside a bulk load
+            mock_conn.fetchval.side_effect = [True, False]
+            await db_utils._build_deferred_vector_index()
+            statements = [call.args[0] for call in mock_conn.execute.call_args_list]
+            assert statements == ["SELECT pg_advisory_unlock(hashtext($1))"]
+
+
+class TestAccountManagement:
+    """Test account lookup caching."""
+
+    @pytest.mark.asyncio
+    async def test_account_lookup_cached_across_logins(self):
+        """Test repeated lookups hit the cache and show logins before they are written."""
+        _account_cache.clear()
+        now = datetime.now(timezone.utc)
+        row = {
+            "id": "acc-1", "username": "alice", "password_hash": "x",
+            "full_name": "Alice", "department": None, "domain": None,
+            "title": None, "role": "user", "is_active": True,
+            "last_login_at": None, "created_at": now, "updated_at": now,
+            "metadata": "{}"
+        }
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_conn.fetchrow.return_value = row
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            first = await get_account_by_username("alice")
+            second = await get_account_by_username("alice")
+            assert first == second
+            assert first["id"] == "acc-1"
+            assert mock_conn.fetchrow.call_count == 1
+
+            # A login keeps the cached entry; lookups overlay the login
+            # before the batched UPDATE has written it
+            await touch_last_login("acc-1")
+            await touch_last_login("acc-1")
+            cached = await get_account_by_username("alice")
+            assert mock_conn.fetchrow.call_count == 1
+            assert cached["last_login_at"] == db_utils._last_login_pending["acc-1"].isoformat()
+            mock_conn.execute.assert_not_called()
+
+            await db_utils.stop_db_schedulers()
+            mock_conn.execute.assert_called_once()
+            assert mock_conn.execute.call_args[0][1] == ["acc-1"]
+            assert not db_utils._last_login_pending
+            assert "alice" not in _account_cache
+        _account_cache.clear()
+
+    @pytest.mark.asyncio
+    async def test_failed_last_login_flush_keeps_entries(self):
+        """Test a failed UPDATE leaves the logins pending for the next flush."""
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            mock_conn = AsyncMock()
+            mock_conn.execute.side_effect = [Exception("connection lost"), None]
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            await touch_last_login("acc-1")
+            await db_utils.flush_last_logins()
+            assert "acc-1" in db_utils._last_login_pending
+
+            await db_utils.stop_db_schedulers()
+            assert mock_conn.execute.call_count == 2
+            assert not db_utils._last_login_pending
+
+    def test_verify_password_sha256_and_plaintext(self):
+        """Test sha256 hex hashes are detected and dev plaintext still works."""
+        digest = db_utils._sha256("admin")
+        assert db_utils.verify_password("admin", digest)
+        assert not db_utils.verify_password("nimda", digest)
+        assert db_utils.verify_password("admin", "admin")
+        assert not db_utils.verify_password("admin", "")
+
 
 class TestUtilityFunctions:
     """Test utility functions."""
     
+    @pytest.mark.asyncio
+    async def test_execute_query_row_types(self):
+        """Test rows are copied into dicts unless records are requested."""
+        with patch('agent.db_utils.db_pool') as mock_pool:
+            records = [Mock(), Mock()]
+            for record in records:
+                record.keys.return_value = ["a"]
+                record.__getitem__ = Mock(return_value=1)
+            mock_conn = AsyncMock()
+            mock_conn.fetch.return_value = records
+            mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+            mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+            
+            assert await db_utils.execute_query("SELECT 1 AS a") == [{"a": 1}, {"a": 1}]
+            assert await db_utils.execute_query("SELECT 1 AS a", as_dict=False) is records
+    
+    def test_vector_codec_round_trip(self):
+        """Test pgvector binary encoding and decoding."""
+        payload = encode_vector([0.5, 1.0, 2.0])
+        assert payload[:4] == b"\x00\x03\x00\x00"
+        assert decode_vector(payload).tolist() == [0.5, 1.0, 2.0]
+        assert encode_vector("[0.5,1.0,2.0]") == payload
+        assert encode_vector(payload) == payload
+
+    def test_jsonb_codec_round_trip(self):
+        """Test binary jsonb encoding accepts objects and JSON text."""
+        payload = encode_jsonb({"a": 1})
+        assert payload == b'\x01{"a":1}'
+        assert encode_jsonb('{"a":1}') == payload
+        assert encode_jsonb(b'{"a":1}') == payload
+        assert decode_jsonb(payload) == {"a": 1}
+
+    def test_pack_vectors(self):
+        """Test bulk vector packing keeps order and missing embeddings."""
+        packed = pack_vectors([[0.5, 1.0], None, [], [2.0, 3.0]])
+        assert packed[0] == encode_vector([0.5, 1.0])
+        assert packed[1] is None and packed[2] is None
+        assert packed[3] == encode_vector([2.0, 3.0])
+    
     @pytest.mark.asyncio
     async def test_test_connection_success(self):
         """Test successful connection test."""
@@ -55,6 +55,7 @@ class TestRequestModels:
         assert request.session_id is None
         assert request.user_id is None
         assert request.search_type == SearchType.HYBRID
+        assert type(request.search_type) is str
         assert request.metadata == {}
     
     def test_search_request_valid(self):
@@ -0,0 +1,61 @@
+"""
+Tests for embedding generation.
+"""
+
+import asyncio
+import pytest
+
+from ingestion.chunker import DocumentChunk
+from ingestion.embedder import EmbeddingGenerator
+
+
+def _chunks(count):
+    return [
+        DocumentChunk(content=f"text {i}", index=i, start_char=0, end_char=1, metadata={})
+        for i in range(count)
+    ]
+
+
+class TestEmbedChunks:
+    """Test chunk embedding."""
+
+    @pytest.mark.asyncio
+    async def test_batches_run_concurrently_in_order(self):
+        """Test batches overlap up to max_concurrency and results keep chunk order."""
+        embedder = EmbeddingGenerator(batch_size=2, max_concurrency=2)
+        in_flight = 0
+        peak = 0
+
+        async def generate(texts):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return [[float(text.split()[-1])] for text in texts]
+
+        embedder.generate_embeddings_batch = generate
+        progress = []
+
+        embedded = await embedder.embed_chunks(_chunks(7), lambda done, total: progress.append((done, total)))
+
+        assert [chunk.embedding for chunk in embedded] == [[float(i)] for i in range(7)]
+        assert peak == 2
+        assert progress[-1] == (4, 4)
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_gets_zero_vectors(self):
+        """Test a failing batch falls back to zero vectors without failing the rest."""
+        embedder = EmbeddingGenerator(batch_size=2)
+
+        async def generate(texts):
+            if texts[0] == "text 2":
+                raise RuntimeError("provider down")
+            return [[1.0] for _ in texts]
+
+        embedder.generate_embeddings_batch = generate
+
+        embedded = await embedder.embed_chunks(_chunks(4))
+
+        assert [chunk.embedding[0] for chunk in embedded] == [1.0, 1.0, 0.0, 0.0]
+        assert embedded[2].metadata["embedding_error"] == "provider down"
@@ -0,0 +1,192 @@
+"""
+Tests for the file ingestion helpers.
+"""
+
+import asyncio
+
+import pytest
+from datetime import date
+from unittest.mock import Mock, AsyncMock, patch
+
+from ingestion.chunker import DocumentChunk
+from ingestion.ingest import (
+    DocumentIngestionPipeline,
+    ingest_files,
+    _build_graph_bg,
+    parse_iso_date,
+)
+
+
+def _make_pipeline():
+    """Build a pipeline double whose chunk count is the file name's last digit."""
+    pipeline = Mock()
+    pipeline.documents_folder = "/docs"
+    pipeline.config = Mock(extract_entities=False, skip_graph_building=True)
+    pipeline._read_document = Mock(side_effect=lambda path: (f"text of {path}", {}))
+    pipeline._extract_title = Mock(side_effect=lambda content, path: path)
+    pipeline._extract_document_metadata = Mock(return_value={})
+
+    async def chunk_document(content, title, source, metadata):
+        return [
+            DocumentChunk(content=f"{title}-{i}", index=i, start_char=0, end_char=1, metadata={})
+            for i in range(int(title[-1]))
+        ]
+
+    async def embed_chunks(chunks):
+        return chunks
+
+    async def save_to_postgres(title, source, content, chunks, metadata, extra_fields):
+        return f"doc:{title}"
+
+    pipeline.chunker.chunk_document = chunk_document
+    pipeline.embedder.embed_chunks = AsyncMock(side_effect=embed_chunks)
+    pipeline._save_to_postgres = AsyncMock(side_effect=save_to_postgres)
+    return pipeline
+
+
+class TestIngestFiles:
+    """Test multi-file ingestion."""
+
+    @pytest.mark.asyncio
+    async def test_embeds_all_files_in_one_call(self):
+        """Test chunks of every file are embedded together and split back per file."""
+        pipeline = _make_pipeline()
+
+        results = await ingest_files(["/docs/a2", "/docs/b3", "/docs/c1"], pipeline=pipeline)
+
+        pipeline.embedder.embed_chunks.assert_called_once()
+        assert len(pipeline.embedder.embed_chunks.call_args[0][0]) == 6
+        assert [r.document_id for r in results] == ["doc:/docs/a2", "doc:/docs/b3", "doc:/docs/c1"]
+        assert [r.chunks_created for r in results] == [2, 3, 1]
+
+        stored = {
+            call.kwargs["title"]: [chunk.content for chunk in call.kwargs["chunks"]]
+            for call in pipeline._save_to_postgres.call_args_list
+        }
+        assert stored["/docs/b3"] == ["/docs/b3-0", "/docs/b3-1", "/docs/b3-2"]
+        pipeline.close.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_failure_is_raised(self):
+        """Test a failing file surfaces its error."""
+        pipeline = _make_pipeline()
+        pipeline._read_document = Mock(side_effect=ValueError("unreadable"))
+
+        with pytest.raises(ValueError, match="unreadable"):
+            await ingest_files(["/docs/a1"], pipeline=pipeline)
+
+        pipeline.embedder.embed_chunks.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_background_graph_build(self):
+        """Test the graph build is scheduled instead of awaited."""
+        pipeline = _make_pipeline()
+        pipeline.config.skip_graph_building = False
+        pipeline.graph_builder.add_document_to_graph = AsyncMock()
+
+        with patch("ingestion.ingest.schedule_graph_build") as mock_schedule:
+            results = await ingest_files(["/docs/a2", "/docs/b1"], pipeline=pipeline, background_graph=True)
+
+        pipeline.graph_builder.add_document_to_graph.assert_not_called()
+        assert [r.relationships_created for r in results] == [None, None]
+        scheduled = mock_schedule.call_args[0][0]
+        assert [(doc_id, len(chunks)) for doc_id, _, chunks in scheduled] == [
+            ("doc:/docs/a2", 2),
+            ("doc:/docs/b1", 1),
+        ]
+
+
+    @pytest.mark.asyncio
+    async def test_background_graph_build_after_partial_failure(self):
+        """Test stored documents get their graph build even when another file fails."""
+        pipeline = _make_pipeline()
+        pipeline.config.skip_graph_building = False
+
+        async def save_to_postgres(title, source, content, chunks, metadata, extra_fields):
+            if title == "/docs/b1":
+                raise RuntimeError("insert failed")
+            return f"doc:{title}"
+
+        pipeline._save_to_postgres = AsyncMock(side_effect=save_to_postgres)
+
+        with patch("ingestion.ingest.schedule_graph_build") as mock_schedule:
+            with pytest.raises(RuntimeError, match="insert failed"):
+                await ingest_files(["/docs/a2", "/docs/b1"], pipeline=pipeline, background_graph=True)
+
+        scheduled = mock_schedule.call_args[0][0]
+        assert [doc_id for doc_id, _, _ in scheduled] == ["doc:/docs/a2"]
+
+
+class TestSaveToPostgres:
+    """Test storing a document whose chunks load over several connections."""
+
+    @staticmethod
+    def _mock_pool(mock_pool):
+        mock_conn = AsyncMock()
+        mock_conn.fetchrow.return_value = {"id": "doc-1"}
+        mock_conn.transaction = Mock()
+        mock_conn.transaction.return_value.__aenter__ = AsyncMock(return_value=None)
+        mock_conn.transaction.return_value.__aexit__ = AsyncMock(return_value=None)
+        mock_pool.acquire.return_value.__aenter__ = AsyncMock(return_value=mock_conn)
+        mock_pool.acquire.return_value.__aexit__ = AsyncMock(return_value=None)
+        return mock_conn
+
+    @staticmethod
+    async def _save(load_error=None):
+        with patch("ingestion.ingest.chunk_load_partitions", return_value=2), \
+             patch("ingestion.ingest.insert_chunks_parallel", AsyncMock(side_effect=load_error)), \
+             patch("ingestion.ingest.insert_document_tags", AsyncMock()):
+            return await DocumentIngestionPipeline._save_to_postgres(Mock(), "t", "s", "c", [], {})
+
+    @pytest.mark.asyncio
+    async def test_document_hidden_until_chunks_load(self):
+        """Test the document is inserted as loading and shown once chunks are in."""
+        with patch("ingestion.ingest.db_pool") as mock_pool:
+            mock_conn = self._mock_pool(mock_pool)
+            assert await self._save() == "doc-1"
+
+        assert mock_conn.fetchrow.call_args.args[-1] == "loading"
+        statements = [call.args[0] for call in mock_conn.execute.call_args_list]
+        assert statements == ["UPDATE documents SET status = 'active' WHERE id = $1::uuid"]
+
+    @pytest.mark.asyncio
+    async def test_cancelled_load_deletes_document(self):
+        """Test a cancelled chunk load still removes the half-loaded document."""
+        with patch("ingestion.ingest.db_pool") as mock_pool:
+            mock_conn = self._mock_pool(mock_pool)
+            with pytest.raises(asyncio.CancelledError):
+                await self._save(load_error=asyncio.CancelledError())
+
+        statements = [call.args[0] for call in mock_conn.execute.call_args_list]
+        assert statements == ["DELETE FROM documents WHERE id = $1::uuid"]
+
+
+class TestBackgroundGraphBuild:
+    """Test the background graph build task."""
+
+    @pytest.mark.asyncio
+    async def test_failure_is_logged_and_builder_closed(self):
+        """Test one failing document neither stops the rest nor escapes the task."""
+        builder = Mock()
+        builder.initialize = AsyncMock()
+        builder.close = AsyncMock()
+        builder.add_document_to_graph = AsyncMock(
+            side_effect=[RuntimeError("graph down"), {"episodes_created": 1}]
+        )
+        doc = {"title": "t", "source": "s", "metadata": {}}
+
+        with patch("ingestion.ingest.create_graph_builder", return_value=builder):
+            await _build_graph_bg([("d1", doc, []), ("d2", doc, [])])
+
+        assert builder.add_document_to_graph.call_count == 2
+        builder.close.assert_called_once()
+
+
+def test_parse_iso_date():
+    """Test effective dates are parsed without raising on bad input."""
+    assert parse_iso_date("2024-02-29") == date(2024, 2, 29)
+    assert parse_iso_date(" 2024-01-05 ") == date(2024, 1, 5)
+    assert parse_iso_date(date(2024, 1, 5)) == date(2024, 1, 5)
+    for bad in ["2023-02-29", "2024-13-01", "0000-01-01", "05/01/2024", "", "  "]:
+        assert parse_iso_date(bad) is None
+    assert parse_iso_date(None) is None
@@ -0,0 +1,188 @@
+"""
+Tests for the OCR helpers, with Tesseract and the PDF libraries stubbed out.
+"""
+
+import pytest
+from unittest.mock import Mock, patch
+
+import ingestion.ocr as ocr
+
+
+class FakeTesseractError(Exception):
+    """Stands in for pytesseract.TesseractError."""
+
+
+class FakeTesseractNotFoundError(Exception):
+    """Stands in for pytesseract.TesseractNotFoundError."""
+
+
+@pytest.fixture
+def tesseract():
+    """Stub pytesseract and reset the process-wide missing-language set."""
+    stub = Mock()
+    with patch.multiple(
+        ocr,
+        pytesseract=stub,
+        TesseractError=FakeTesseractError,
+        TesseractNotFoundError=FakeTesseractNotFoundError,
+        _missing_languages=set(),
+    ):
+        yield stub
+
+
+def _page_image(page_number):
+    """Build a rendered-page double that is already grayscale."""
+    image = Mock(mode="L")
+    image.page_number = page_number
+    return image
+
+
+class TestPdfPageOcr:
+    """Test page-by-page PDF OCR."""
+    
+    def test_pages_are_rendered_and_recognized_one_at_a_time(self, tesseract, tmp_path):
+        """Test each page is rendered on its own and the text keeps page order."""
+        pdf = tmp_path / "scan.pdf"
+        pdf.write_bytes(b"%PDF-1.4")
+        rendered = []
+        
+        def convert(path, dpi, first_page, last_page):
+            assert first_page == last_page
+            image = _page_image(first_page)
+            rendered.append(image)
+            return [image]
+        
+        tesseract.image_to_string.side_effect = lambda image, lang: f" page {image.page_number} "
+        with patch.multiple(
+            ocr,
+            pdfium=None,
+            PdfReader=None,
+            convert_from_path=convert,
+            pdfinfo_from_path=Mock(return_value={"Pages": 3}),
+        ):
+            result = ocr._extract_from_pdf(pdf, "eng")
+        
+        assert result.text == "page 1\n\npage 2\n\npage 3"
+        assert result.metadata["page_count"] == 3
+        assert result.metadata["languages"] == ["eng"]
+        assert sorted(image.page_number for image in rendered) == [1, 2, 3]
+        assert all(image.close.called for image in rendered)
+    
+    def test_blank_render_yields_empty_page(self, tesseract, tmp_path):
+        """Test a page that renders to no image is skipped without running Tesseract."""
+        with patch.object(ocr, "convert_from_path", Mock(return_value=[])):
+            assert ocr._ocr_pdf_page(tmp_path / "scan.pdf", 2, ["eng"]) == ("", "")
+        tesseract.image_to_string.assert_not_called()
+
+
+def _missing_model_error(lang):
+    """Build the error Tesseract raises when a language model is not installed."""
+    return FakeTesseractError(
+        f"Error opening data file /usr/share/tessdata/{lang}.traineddata\n"
+        f"Failed loading language '{lang}'"
+    )
+
+
+class TestTesseractLanguages:
+    """Test language fallback when Tesseract models are missing."""
+    
+    def test_missing_language_is_peeled_and_remembered(self, tesseract):
+        """Test a missing model is dropped from the same candidate and skipped afterwards."""
+        def image_to_string(image, lang):
+            if "vie" in lang.split("+"):
+                raise _missing_model_error("vie")
+            return " recognized "
+        
+        tesseract.image_to_string.side_effect = image_to_string
+        image = _page_image(1)
+        
+        assert ocr._run_tesseract(image, ["vie+eng", "fra"]) == ("recognized", "eng")
+        assert ocr._missing_languages == {"vie"}
+        
+        # Later pages no longer start Tesseract with the missing model
+        assert ocr._run_tesseract(image, ["vie+eng", "fra"]) == ("recognized", "eng")
+        langs = [call.kwargs["lang"] for call in tesseract.image_to_string.call_args_list]
+        assert langs == ["vie+eng", "eng", "eng"]
+    
+    def test_other_errors_fall_back_to_next_candidate(self, tesseract):
+        """Test a non-language failure moves on without marking any model missing."""
+        tesseract.image_to_string.side_effect = [FakeTesseractError("image too small"), "text"]
+        
+        assert ocr._run_tesseract(_page_image(1), ["vie+eng", "eng"]) == ("text", "eng")
+        assert ocr._missing_languages == set()
+    
+    def test_all_languages_missing(self, tesseract):
+        """Test OCR fails clearly once every candidate's models are known missing."""
+        tesseract.image_to_string.side_effect = _missing_model_error("vie")
+        
+        with pytest.raises(ocr.OCRError, match="vie.traineddata"):
+            ocr._run_tesseract(_page_image(1), ["vie"])
+        with pytest.raises(ocr.OCRError, match=r"language data missing for \['vie'\]"):
+            ocr._run_tesseract(_page_image(1), ["vie"])
+        assert tesseract.image_to_string.call_count == 1
+
+
+def _stub_pdfium(texts):
+    """Build a pypdfium2 double whose pages hold the given texts."""
+    pages = []
+    for text in texts:
+        page = Mock()
+        page.get_textpage.return_value.get_text_bounded.return_value = text
+        pages.append(page)
+    document = Mock()
+    document.__len__ = Mock(return_value=len(pages))
+    document.__getitem__ = Mock(side_effect=pages.__getitem__)
+    module = Mock()
+    module.PdfDocument.return_value = document
+    return module, document, pages
+
+
+class TestPdfTextEngines:
+    """Test direct PDF text extraction and engine selection."""
+    
+    def test_pdfium_page_texts(self, tmp_path):
+        """Test PDFium text is read per page and every handle is closed."""
+        module, document, pages = _stub_pdfium(["first", "second"])
+        with patch.object(ocr, "pdfium", module):
+            assert ocr._pdfium_page_texts(tmp_path / "a.pdf") == (["first", "second"], 2)
+        assert all(page.close.called for page in pages)
+        document.close.assert_called_once()
+    
+    def test_pdfium_is_preferred(self, tmp_path):
+        """Test PDFium text wins and pypdf is never opened."""
+        pypdf = Mock(return_value=(["from pypdf"], 1))
+        with patch.multiple(
+            ocr,
+            _pdfium_page_texts=Mock(return_value=([" from pdfium ", ""], 2)),
+            _pypdf_page_texts=pypdf,
+        ):
+            result = ocr._extract_from_pdf(tmp_path / "a.pdf", None)
+        
+        assert result.text == "from pdfium"
+        assert result.metadata == {"engine": "pdfium", "source": "pdf_text", "page_count": 2, "used_ocr": False}
+        pypdf.assert_not_called()
+    
+    def test_falls_back_to_pypdf(self, tmp_path):
+        """Test pypdf is used when PDFium is missing or fails."""
+        for pdfium_texts in (Mock(return_value=None), Mock(side_effect=RuntimeError("broken xref"))):
+            with patch.multiple(
+                ocr,
+                _pdfium_page_texts=pdfium_texts,
+                _pypdf_page_texts=Mock(return_value=(["from pypdf"], 1)),
+            ):
+                result = ocr._extract_from_pdf(tmp_path / "a.pdf", None)
+            assert result.metadata["engine"] == "pypdf"
+            assert result.text == "from pypdf"
+    
+    def test_scanned_pdf_goes_straight_to_ocr(self, tmp_path):
+        """Test an empty text layer skips the second parser and falls through to OCR."""
+        pypdf = Mock(return_value=(["unexpected"], 1))
+        with patch.multiple(
+            ocr,
+            _pdfium_page_texts=Mock(return_value=(["", "  "], 2)),
+            _pypdf_page_texts=pypdf,
+            convert_from_path=None,
+        ):
+            with pytest.raises(ocr.OCRError, match="pdf2image is required"):
+                ocr._extract_from_pdf(tmp_path / "a.pdf", None)
+        pypdf.assert_not_called()